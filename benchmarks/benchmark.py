@@ -0,0 +1,449 @@
+"""
+Benchmarks for the transports and the Client, run against the fake language server in fake_server.py.
+
+From the package root, in the environment used for the tests:
+
+    python -m benchmarks.benchmark --transports stdio tcp --sizes 100 10000 --count 1000
+"""
+import argparse
+import gc
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from typing import Any, List, Dict, Tuple, Callable, Optional
+    assert Any and List and Dict and Tuple and Callable and Optional
+except ImportError:
+    pass
+
+from plugin.core.completions import CompletionFormatter, FormattedCompletions
+from plugin.core.configurations import WindowConfigManager, get_scope_client_config
+from plugin.core.protocol import Diagnostic, Request, Notification
+from plugin.core.rpc import Client, MessageDispatcher, format_request, percentile
+from plugin.core.transports import StdioTransport, Transport, start_tcp_transport
+from plugin.core.sessions import Session
+from plugin.core.types import ClientConfig, ClientStates, LanguageConfig, Settings
+from plugin.core.windows import WindowManager
+
+assert Transport
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_server.py")
+WAIT_TIMEOUT = 300
+
+
+class Result(object):
+    def __init__(self, name: str, messages: int, size: int, seconds: float, cpu_seconds: float,
+                 latencies: 'Optional[List[float]]' = None) -> None:
+        self.name = name
+        self.messages = messages
+        self.size = size
+        self.seconds = seconds
+        self.cpu_seconds = cpu_seconds
+        self.latencies = sorted(latencies) if latencies else []
+
+    def report(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        line = "{:<34} {:>10.0f} msgs/s {:>8.2f} MB/s {:>8.1f} us cpu/msg".format(
+            self.name, self.messages / seconds, self.size / seconds / 1e6,
+            self.cpu_seconds / max(self.messages, 1) * 1e6)
+        if self.latencies:
+            line += "   latency ms p50 {:.3f} p95 {:.3f} p99 {:.3f}".format(
+                percentile(self.latencies, 0.5) * 1000, percentile(self.latencies, 0.95) * 1000,
+                percentile(self.latencies, 0.99) * 1000)
+        return line
+
+
+class Stopwatch(object):
+    """Measures wall clock time and the CPU time of this process, including all of its threads"""
+
+    def __init__(self) -> None:
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def stop(self) -> 'Tuple[float, float]':
+        return time.perf_counter() - self._wall, time.process_time() - self._cpu
+
+
+def free_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("localhost", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class FakeServer(object):
+    def __init__(self, transport: str, python: str) -> None:
+        # isolated mode runs the fake server on the standard library only, whatever the environment
+        args = [python, "-I", FAKE_SERVER]
+        if transport == "tcp":
+            port = free_port()
+            self.process = subprocess.Popen(args + ["--tcp", str(port)])
+            self.transport = start_tcp_transport(port)  # type: Transport
+        else:
+            self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.transport = StdioTransport(self.process)
+
+    def stop(self) -> None:
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def start_client(server: FakeServer) -> Client:
+    settings = Settings()
+    settings.request_timeout = 0
+    client = Client(server.transport, settings, MessageDispatcher("LSP benchmark dispatcher"))
+    client.set_error_display_handler(lambda message: None)
+    # the time the fake server takes to start is not part of what is measured
+    initialized = threading.Event()
+    client.send_request(Request.initialize(dict()), lambda result: initialized.set())
+    wait(initialized, "the server to start")
+    return client
+
+
+def wait(event: threading.Event, what: str) -> None:
+    if not event.wait(WAIT_TIMEOUT):
+        raise Exception("Timeout waiting for " + what)
+
+
+def bench_framing(transport: str, python: str, size: int, count: int, rate: float) -> Result:
+    """Notifications from the server, through the transport's reader and framer only"""
+    server = FakeServer(transport, python)
+    initialized = threading.Event()
+    done = threading.Event()
+    received = [0, 0]
+
+    def on_receive(message: bytes) -> None:
+        if not initialized.is_set():
+            initialized.set()  # the response to initialize, sent before the stopwatch starts
+            return
+        received[0] += 1
+        received[1] += len(message)
+        if received[0] > count:  # the notifications and the response
+            done.set()
+
+    server.transport.start(on_receive, done.set)
+    server.transport.send(format_request(Request.initialize(dict()).to_payload(1)))
+    wait(initialized, "the server to start")
+    stopwatch = Stopwatch()
+    flood = Request("bench/flood", {"count": count, "size": size, "rate": rate})
+    server.transport.send(format_request(flood.to_payload(2)))
+    wait(done, "notifications")
+    seconds, cpu_seconds = stopwatch.stop()
+    server.transport.send(format_request(Notification.exit().to_payload()))
+    server.stop()
+    return Result("framing {} {}B".format(transport, size), received[0], received[1], seconds, cpu_seconds)
+
+
+def bench_notifications(transport: str, python: str, size: int, count: int, rate: float) -> Result:
+    """Notifications from the server, decoded and handled by the Client"""
+    server = FakeServer(transport, python)
+    client = start_client(server)
+    done = threading.Event()
+    received = [0]
+
+    def on_data(params: 'Dict[str, Any]') -> None:
+        received[0] += 1
+
+    client.on_notification("bench/data", on_data)
+    stopwatch = Stopwatch()
+    client.send_request(Request("bench/flood", {"count": count, "size": size, "rate": rate}),
+                        lambda result: done.set())
+    wait(done, "notifications")
+    seconds, cpu_seconds = stopwatch.stop()
+    received_bytes = client.stats.snapshot()["bench/data"]["received_bytes"]
+    client.exit()
+    server.stop()
+    return Result("notifications {} {}B".format(transport, size), received[0], received_bytes,
+                  seconds, cpu_seconds)
+
+
+def bench_requests(transport: str, python: str, size: int, count: int, rate: float) -> Result:
+    """Round trips of requests sent one after the other, answered with `size` bytes"""
+    server = FakeServer(transport, python)
+    client = start_client(server)
+    answered = threading.Event()
+    latencies = []  # type: List[float]
+    stopwatch = Stopwatch()
+    for i in range(count):
+        answered.clear()
+        sent = time.perf_counter()
+        client.send_request(Request("bench/echo", {"size": size}), lambda result: answered.set())
+        wait(answered, "response")
+        latencies.append(time.perf_counter() - sent)
+    seconds, cpu_seconds = stopwatch.stop()
+    received_bytes = client.stats.snapshot()["bench/echo"]["received_bytes"]
+    client.exit()
+    server.stop()
+    return Result("requests {} {}B".format(transport, size), count, received_bytes, seconds, cpu_seconds, latencies)
+
+
+def bench_writes(transport: str, python: str, size: int, count: int, rate: float) -> Result:
+    """Notifications to the server, through the Client and the transport's writer"""
+    server = FakeServer(transport, python)
+    client = start_client(server)
+    done = threading.Event()
+    notification = Notification("bench/sink", {"data": "x" * size})
+    stopwatch = Stopwatch()
+    for i in range(count):
+        client.send_notification(notification)
+    # answered once the server read all notifications sent before it
+    client.send_request(Request("bench/sinkCount", None), lambda result: done.set())
+    wait(done, "notifications to be received")
+    seconds, cpu_seconds = stopwatch.stop()
+    sent_bytes = client.stats.snapshot()["bench/sink"]["sent_bytes"]
+    client.exit()
+    server.stop()
+    return Result("writes {} {}B".format(transport, size), count, sent_bytes, seconds, cpu_seconds)
+
+
+def make_lsp_diagnostic(i: int) -> 'Dict[str, Any]':
+    row = i // 10
+    return {
+        "range": {"start": {"line": row, "character": i % 10}, "end": {"line": row, "character": i % 10 + 5}},
+        "severity": 1 + i % 4,
+        "code": "E{}".format(i % 100),
+        # decoded from JSON, every diagnostic has its own copy of the source
+        "source": "".join(["pyco", "destyle"]),
+        "message": "message {}".format(i % 1000)
+    }
+
+
+def measure_diagnostics_memory(count: int) -> 'Tuple[int, float]':
+    """Bytes retained by `count` diagnostics decoded from LSP, and the seconds it took to decode them"""
+    import tracemalloc
+    lsp_diagnostics = [make_lsp_diagnostic(i) for i in range(count)]
+    stopwatch = Stopwatch()
+    diagnostics = [Diagnostic.from_lsp(lsp_diagnostic) for lsp_diagnostic in lsp_diagnostics]
+    seconds = stopwatch.stop()[0]
+    del lsp_diagnostics, diagnostics
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # the messages from the server are garbage once decoded, unless the diagnostics keep them
+    diagnostics = [Diagnostic.from_lsp(make_lsp_diagnostic(i)) for i in range(count)]
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(diagnostics) == count
+    return retained, seconds
+
+
+def make_completion_item(i: int) -> 'Dict[str, Any]':
+    label = "completion{}".format(i)
+    item = {"label": label, "kind": 1 + i % 25, "detail": "detail of " + label, "sortText": "{:08d}".format(i)}
+    if i % 2:
+        item["textEdit"] = {"newText": label, "range": {"start": {"line": 10, "character": 4},
+                                                        "end": {"line": 10, "character": 6}}}
+    return item
+
+
+def measure_completions(count: int, max_items: int = 0, repeat: int = 10) -> 'Tuple[float, float]':
+    """Seconds to sort and format a response of `count` completion items, and to look up each item by label"""
+    items = [make_completion_item(i) for i in reversed(range(count))]
+    stopwatch = Stopwatch()
+    for i in range(repeat):
+        formatted = FormattedCompletions(items, CompletionFormatter("auto", True, 10, "    co"), True, max_items)
+    format_seconds = stopwatch.stop()[0] / repeat
+    stopwatch = Stopwatch()
+    for item in items:
+        formatted.items_by_label.get(item["label"])
+    return format_seconds, stopwatch.stop()[0]
+
+
+# what the LSP commands of the context menu check, is_visible and is_enabled for each of them
+CONTEXT_MENU_CAPABILITIES = ["codeActionProvider", "definitionProvider", "documentSymbolProvider",
+                             "documentFormattingProvider", "referencesProvider", "renameProvider"]
+
+
+class BenchSettings(object):
+    def __init__(self, values: 'Dict[str, Any]') -> None:
+        self._values = values
+
+    def get(self, key: str) -> 'Any':
+        return self._values.get(key)
+
+
+class BenchView(object):
+    """A view of a single scope, scoring selectors the way Sublime does for a scope name without spaces"""
+
+    def __init__(self, window: 'BenchWindow', syntax: str, scope: str) -> None:
+        self._window = window
+        self._scope = scope
+        self._settings = BenchSettings({"syntax": "Packages/{0}/{0}.sublime-syntax".format(syntax)})
+
+    def id(self) -> int:
+        return 1
+
+    def window(self) -> 'BenchWindow':
+        return self._window
+
+    def file_name(self) -> str:
+        return os.path.join(os.getcwd(), "bench.lang")
+
+    def sel(self) -> 'List[Any]':
+        return [self]
+
+    def begin(self) -> int:
+        return 0
+
+    def settings(self) -> BenchSettings:
+        return self._settings
+
+    def scope_name(self, point: int) -> str:
+        return self._scope
+
+    def score_selector(self, point: int, selector: str) -> int:
+        if self._scope == selector or self._scope.startswith(selector + "."):
+            return 8 ** (selector.count(".") + 1)
+        return 0
+
+
+class BenchWindow(object):
+    def id(self) -> int:
+        return 1
+
+    def folders(self) -> 'List[str]':
+        return [os.getcwd()]
+
+    def project_data(self) -> 'Optional[dict]':
+        return None
+
+    def status_message(self, message: str) -> None:
+        pass
+
+
+class BenchHandlers(object):
+    def on_start(self, config_name: str, window: 'Any') -> bool:
+        return True
+
+    def on_initialized(self, config_name: str, window: 'Any', client: 'Any') -> None:
+        pass
+
+
+class InitializedClient(object):
+    """A client of a server answering initialize with the capabilities of the context menu commands"""
+
+    def send_request(self, request: Request, on_success: 'Callable', on_error: 'Optional[Callable]' = None) -> None:
+        on_success({"capabilities": {capability: True for capability in CONTEXT_MENU_CAPABILITIES}})
+
+    def send_notification(self, notification: Notification) -> None:
+        pass
+
+    def on_request(self, name: str, handler: 'Callable') -> None:
+        pass
+
+    def on_notification(self, name: str, handler: 'Callable') -> None:
+        pass
+
+    def set_crash_handler(self, handler: 'Callable') -> None:
+        pass
+
+    def set_error_display_handler(self, handler: 'Callable') -> None:
+        pass
+
+
+def measure_context_menu(configs: int, repeat: int = 1000) -> 'Tuple[float, float]':
+    """
+    Seconds to check the context menu commands of a view of a window with `configs` configs, with a
+    scope lookup and a session lookup for each check, and with the view's capability snapshot
+    """
+    languages = [LanguageConfig("lang{}".format(i), ["source.lang{}".format(i), "source.lang{}.embedded".format(i),
+                                                     "text.lang{}".format(i), "meta.lang{}".format(i)],
+                                ["Lang{}".format(i)]) for i in range(configs)]
+    all_configs = [ClientConfig("config{}".format(i), [], None, languages=[language])
+                   for i, language in enumerate(languages)]
+    window = BenchWindow()
+    view = BenchView(window, "Lang{}".format(configs - 1), "source.lang{}.embedded".format(configs - 1))
+
+    def start_session(window: 'Any', project_path: str, config: ClientConfig, on_created: 'Callable',
+                      on_ended: 'Callable') -> Session:
+        return Session(config, project_path, InitializedClient(), on_created, on_ended)  # type: ignore
+
+    manager = WindowManager(window, WindowConfigManager(all_configs), None, None, start_session, None,
+                            BenchHandlers())
+    manager.activate_view(view)
+
+    def check_capability(capability: str) -> bool:
+        config = get_scope_client_config(view, all_configs)
+        session = manager.get_session(config.name) if config else None
+        return bool(session and session.state == ClientStates.READY and session.has_capability(capability))
+
+    stopwatch = Stopwatch()
+    for i in range(repeat):
+        for capability in CONTEXT_MENU_CAPABILITIES:
+            assert check_capability(capability) and check_capability(capability)
+    lookup_seconds = stopwatch.stop()[0] / repeat
+    stopwatch = Stopwatch()
+    for i in range(repeat):
+        for capability in CONTEXT_MENU_CAPABILITIES:
+            assert manager.view_capabilities(view).config
+            assert manager.view_capabilities(view).has_capability(capability)
+    snapshot_seconds = stopwatch.stop()[0] / repeat
+    return lookup_seconds, snapshot_seconds
+
+
+BENCHMARKS = {
+    "framing": bench_framing,
+    "notifications": bench_notifications,
+    "requests": bench_requests,
+    "writes": bench_writes
+}  # type: Dict[str, Callable[[str, str, int, int, float], Result]]
+
+
+def main(argv: 'Optional[List[str]]' = None) -> 'List[Result]':
+    parser = argparse.ArgumentParser(description="Benchmark the LSP transports and client")
+    parser.add_argument("--benchmarks", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument("--transports", nargs="+", choices=["stdio", "tcp"], default=["stdio", "tcp"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 10000, 100000],
+                        help="payload size of each message in bytes")
+    parser.add_argument("--count", type=int, default=1000, help="messages per benchmark")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="messages per second sent by the server, 0 sends as fast as possible")
+    parser.add_argument("--python", default=sys.executable, help="interpreter running the fake server")
+    parser.add_argument("--diagnostics", type=int, default=0,
+                        help="only measure the memory used by this number of diagnostics")
+    parser.add_argument("--completions", type=int, default=0,
+                        help="only measure formatting a completion response of this number of items")
+    parser.add_argument("--completion-max-items", type=int, default=0,
+                        help="the completion_max_items setting for --completions")
+    parser.add_argument("--context-menu", type=int, default=0,
+                        help="only measure the capability checks of the context menu with this number of configs")
+    args = parser.parse_args(argv)
+
+    if args.diagnostics:
+        retained, seconds = measure_diagnostics_memory(args.diagnostics)
+        print("{} diagnostics: {:.1f} MB retained, {:.0f} bytes each, decoded in {:.3f} s".format(
+            args.diagnostics, retained / 1e6, retained / args.diagnostics, seconds))
+        return []
+    if args.completions:
+        format_seconds, lookup_seconds = measure_completions(args.completions, args.completion_max_items)
+        print("{} completions: formatted in {:.1f} ms, all looked up by label in {:.1f} ms".format(
+            args.completions, format_seconds * 1000, lookup_seconds * 1000))
+        return []
+    if args.context_menu:
+        lookup_seconds, snapshot_seconds = measure_context_menu(args.context_menu)
+        print("context menu with {} configs: {:.1f} us with lookups, {:.1f} us with the capability snapshot".format(
+            args.context_menu, lookup_seconds * 1e6, snapshot_seconds * 1e6))
+        return []
+
+    results = []  # type: List[Result]
+    for name in args.benchmarks:
+        for transport in args.transports:
+            for size in args.sizes:
+                result = BENCHMARKS[name](transport, args.python, size, args.count, args.rate)
+                print(result.report())
+                results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    main()
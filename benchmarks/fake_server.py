@@ -0,0 +1,117 @@
+"""
+A fake language server for benchmark.py, speaking JSON-RPC over stdio or TCP.
+
+It only depends on the standard library, so it can be started with any Python 3 interpreter:
+
+    python fake_server.py            # serve on stdin/stdout
+    python fake_server.py --tcp 9999 # accept one connection on localhost:9999
+
+Requests:
+    initialize               answered without capabilities
+    bench/echo               answered with a result of params.size bytes
+    bench/flood              sends params.count bench/data notifications of params.size bytes,
+                             at params.rate messages per second (0 sends as fast as possible),
+                             then answers with the count
+    bench/sinkCount          answers with the number and size of the notifications received so far
+    anything else            answered with null
+Notifications:
+    exit                     stops the server
+    anything else            counted by bench/sinkCount
+"""
+import argparse
+import json
+import socket
+import sys
+import time
+
+
+class Connection(object):
+    def __init__(self, reader, writer) -> None:
+        self._reader = reader
+        self._writer = writer
+
+    def read_message(self):
+        content_length = 0
+        while True:
+            line = self._reader.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                content_length = int(value)
+        return json.loads(self._reader.read(content_length).decode("UTF-8"))
+
+    def send(self, payload, flush: bool = True) -> None:
+        content = json.dumps(payload).encode("UTF-8")
+        self._writer.write(b"Content-Length: " + str(len(content)).encode("ascii") + b"\r\n\r\n" + content)
+        if flush:
+            self._writer.flush()
+
+    def respond(self, request_id, result) -> None:
+        self.send({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+
+def flood(connection: Connection, count: int, size: int, rate: float) -> None:
+    notification = {"jsonrpc": "2.0", "method": "bench/data", "params": {"data": "x" * size}}
+    interval = 1.0 / rate if rate > 0 else 0.0
+    start = time.time()
+    for i in range(count):
+        if interval:
+            delay = start + i * interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        # without a rate, the notifications are written as fast as the buffer fills up
+        connection.send(notification, flush=bool(interval))
+
+
+def serve(connection: Connection) -> None:
+    received = 0
+    received_bytes = 0
+    while True:
+        message = connection.read_message()
+        if message is None:
+            return
+        method = message.get("method")
+        params = message.get("params") or {}
+        if "id" not in message:
+            if method == "exit":
+                return
+            received += 1
+            received_bytes += len(json.dumps(params))
+        elif method == "bench/echo":
+            connection.respond(message["id"], {"data": "x" * params.get("size", 0)})
+        elif method == "bench/flood":
+            count = params.get("count", 0)
+            flood(connection, count, params.get("size", 0), params.get("rate", 0))
+            connection.respond(message["id"], {"count": count})
+        elif method == "bench/sinkCount":
+            connection.respond(message["id"], {"count": received, "bytes": received_bytes})
+        elif method == "initialize":
+            connection.respond(message["id"], {"capabilities": {}})
+        else:
+            connection.respond(message["id"], None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake language server for benchmarks")
+    parser.add_argument("--tcp", type=int, help="accept a connection on this port instead of using stdio")
+    args = parser.parse_args()
+
+    if args.tcp:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("localhost", args.tcp))
+        server.listen(1)
+        sock, _ = server.accept()
+        server.close()
+        serve(Connection(sock.makefile("rb"), sock.makefile("wb")))
+        sock.close()
+    else:
+        serve(Connection(sys.stdin.buffer, sys.stdout.buffer))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,7 @@ from .plugin.core.main import startup, shutdown
 from .plugin.core.panels import *
 from .plugin.core.registry import LspRestartClientCommand
 from .plugin.core.documents import *
+from .plugin.core.cursor import *
 from .plugin.core.edit import *
 from .plugin.completion import *
 from .plugin.diagnostics import *
@@ -25,6 +26,7 @@ from .plugin.code_actions import *
 from .plugin.symbols import *
 from .plugin.rename import *
 from .plugin.execute_command import *
+from .plugin.stats import *
 
 def plugin_loaded():
     startup()
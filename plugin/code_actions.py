@@ -1,4 +1,3 @@
-import sublime_plugin
 import sublime
 
 try:
@@ -12,8 +11,9 @@ from .core.protocol import Request
 from .core.diagnostics import get_point_diagnostics
 from .core.url import filename_to_uri
 from .core.views import region_to_range
-from .core.helpers import debounce
 from .core.registry import session_for_view
+from .core.cursor import on_cursor_idle, on_cursor_moved
+from .core.events import global_events
 from .core.settings import settings
 
 
@@ -28,6 +28,7 @@ class CodeAction:
             # the server doesn't support code actions, just return
             return
 
+        global_events.publish("view.on_purge_changes", self.view)
         params = self._get_code_action_params()
         session.client.send_request(
             Request.codeAction(params),
@@ -67,21 +68,16 @@ class CodeAction:
         }
 
 
-class LspCodeActionListener(sublime_plugin.ViewEventListener):
-    @classmethod
-    def is_applicable(cls, _settings):
-        if settings.show_code_actions_bulb:
-            return True
-        return False
+@on_cursor_moved
+def hide_code_actions_bulb(view: 'sublime.View', point: int) -> None:
+    if settings.show_code_actions_bulb:
+        CodeAction(view).hide_bulb()
 
-    def on_selection_modified_async(self):
-        self.code_action = CodeAction(self.view)
-        self.code_action.hide_bulb()
-        self.fire_request()
 
-    @debounce(0.8)
-    def fire_request(self):
-        self.code_action.send_request()
+@on_cursor_idle
+def request_code_actions_bulb(view: 'sublime.View', point: int) -> None:
+    if settings.show_code_actions_bulb:
+        CodeAction(view).send_request()
 
 
 class LspCodeActionsCommand(LspTextCommand):
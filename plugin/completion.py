@@ -12,17 +12,18 @@ from debug_tools import getLogger
 from .core.protocol import Request
 from .core.events import global_events
 from .core.settings import settings
-from .core.protocol import CompletionItemKind, Range
 from .core.registry import session_for_view, client_for_view
 from .core.configurations import is_supported_syntax
 from .core.documents import get_document_position
 from .core.sessions import Session
+from .core.rpc import RequestHandle
+from .core.completions import CompletionCache, CompletionFormatter, FormattedCompletions
+assert RequestHandle
 
 log = getLogger(1, __name__)
 
 
 NO_COMPLETION_SCOPES = 'comment, string'
-completion_item_kind_names = {v: k for k, v in CompletionItemKind.__dict__.items()}
 
 
 class CompletionState(object):
@@ -32,12 +33,12 @@ class CompletionState(object):
     CANCELLING = 3
 
 
-resolvable_completion_items = []  # type: List[Any]
+# the items of the last completion response by label, when the server resolves them
+resolvable_completion_items = {}  # type: Dict[str, Any]
 
 
 def find_completion_item(label: str) -> 'Optional[Any]':
-    matches = list(filter(lambda i: i.get("label") == label, resolvable_completion_items))
-    return matches[0] if matches else None
+    return resolvable_completion_items.get(label)
 
 
 class CompletionContext(object):
@@ -136,8 +137,11 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
         self.state = CompletionState.IDLE
         self.completions = []  # type: List[Any]
         self.next_request = None  # type: Optional[Tuple[str, List[int]]]
+        self.request = None  # type: Optional[RequestHandle]
         self.last_prefix = ""
         self.last_location = 0
+        self.cache = CompletionCache()
+        self.request_version = 0
 
     @classmethod
     def is_applicable(cls, settings):
@@ -198,12 +202,6 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
             prev_char = self.view.substr(location - 1)
             return prev_char in self.trigger_chars
 
-    def is_same_completion(self, prefix, locations):
-        # completion requests from the same location with the same prefix are cached.
-        current_start = locations[0] - len(prefix)
-        last_start = self.last_location - len(self.last_prefix)
-        return prefix.startswith(self.last_prefix) and current_start == last_start
-
     def on_modified(self):
         # hide completion when backspacing past last completion.
         if self.view.sel()[0].begin() < self.last_location:
@@ -212,7 +210,10 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
         # cancel current completion if the previous input is an space
         prev_char = self.view.substr(self.view.sel()[0].begin() - 1)
         if self.state == CompletionState.REQUESTING and prev_char.isspace():
-            self.state = CompletionState.CANCELLING
+            if self.cancel_request():
+                self.state = CompletionState.IDLE
+            else:
+                self.state = CompletionState.CANCELLING
 
     def on_query_completions(self, prefix, locations):
         if prefix != "" and self.view.match_selector(locations[0], NO_COMPLETION_SCOPES):
@@ -226,9 +227,12 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
             self.initialize()
 
         if self.enabled:
-            reuse_completion = self.is_same_completion(prefix, locations)
             if self.state == CompletionState.IDLE:
-                if not reuse_completion:
+                # while a complete list is being narrowed down by typing, it is filtered here
+                cached = self.cache.lookup(self.view.change_count(), locations[0] - len(prefix), prefix)
+                if cached is not None:
+                    self.completions = cached
+                else:
                     self.last_prefix = prefix
                     self.last_location = locations[0]
                     self.do_request(prefix, locations)
@@ -237,6 +241,9 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
             elif self.state in (CompletionState.REQUESTING, CompletionState.CANCELLING):
                 self.next_request = (prefix, locations)
                 self.state = CompletionState.CANCELLING
+                if self.cancel_request():
+                    # the superseded response will never arrive, ask for the current location right away.
+                    self.do_next_request()
 
             elif self.state == CompletionState.APPLYING:
                 self.state = CompletionState.IDLE
@@ -247,6 +254,21 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
                 else sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS
             )
 
+    def cancel_request(self) -> bool:
+        """Whether the response will never arrive, False if it is already being handled"""
+        request = self.request
+        self.request = None
+        return request.cancel() if request else False
+
+    def do_next_request(self):
+        if self.next_request:
+            prefix, locations = self.next_request
+            self.last_prefix = prefix
+            self.last_location = locations[0]
+            self.do_request(prefix, locations)
+        if self.state == CompletionState.CANCELLING:
+            self.state = CompletionState.IDLE
+
     def do_request(self, prefix: str, locations: 'List[int]'):
         self.next_request = None
         view = self.view
@@ -256,72 +278,44 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
         if not client:
             return
 
+        self.cache.clear()
         if settings.complete_all_chars or self.is_after_trigger_character(locations[0]):
             global_events.publish("view.on_purge_changes", self.view)
+            self.request_version = view.change_count()
             document_position = get_document_position(view, locations[0])
             if document_position:
-                client.send_request(
+                self.request = client.send_request(
                     Request.complete(document_position),
                     self.handle_response,
                     self.handle_error)
                 self.state = CompletionState.REQUESTING
 
-    def format_completion(self, item: dict) -> 'Tuple[str, str]':
-        # Sublime handles snippets automatically, so we don't have to care about insertTextFormat.
-        label = item["label"]
-        # choose hint based on availability and user preference
-        hint = None
-        if settings.completion_hint_type == "auto":
-            hint = item.get("detail")
-            if not hint:
-                kind = item.get("kind")
-                if kind:
-                    hint = completion_item_kind_names[kind]
-        elif settings.completion_hint_type == "detail":
-            hint = item.get("detail")
-        elif settings.completion_hint_type == "kind":
-            kind = item.get("kind")
-            if kind:
-                hint = completion_item_kind_names.get(kind)
-        # label is an alternative for insertText if neither textEdit nor insertText is provided
-        insert_text = self.text_edit_text(item) or item.get("insertText") or label
-        trigger = insert_text
-        if len(insert_text) > 0 and insert_text[0] == '$':  # sublime needs leading '$' escaped.
-            insert_text = '\\$' + insert_text[1:]
-        # only return trigger with a hint if available
-        return "\t  ".join((trigger, hint)) if hint else trigger, insert_text
-
-    def text_edit_text(self, item) -> 'Optional[str]':
-        if settings.complete_using_text_edit:
-            # try to handle textEdit if present
-            text_edit = item.get("textEdit")
-            if text_edit:
-                edit_range, edit_text = text_edit.get("range"), text_edit.get("newText")
-                if edit_range and edit_text:
-                    edit_range = Range.from_lsp(edit_range)
-                    last_start = self.last_location - len(self.last_prefix)
-                    last_row, last_col = self.view.rowcol(last_start)
-                    if last_row == edit_range.start.row == edit_range.end.row and edit_range.start.col <= last_col:
-                        # sublime does not support explicit replacement with completion
-                        # at given range, but we try to trim the textEdit range and text
-                        # to the start location of the completion
-                        return edit_text[last_col - edit_range.start.col:]
-        return None
+    def formatter(self) -> CompletionFormatter:
+        word_start = self.last_location - len(self.last_prefix)
+        row, _ = self.view.rowcol(word_start)
+        line_before = self.view.substr(sublime.Region(self.view.text_point(row, 0), word_start))
+        return CompletionFormatter(settings.completion_hint_type, settings.complete_using_text_edit, row, line_before)
 
     def handle_response(self, response: 'Optional[Dict]'):
         global resolvable_completion_items
 
+        self.request = None
         if self.state == CompletionState.REQUESTING:
             items = []  # type: List[Dict]
+            is_incomplete = False
             if isinstance(response, dict):
                 items = response["items"]
+                is_incomplete = response.get("isIncomplete", False)
             elif isinstance(response, list):
                 items = response
-            items = sorted(items, key=lambda item: item.get("sortText") or item["label"])
-            self.completions = list(self.format_completion(item) for item in items)
+            formatted = FormattedCompletions(items, self.formatter(), self.has_resolve_provider,
+                                             settings.completion_max_items)
+            self.completions = formatted.completions
+            self.cache.store(self.request_version, self.last_location - len(self.last_prefix), self.last_prefix,
+                             formatted.filter_items, is_incomplete or formatted.truncated)
 
             if self.has_resolve_provider:
-                resolvable_completion_items = items
+                resolvable_completion_items = formatted.items_by_label
 
             # if insert_best_completion was just ran, undo it before presenting new completions.
             prev_char = self.view.substr(self.view.sel()[0].begin() - 1)
@@ -333,14 +327,12 @@ class CompletionHandler(sublime_plugin.ViewEventListener):
             self.view.run_command("hide_auto_complete")
             self.run_auto_complete()
         elif self.state == CompletionState.CANCELLING:
-            if self.next_request:
-                prefix, locations = self.next_request
-                self.do_request(prefix, locations)
-                self.state = CompletionState.IDLE
+            self.do_next_request()
         else:
             log(2, 'Got unexpected response while in state %s', self.state)
 
     def handle_error(self, error: dict):
+        self.request = None
         sublime.status_message('Completion error: ' + str(error.get('message')))
         self.state = CompletionState.IDLE
 
@@ -2,6 +2,9 @@ import sublime
 import os
 import sys
 from .sessions import create_session, Session
+from .process import ProcessPool
+
+from .rpc import create_dispatcher
 
 # typing only
 from .rpc import Client
@@ -16,6 +19,9 @@ try:
 except ImportError:
     pass
 
+# server processes started ahead, for all windows
+process_pool = ProcessPool(settings, sublime.set_timeout_async)
+
 
 def get_window_env(window: sublime.Window, config: ClientConfig) -> 'Tuple[List[str], Dict[str, str]]':
 
@@ -49,7 +55,9 @@ def start_window_config(window: sublime.Window, project_path: str, config: Clien
     config.binary_args = args
     return create_session(config, project_path, env, settings,
                           on_created=on_created,
-                          on_ended=lambda config_name: on_session_ended(window, config.name, on_ended))
+                          on_ended=lambda config_name: on_session_ended(window, config.name, on_ended),
+                          dispatcher_factory=lambda: create_dispatcher(settings, sublime.set_timeout_async),
+                          process_pool=process_pool)
 
 
 def on_session_ended(window: sublime.Window, config_name: str, on_ended_handler: 'Callable[[str], None]') -> None:
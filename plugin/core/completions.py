@@ -0,0 +1,182 @@
+import heapq
+from .protocol import CompletionItemKind
+from .views import LineIndex
+
+try:
+    from typing import Any, List, Dict, Tuple, Callable, Optional
+    assert Any and List and Dict and Tuple and Callable and Optional
+except ImportError:
+    pass
+
+completion_item_kind_names = {v: k for k, v in CompletionItemKind.__dict__.items()}
+
+
+def hint_detail(item: dict) -> 'Optional[str]':
+    return item.get("detail")
+
+
+def hint_kind(item: dict) -> 'Optional[str]':
+    kind = item.get("kind")
+    return completion_item_kind_names.get(kind) if kind else None
+
+
+def hint_auto(item: dict) -> 'Optional[str]':
+    return item.get("detail") or hint_kind(item)
+
+
+def hint_none(item: dict) -> 'Optional[str]':
+    return None
+
+
+completion_hints = {
+    "auto": hint_auto,
+    "detail": hint_detail,
+    "kind": hint_kind
+}  # type: Dict[str, Callable[[dict], Optional[str]]]
+
+
+class CompletionFormatter(object):
+    """
+    Formats the items of a completion response as (trigger, contents) for Sublime. Everything that is the same
+    for all items of the response, the settings and the position of the word being completed, is worked out once.
+    """
+
+    def __init__(self, hint_type: str, use_text_edit: bool, row: int, line_before: str) -> None:
+        """row and line_before are the row of the word being completed and the text of the line before it"""
+        self._hint = completion_hints.get(hint_type, hint_none)
+        self._use_text_edit = use_text_edit
+        self._row = row
+        self._line_before = line_before
+        line = LineIndex(line_before)
+        self._col = line.point(len(line_before)).col
+        # the offset in line_before of each UTF-16 column a text edit can start at
+        self._offsets = [line.offset(0, col) for col in range(self._col + 1)]
+
+    def format(self, item: dict) -> 'Tuple[str, str]':
+        # Sublime handles snippets automatically, so we don't have to care about insertTextFormat.
+        label = item["label"]
+        hint = self._hint(item)
+        # label is an alternative for insertText if neither textEdit nor insertText is provided
+        text_edit = item.get("textEdit") if self._use_text_edit else None
+        insert_text = (text_edit and self.text_edit_text(text_edit)) or item.get("insertText") or label
+        trigger = insert_text
+        if insert_text[:1] == '$':  # sublime needs leading '$' escaped.
+            insert_text = '\\$' + insert_text[1:]
+        # only return trigger with a hint if available
+        return "\t  ".join((trigger, hint)) if hint else trigger, insert_text
+
+    def text_edit_text(self, text_edit: dict) -> 'Optional[str]':
+        edit_range, edit_text = text_edit.get("range"), text_edit.get("newText")
+        if edit_range and edit_text:
+            start, end = edit_range["start"], edit_range["end"]
+            if self._row == start["line"] == end["line"] and 0 <= start["character"] <= self._col:
+                # sublime does not support explicit replacement with completion
+                # at given range, but we try to trim the textEdit range and text
+                # to the start location of the completion
+                return edit_text[len(self._line_before) - self._offsets[start["character"]]:]
+        return None
+
+
+def completion_sort_key(item: dict) -> str:
+    return item.get("sortText") or item["label"]
+
+
+class FormattedCompletions(object):
+    """
+    The items of a completion response sorted and formatted in a single pass: the completions for Sublime,
+    the (filter text, completion) items for the CompletionCache and, if they are to be resolved, the items by label.
+    With max_items, only that many items first by sort text are kept, without sorting all of them.
+    """
+
+    def __init__(self, items: 'List[dict]', formatter: CompletionFormatter, index_labels: bool,
+                 max_items: int = 0) -> None:
+        self.completions = []  # type: List[Tuple[str, str]]
+        self.filter_items = []  # type: List[Tuple[str, Tuple[str, str]]]
+        self.items_by_label = {}  # type: Dict[str, dict]
+        # the items left out can only be shown by asking the server again
+        self.truncated = 0 < max_items < len(items)
+        if self.truncated:
+            items = heapq.nsmallest(max_items, items, key=completion_sort_key)
+        else:
+            items = sorted(items, key=completion_sort_key)
+        for item in items:
+            completion = formatter.format(item)
+            self.completions.append(completion)
+            self.filter_items.append((item.get("filterText") or item["label"], completion))
+            # the first item of a label is the one resolved
+            if index_labels and item["label"] not in self.items_by_label:
+                self.items_by_label[item["label"]] = item
+
+
+def fuzzy_score(query: str, text: str) -> 'Optional[int]':
+    """
+    Scores how well text matches the characters of query in order, ignoring case, or None if it doesn't.
+    Consecutive characters, characters starting a word and characters of the same case score higher.
+    """
+    lowered = text.lower()
+    score = 0
+    position = 0
+    previous = -2
+    for char in query:
+        found = lowered.find(char.lower(), position)
+        if found < 0:
+            return None
+        if found == previous + 1:
+            score += 3
+        if found == 0 or not text[found - 1].isalnum() or (text[found].isupper() and text[found - 1].islower()):
+            score += 2
+        if text[found] == char:
+            score += 1
+        previous = found
+        position = found + 1
+    return score
+
+
+def filter_completions(items: 'List[Tuple[str, Any]]', prefix: str) -> 'List[Any]':
+    """The completions of the (filter text, completion) items matching the prefix, the best matches first"""
+    if not prefix:
+        return [completion for _, completion in items]
+    scored = []  # type: List[Tuple[int, int, Any]]
+    for position, (filter_text, completion) in enumerate(items):
+        score = fuzzy_score(prefix, filter_text)
+        if score is not None:
+            scored.append((-score, position, completion))
+    scored.sort(key=lambda entry: entry[:2])
+    return [completion for _, _, completion in scored]
+
+
+class CompletionCache(object):
+    """
+    The last complete list of completions of a view. While the word it was requested for keeps growing,
+    the completions are filtered from it instead of being requested from the server again.
+    """
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.version = -1
+        self.word_start = -1
+        self.prefix = ""
+        self.items = []  # type: List[Tuple[str, Any]]
+
+    def store(self, version: int, word_start: int, prefix: str, items: 'List[Tuple[str, Any]]',
+              is_incomplete: bool) -> None:
+        """Keeps the (filter text, completion) items received for the prefix starting at word_start"""
+        if is_incomplete:
+            # the server has more items for a longer prefix, it has to be asked again
+            self.clear()
+            return
+        self.version = version
+        self.word_start = word_start
+        self.prefix = prefix
+        self.items = items
+
+    def lookup(self, version: int, word_start: int, prefix: str) -> 'Optional[List[Any]]':
+        """The cached completions matching the prefix, or None when the server has to be asked"""
+        if self.version < 0 or word_start != self.word_start or not prefix.startswith(self.prefix):
+            return None
+        # every change since is expected to be typing the rest of the prefix, anything else may change the results
+        if version - self.version > len(prefix) - len(self.prefix):
+            return None
+        return filter_completions(self.items, prefix)
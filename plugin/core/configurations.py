@@ -1,10 +1,9 @@
-import re
 import sublime
 from copy import deepcopy
 from debug_tools import getLogger
 
 from .settings import ClientConfig, client_configs, LanguageConfig
-from .types import config_supports_syntax
+from .types import language_supports_syntax
 from .workspace import get_project_config
 from .windows import ViewLike, WindowLike, ConfigRegistry
 
@@ -19,37 +18,50 @@ except ImportError:
     pass
 
 
-def get_scope_client_config(view: 'sublime.View', configs: 'List[ClientConfig]',
-                            point: 'Optional[int]'=None) -> 'Optional[ClientConfig]':
+# scope configs are remembered for this many (view, scope name) keys per window before starting over
+SCOPE_CONFIG_CACHE_SIZE = 1000
+
+
+def get_scope_client_configs(view: 'sublime.View', configs: 'List[ClientConfig]',
+                             point: int) -> 'List[ClientConfig]':
+    """The configs with a scope matching at the point, enabled or not, ranked the way get_scope_client_config picks"""
     # When there are multiple server configurations, all of which are for
     # similar scopes (e.g. 'source.json', 'source.json.sublime.settings') the
     # configuration with the most specific scope (highest ranked selector)
     # in the current position is preferred.
-    scope_score = 0
-    scope_client_config = None
-    if point is None:
-        sel = view.sel()
-        if len(sel) > 0:
-            point = sel[0].begin()
-
-    languages = view.settings().get('lsp_language', None)
-
-    for config in configs:
-        if config.enabled:
-            if languages is None or config.name in languages:
-                for language in config.languages:
-                    for scope in language.scopes:
-                        if point is not None:
-                            score = view.score_selector(point, scope)
-                            if score > 0:
-                                log(4, 'scope match score', scope, config.name, score)
-                            if score > scope_score:
-                                scope_score = score
-                                scope_client_config = config
+    languages = view.settings().get('lsp_language')
+    scored = []  # type: List[Tuple[int, int, ClientConfig]]
+    for position, config in enumerate(configs):
+        if languages is None or config.name in languages:
+            config_score = 0
+            for language in config.languages:
+                for scope in language.scopes:
+                    score = view.score_selector(point, scope)
+                    if score > 0:
+                        log(4, 'scope match score', scope, config.name, score)
+                    config_score = max(config_score, score)
+            if config_score > 0:
+                scored.append((-config_score, position, config))
+    scored.sort(key=lambda entry: entry[:2])
+    return [config for _, _, config in scored]
+
+
+def first_enabled(configs: 'List[ClientConfig]') -> 'Optional[ClientConfig]':
+    scope_client_config = next((config for config in configs if config.enabled), None)
     log(4, 'chose ', scope_client_config.name if scope_client_config else None)
     return scope_client_config
 
 
+def get_scope_client_config(view: 'sublime.View', configs: 'List[ClientConfig]',
+                            point: 'Optional[int]'=None) -> 'Optional[ClientConfig]':
+    if point is None:
+        sel = view.sel()
+        if len(sel) == 0:
+            return None
+        point = sel[0].begin()
+    return first_enabled(get_scope_client_configs(view, configs, point))
+
+
 def get_global_client_config(view: sublime.View) -> 'Optional[ClientConfig]':
     return get_scope_client_config(view, client_configs.all)
 
@@ -84,17 +96,27 @@ def apply_window_settings(client_config: 'ClientConfig', window: 'sublime.Window
     return client_config
 
 
+# whether any config supports a syntax, for the generation of client_configs it was worked out for
+_supported_syntaxes = dict()  # type: Dict[str, bool]
+_supported_syntaxes_generation = -1
+
+
 def is_supported_syntax(syntax: str) -> bool:
-    for config in client_configs.all:
-        for language in config.languages:
-            if re.search(r'|'.join(r'\b%s\b' % re.escape(s) for s in language.syntaxes), syntax, re.IGNORECASE):
-                return True
-    return False
+    global _supported_syntaxes, _supported_syntaxes_generation
+    if _supported_syntaxes_generation != client_configs.generation:
+        _supported_syntaxes = dict()
+        _supported_syntaxes_generation = client_configs.generation
+    supported = _supported_syntaxes.get(syntax)
+    if supported is None:
+        supported = any(language_supports_syntax(language, syntax)
+                        for config in client_configs.all for language in config.languages)
+        _supported_syntaxes[syntax] = supported
+    return supported
 
 
 def syntax_language(config: 'ClientConfig', syntax: str) -> 'Optional[LanguageConfig]':
     for language in config.languages:
-        if re.search(r'|'.join(r'\b%s\b' % re.escape(s) for s in language.syntaxes), syntax, re.IGNORECASE):
+        if language_supports_syntax(language, syntax):
             return language
     return None
 
@@ -108,35 +130,63 @@ class ConfigManager(object):
 class WindowConfigManager(object):
     def __init__(self, configs: 'List[ClientConfig]') -> None:
         self.all = configs
+        # the configs supporting a syntax, enabled or not, with their language for it
+        self._syntax_languages = dict()  # type: Dict[str, List[Tuple[ClientConfig, LanguageConfig]]]
+        # the ranked scope configs by view, scope name at the point, syntax and lsp_language of the view
+        self._scope_configs = dict()  # type: Dict[Tuple[int, str, str, Any], List[ClientConfig]]
 
     def is_supported(self, view: 'Any') -> bool:
         return self.scope_config(view) is not None
 
     def scope_config(self, view: 'Any', point=None) -> 'Optional[ClientConfig]':
-        return get_scope_client_config(view, self.all, point)
+        """
+        The config for the scope at the point, the start of the selection by default. Selectors only depend on
+        the scope name, so the configs are ranked once per scope name of the view until the configs change.
+        """
+        if point is None:
+            sel = view.sel()
+            if len(sel) == 0:
+                return None
+            point = sel[0].begin()
+        view_settings = view.settings()
+        languages = view_settings.get('lsp_language')
+        key = (view.id(), view.scope_name(point), view_settings.get("syntax"),
+               tuple(languages) if isinstance(languages, list) else languages)
+        configs = self._scope_configs.get(key)
+        if configs is None:
+            if len(self._scope_configs) >= SCOPE_CONFIG_CACHE_SIZE:
+                self._scope_configs = dict()
+            configs = get_scope_client_configs(view, self.all, point)
+            self._scope_configs[key] = configs
+        return first_enabled(configs)
+
+    def syntax_languages(self, syntax: str) -> 'List[Tuple[ClientConfig, LanguageConfig]]':
+        languages = self._syntax_languages.get(syntax)
+        if languages is None:
+            languages = []
+            for config in self.all:
+                language = syntax_language(config, syntax)
+                if language:
+                    languages.append((config, language))
+            self._syntax_languages[syntax] = languages
+        return languages
 
     def syntax_configs(self, view: 'Any') -> 'List[ClientConfig]':
         syntax = view.settings().get("syntax")
-        return list(filter(lambda c: config_supports_syntax(c, syntax) and c.enabled, self.all))
+        return [config for config, _ in self.syntax_languages(syntax) if config.enabled]
 
     def syntax_supported(self, view: ViewLike) -> bool:
         syntax = view.settings().get("syntax")
-        for found in filter(lambda c: config_supports_syntax(c, syntax) and c.enabled, self.all):
-            return True
-        return False
+        return any(config.enabled for config, _ in self.syntax_languages(syntax))
 
     def syntax_config_languages(self, view: ViewLike) -> 'Dict[str, LanguageConfig]':
         syntax = view.settings().get("syntax")
-        config_languages = {}
-        for config in self.all:
-            if config.enabled:
-                language = syntax_language(config, syntax)
-                if language:
-                    config_languages[config.name] = language
-        return config_languages
+        return {config.name: language for config, language in self.syntax_languages(syntax) if config.enabled}
 
     def update(self, configs: 'List[ClientConfig]') -> None:
         self.all = configs
+        self._syntax_languages = dict()
+        self._scope_configs = dict()
 
     def disable(self, config_name: str) -> None:
         for config in self.all:
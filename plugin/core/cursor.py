@@ -0,0 +1,88 @@
+import sublime
+import sublime_plugin
+
+from .configurations import is_supported_syntax
+from .registry import scheduler, session_for_view, when_session_ready
+
+try:
+    from typing import Any, List, Dict, Tuple, Callable, Optional
+    assert Any and List and Dict and Tuple and Callable and Optional
+except ImportError:
+    pass
+
+# delay after the cursor stopped moving before the features about the cursor position run
+CURSOR_IDLE_DELAY_MS = 500
+
+cursor_idle_handlers = []  # type: List[Callable[[sublime.View, int], None]]
+cursor_moved_handlers = []  # type: List[Callable[[sublime.View, int], None]]
+
+
+def on_cursor_idle(handler: 'Callable[[sublime.View, int], None]') -> 'Callable[[sublime.View, int], None]':
+    """
+    Registers a handler, called with the view and the point of the cursor once it rests at a new position,
+    or at the same one after the cursor moved handlers cleared what was shown for it
+    """
+    cursor_idle_handlers.append(handler)
+    return handler
+
+
+def on_cursor_moved(handler: 'Callable[[sublime.View, int], None]') -> 'Callable[[sublime.View, int], None]':
+    """Registers a handler, called with the view and the point of the cursor as soon as it moves elsewhere"""
+    cursor_moved_handlers.append(handler)
+    return handler
+
+
+class CursorIdleListener(sublime_plugin.ViewEventListener):
+    """
+    Runs the cursor idle handlers of a view once its cursor stopped moving, instead of each feature reacting
+    to every selection change. Their requests are sent in one go. Handlers that need no request, and those
+    clearing what was shown for the previous position, run as soon as the cursor moves elsewhere.
+    """
+
+    @classmethod
+    def is_applicable(cls, view_settings):
+        syntax = view_settings.get('syntax')
+        return syntax and is_supported_syntax(syntax)
+
+    def __init__(self, view: sublime.View) -> None:
+        super().__init__(view)
+        # where the idle handlers ran last, None once the cursor moved handlers cleared what they showed
+        self.idle_position = None  # type: Optional[Tuple[int, int, int]]
+        self.position = None  # type: Optional[Tuple[int, int, int]]
+
+    def cursor_position(self) -> 'Optional[Tuple[int, int, int]]':
+        selections = self.view.sel()
+        if len(selections) == 0:
+            return None
+        region = selections[0]
+        return region.a, region.b, self.view.change_count()
+
+    def on_selection_modified_async(self) -> None:
+        position = self.cursor_position()
+        if position is not None and position != self.position:
+            self.position = position
+            self.idle_position = None
+            for handler in cursor_moved_handlers:
+                handler(self.view, min(position[0], position[1]))
+        scheduler.debounce(("cursor_idle", self.view.id()), CURSOR_IDLE_DELAY_MS, self.on_idle)
+
+    def on_close(self) -> None:
+        scheduler.cancel(("cursor_idle", self.view.id()))
+
+    def on_idle(self) -> None:
+        if not self.view.is_valid():
+            return
+        position = self.cursor_position()
+        if position is None or position == self.idle_position:
+            return
+        self.position = self.idle_position = position
+        point = min(position[0], position[1])
+        for handler in cursor_idle_handlers:
+            handler(self.view, point)
+        if not session_for_view(self.view, point):
+            # the server is still starting, the handlers run again once it is ready
+            when_session_ready(self.view, lambda session: self.on_session_ready(), ("cursor_idle", self.view.id()))
+
+    def on_session_ready(self) -> None:
+        self.idle_position = None
+        scheduler.debounce(("cursor_idle", self.view.id()), 0, self.on_idle)
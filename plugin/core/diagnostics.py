@@ -1,11 +1,13 @@
 import sublime
+import threading
+from bisect import bisect_left, bisect_right
 
 from debug_tools import getLogger
 
 from .url import uri_to_filename
 from .protocol import Diagnostic
 from .events import global_events
-from .views import range_to_region
+from .views import offset_to_point
 from .windows import WindowLike, ViewLike
 
 assert Diagnostic
@@ -21,28 +23,142 @@ except ImportError:
 log = getLogger(1, __name__)
 
 
+# diagnostics spanning more rows than this are kept out of the row index and checked one by one
+WIDE_DIAGNOSTIC_ROWS = 16
+
+
+def count_severities(diagnostics: 'List[Diagnostic]') -> 'Dict[int, int]':
+    counts = dict()  # type: Dict[int, int]
+    for diagnostic in diagnostics:
+        counts[diagnostic.severity] = counts.get(diagnostic.severity, 0) + 1
+    return counts
+
+
+def add_counts(totals: 'Dict[int, int]', counts: 'Dict[int, int]', sign: int = 1) -> None:
+    for severity, count in counts.items():
+        totals[severity] = totals.get(severity, 0) + sign * count
+
+
+class DiagnosticsIndex(object):
+    """The diagnostics of a file sorted by start row, built in full before a lookup can see it"""
+    __slots__ = ("all", "starts", "narrow", "wide", "max_rows")
+
+    def __init__(self, diagnostics: 'List[Diagnostic]') -> None:
+        self.all = diagnostics
+        self.narrow = []  # type: List[Diagnostic]
+        self.wide = []  # type: List[Diagnostic]
+        self.max_rows = 0
+        for diagnostic in diagnostics:
+            rows = diagnostic.range.end.row - diagnostic.range.start.row
+            if rows > WIDE_DIAGNOSTIC_ROWS:
+                self.wide.append(diagnostic)
+            else:
+                self.narrow.append(diagnostic)
+                self.max_rows = max(self.max_rows, rows)
+        self.narrow.sort(key=lambda diagnostic: diagnostic.range.start.row)
+        self.starts = [diagnostic.range.start.row for diagnostic in self.narrow]
+
+
+class FileDiagnostics(object):
+    """
+    The diagnostics of a file by source. An index sorted by start row, built on the first lookup after a change,
+    turns line and point lookups into a binary search. Counts per severity are kept up to date for each source
+    and for the file. Diagnostics are published on the dispatcher thread while lookups run on the others.
+    """
+
+    def __init__(self) -> None:
+        self.by_source = dict()  # type: Dict[str, List[Diagnostic]]
+        self.counts_by_source = dict()  # type: Dict[str, Dict[int, int]]
+        self.counts = dict()  # type: Dict[int, int]
+        self._built = None  # type: Optional[DiagnosticsIndex]
+        self._lock = threading.Lock()
+
+    def update(self, source: str, diagnostics: 'List[Diagnostic]') -> bool:
+        with self._lock:
+            if diagnostics:
+                self.by_source[source] = diagnostics
+            elif source in self.by_source:
+                del self.by_source[source]
+            else:
+                return False
+            add_counts(self.counts, self.counts_by_source.pop(source, dict()), -1)
+            if diagnostics:
+                self.counts_by_source[source] = count_severities(diagnostics)
+                add_counts(self.counts, self.counts_by_source[source])
+            self._built = None
+            return True
+
+    def _index(self) -> DiagnosticsIndex:
+        index = self._built
+        if index is None:
+            with self._lock:
+                if self._built is None:
+                    self._built = DiagnosticsIndex(
+                        [diagnostic for diagnostics in self.by_source.values() for diagnostic in diagnostics])
+                index = self._built
+        return index
+
+    def all(self) -> 'List[Diagnostic]':
+        return self._index().all
+
+    def count(self, severity: int) -> int:
+        return self.counts.get(severity, 0)
+
+    def on_line(self, row: int) -> 'List[Diagnostic]':
+        return self.in_rows(row, row)
+
+    def in_rows(self, first: int, last: int) -> 'List[Diagnostic]':
+        """The diagnostics touching any row from first to last, inclusive"""
+        index = self._index()
+        # only diagnostics starting at most max_rows before the first row can reach it
+        begin = bisect_left(index.starts, first - index.max_rows)
+        end = bisect_right(index.starts, last)
+        found = [diagnostic for diagnostic in index.narrow[begin:end] if diagnostic.range.end.row >= first]
+        found.extend(diagnostic for diagnostic in index.wide
+                     if diagnostic.range.start.row <= last and diagnostic.range.end.row >= first)
+        return found
+
+    def at_point(self, row: int, col: int) -> 'List[Diagnostic]':
+        position = (row, col)
+        found = []  # type: List[Diagnostic]
+        for diagnostic in self.on_line(row):
+            start, end = diagnostic.range.start, diagnostic.range.end
+            if (start.row, start.col) <= position <= (end.row, end.col):
+                found.append(diagnostic)
+        return found
+
+
 global_diagnostics = dict(
-)  # type: Dict[int, Dict[str, Dict[str, List[Diagnostic]]]]
+)  # type: Dict[int, Dict[str, FileDiagnostics]]
+
+# the counts per severity of all files of a window
+global_severity_counts = dict(
+)  # type: Dict[int, Dict[int, int]]
+
+
+# serialises the updates of the diagnostics and counts of all windows, published by each server on its own thread
+_diagnostics_lock = threading.Lock()
 
 
 def update_file_diagnostics(window: sublime.Window, file_path: str, source: str,
                             diagnostics: 'List[Diagnostic]') -> bool:
-    updated = False
-    if diagnostics:
-        file_diagnostics = global_diagnostics.setdefault(window.id(), dict()).setdefault(
-            file_path, dict())
-        file_diagnostics[source] = diagnostics
-        updated = True
-    else:
-        if window.id() in global_diagnostics:
-            window_diagnostics = global_diagnostics[window.id()]
-            if file_path in window_diagnostics:
-                if source in window_diagnostics[file_path]:
-                    updated = True
-                    del window_diagnostics[file_path][source]
-                if not window_diagnostics[file_path]:
-                    del window_diagnostics[file_path]
-    return updated
+    with _diagnostics_lock:
+        if diagnostics:
+            window_diagnostics = global_diagnostics.setdefault(window.id(), dict())
+        else:
+            window_diagnostics = global_diagnostics.get(window.id(), dict())
+        file_diagnostics = window_diagnostics.get(file_path)
+        if file_diagnostics is None:
+            if not diagnostics:
+                return False
+            file_diagnostics = window_diagnostics[file_path] = FileDiagnostics()
+        window_counts = global_severity_counts.setdefault(window.id(), dict())
+        add_counts(window_counts, file_diagnostics.counts, -1)
+        updated = file_diagnostics.update(source, diagnostics)
+        add_counts(window_counts, file_diagnostics.counts)
+        if not file_diagnostics.by_source:
+            del window_diagnostics[file_path]
+        return updated
 
 
 class DiagnosticsUpdate(object):
@@ -92,34 +208,37 @@ class GlobalDiagnostics(object):
 
 
 def get_line_diagnostics(view, point):
+    file_diagnostics = get_file_diagnostics(view)
+    if not file_diagnostics:
+        return ()
     row, _ = view.rowcol(point)
-    diagnostics = get_diagnostics_for_view(view)
-    return tuple(
-        diagnostic for diagnostic in diagnostics
-        if diagnostic.range.start.row <= row <= diagnostic.range.end.row
-    )
+    return tuple(file_diagnostics.on_line(row))
 
 
 def get_point_diagnostics(view, point):
-    diagnostics = get_diagnostics_for_view(view)
-    return tuple(
-        diagnostic for diagnostic in diagnostics
-        if range_to_region(diagnostic.range, view).contains(point)
-    )
+    file_diagnostics = get_file_diagnostics(view)
+    if not file_diagnostics:
+        return ()
+    position = offset_to_point(view, point)
+    return tuple(file_diagnostics.at_point(position.row, position.col))
 
 
-def get_window_diagnostics(window: sublime.Window) -> 'Optional[Dict[str, Dict[str, List[Diagnostic]]]]':
+def get_window_diagnostics(window: sublime.Window) -> 'Optional[Dict[str, FileDiagnostics]]':
     return global_diagnostics.get(window.id())
 
 
-def get_diagnostics_for_view(view: sublime.View) -> 'List[Diagnostic]':
-    view_diagnostics = []
+def get_window_severity_count(window: sublime.Window, severity: int) -> int:
+    return global_severity_counts.get(window.id(), dict()).get(severity, 0)
+
+
+def get_file_diagnostics(view: sublime.View) -> 'Optional[FileDiagnostics]':
     window = view.window()
     file_path = view.file_name()
     if file_path and window:
-        if window.id() in global_diagnostics:
-            file_diagnostics = global_diagnostics[window.id()]
-            if file_path in file_diagnostics:
-                for origin in file_diagnostics[file_path]:
-                    view_diagnostics.extend(file_diagnostics[file_path][origin])
-    return view_diagnostics
+        return global_diagnostics.get(window.id(), dict()).get(file_path)
+    return None
+
+
+def get_diagnostics_for_view(view: sublime.View) -> 'List[Diagnostic]':
+    file_diagnostics = get_file_diagnostics(view)
+    return list(file_diagnostics.all()) if file_diagnostics else []
@@ -11,7 +11,7 @@ except ImportError:
 from .url import uri_to_filename
 from .protocol import Range
 from .workspace import get_project_path
-from .views import range_to_region
+from .views import ranges_to_regions
 
 from debug_tools import getLogger
 log = getLogger(1, __name__)
@@ -61,7 +61,7 @@ class LspApplyDocumentEditCommand(sublime_plugin.TextCommand):
         # Sort changes due to issues with self.view.get_regions
         # See https://github.com/tomv564/LSP/issues/325
         changes = self.changes_sorted(changes) if changes else []
-        regions = list(self.create_region(change) for change in changes)
+        regions = self.create_regions(changes)
         replacements = list(change.get('newText') for change in changes)
 
         # TODO why source.python here?
@@ -113,8 +113,8 @@ class LspApplyDocumentEditCommand(sublime_plugin.TextCommand):
         # Sort by start position
         return sorted(changes, key=get_start_position)
 
-    def create_region(self, change):
-        return range_to_region(Range.from_lsp(change['range']), self.view)
+    def create_regions(self, changes: 'List[dict]') -> 'List[sublime.Region]':
+        return ranges_to_regions((Range.from_lsp(change['range']) for change in changes), self.view)
 
     def apply_change(self, region, newText, edit):
         if region.empty():
@@ -1,17 +1,87 @@
-from threading import Timer
-
-
-def debounce(seconds):
-    """ Decorator that will debounce a function call for the given amount of seconds. """
-    def decorator(fn):
-        def debounced(*args, **kwargs):
-            def call_it():
-                fn(*args, **kwargs)
-            try:
-                debounced.t.cancel()  # type: ignore
-            except(AttributeError):
-                pass
-            debounced.t = Timer(seconds, call_it)  # type: ignore
-            debounced.t.start()  # type: ignore
-        return debounced
-    return decorator
+import threading
+import time
+
+try:
+    from typing import Any, Dict, Callable, Optional, Hashable
+    assert Any and Dict and Callable and Optional and Hashable
+except ImportError:
+    pass
+
+
+# a deadline moved by less than this is treated as reached, instead of starting another timeout for it
+SCHEDULER_RESOLUTION = 0.01
+
+
+class ScheduledCall(object):
+    __slots__ = ("callback", "deadline", "timer", "interval")
+
+    def __init__(self, callback: 'Callable[[], None]', deadline: float, interval: 'Optional[float]') -> None:
+        self.callback = callback
+        self.deadline = deadline
+        # the deadline the pending timeout was started for
+        self.timer = deadline
+        self.interval = interval
+
+
+class Scheduler(object):
+    """
+    Debounces and throttles calls by key, for example per view, on top of Sublime's async timeout queue.
+    A key has at most one timeout pending: calls made meanwhile only move its deadline, and a timeout firing
+    before the deadline starts another one for the time left.
+    """
+
+    def __init__(self, set_timeout_async: 'Callable[[Callable[[], None], int], None]',
+                 clock: 'Callable[[], float]' = time.monotonic) -> None:
+        self._set_timeout_async = set_timeout_async
+        self._clock = clock
+        self._pending = dict()  # type: Dict[Hashable, ScheduledCall]
+        self._last_runs = dict()  # type: Dict[Hashable, float]
+        self._lock = threading.Lock()
+
+    def debounce(self, key: 'Hashable', delay_ms: int, callback: 'Callable[[], None]') -> None:
+        """Calls the callback once no call for the key was made for delay_ms, only the last callback is called"""
+        self._schedule(key, self._clock() + delay_ms / 1000, callback, None)
+
+    def throttle(self, key: 'Hashable', interval_ms: int, callback: 'Callable[[], None]') -> None:
+        """Calls the callback right away, or once interval_ms passed since the last call for the key"""
+        now = self._clock()
+        interval = interval_ms / 1000
+        with self._lock:
+            last_run = self._last_runs.get(key)
+        self._schedule(key, now if last_run is None else max(now, last_run + interval), callback, interval)
+
+    def cancel(self, key: 'Hashable') -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            self._last_runs.pop(key, None)
+
+    def _schedule(self, key: 'Hashable', deadline: float, callback: 'Callable[[], None]',
+                  interval: 'Optional[float]') -> None:
+        with self._lock:
+            call = self._pending.get(key)
+            if call:
+                call.callback = callback
+                if interval is None:
+                    call.deadline = deadline
+                return
+            call = self._pending[key] = ScheduledCall(callback, deadline, interval)
+        self._start_timer(key, call, deadline - self._clock())
+
+    def _start_timer(self, key: 'Hashable', call: ScheduledCall, seconds: float) -> None:
+        self._set_timeout_async(lambda: self._fire(key, call), max(0, int(seconds * 1000 + 0.5)))
+
+    def _fire(self, key: 'Hashable', call: ScheduledCall) -> None:
+        with self._lock:
+            if self._pending.get(key) is not call:
+                return  # cancelled
+            postponed = call.deadline - call.timer
+            if postponed >= SCHEDULER_RESOLUTION:
+                call.timer = call.deadline
+            else:
+                del self._pending[key]
+                if call.interval is not None:
+                    self._last_runs[key] = self._clock()
+        if postponed >= SCHEDULER_RESOLUTION:
+            self._start_timer(key, call, postponed)
+        else:
+            call.callback()
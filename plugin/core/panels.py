@@ -34,7 +34,7 @@ def create_output_panel(window: sublime.Window, name: str) -> 'Optional[sublime.
 
 
 def destroy_output_panels(window: sublime.Window) -> None:
-    for panel_name in ["references", "diagnostics"]:
+    for panel_name in ["references", "diagnostics", "lsp_stats"]:
         window.destroy_output_panel(panel_name)
 
 
@@ -74,11 +74,14 @@ class LspUpdatePanelCommand(sublime_plugin.TextCommand):
     A update_panel command to update the error panel with new text.
     """
 
-    def run(self, edit, characters):
+    def run(self, edit, characters, begin=None, end=None):
+        # Replace only the given region, or all of the text
+        region = sublime.Region(begin, end) if begin is not None else sublime.Region(0, self.view.size())
+
         # Clear folds
-        self.view.unfold(sublime.Region(0, self.view.size()))
+        self.view.unfold(region)
 
-        self.view.replace(edit, sublime.Region(0, self.view.size()), characters)
+        self.view.replace(edit, region, characters)
 
         # Clear the selection
         selection = self.view.sel()
@@ -1,8 +1,10 @@
 from .settings import PLUGIN_NAME
+from .types import Settings
 import subprocess
 import os
 import shutil
 import threading
+import time
 
 from debug_tools import getLogger
 log = getLogger(1, __name__)
@@ -56,6 +58,95 @@ def start_server(server_binary_args: 'List[str]', working_dir: str,
         startupinfo=si)
 
 
+class IdleProcess(object):
+    __slots__ = ("process", "since")
+
+    def __init__(self, process: 'subprocess.Popen', since: float) -> None:
+        self.process = process
+        self.since = since
+
+
+class ProcessPool(object):
+    """
+    Keeps server_pool_size server processes started ahead for each command, working directory and environment
+    a session was started with, for the next session of the same config and project, after a restart or in
+    another window, to take one that already went through the server's own startup. Processes left waiting
+    for server_pool_idle_timeout seconds are terminated.
+    """
+
+    def __init__(self, settings: Settings, set_timeout_async: 'Callable[[Callable[[], None], int], None]',
+                 clock: 'Callable[[], float]' = time.monotonic) -> None:
+        self._settings = settings
+        self._set_timeout_async = set_timeout_async
+        self._clock = clock
+        self._idle = dict()  # type: Dict[Tuple, List[IdleProcess]]
+        self._lock = threading.Lock()
+
+    def take(self, server_binary_args: 'List[str]', working_dir: str, env: 'Dict[str,str]',
+             attach_stderr: bool) -> 'Optional[subprocess.Popen]':
+        """A started process of the server, a waiting one if there is, and starts the processes to keep waiting"""
+        key = (tuple(server_binary_args), working_dir, tuple(sorted(env.items())), attach_stderr)
+        process = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle and not process:
+                candidate = idle.pop(0).process
+                if candidate.poll() is None:
+                    process = candidate
+                    log(2, "took waiting process %s of %s", candidate.pid, server_binary_args)
+        if not process:
+            process = start_server(server_binary_args, working_dir, env, attach_stderr)
+        self._fill(key, server_binary_args, working_dir, env, attach_stderr)
+        return process
+
+    def _fill(self, key: 'Tuple', server_binary_args: 'List[str]', working_dir: str, env: 'Dict[str,str]',
+              attach_stderr: bool) -> None:
+        size = self._settings.server_pool_size
+        with self._lock:
+            missing = size - len(self._idle.get(key, []))
+        for i in range(missing):
+            try:
+                process = start_server(server_binary_args, working_dir, env, attach_stderr)
+            except Exception:
+                log.exception("Failure starting a waiting process of %s", server_binary_args)
+                break
+            if process:
+                with self._lock:
+                    self._idle.setdefault(key, []).append(IdleProcess(process, self._clock()))
+        if missing > 0:
+            self._set_timeout_async(self.evict_idle, int(self._settings.server_pool_idle_timeout * 1000))
+
+    def evict_idle(self) -> None:
+        """Terminates the processes left waiting for too long"""
+        oldest = self._clock() - self._settings.server_pool_idle_timeout
+        evicted = []  # type: List[subprocess.Popen]
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                evicted.extend(waiting.process for waiting in idle if waiting.since <= oldest)
+                idle[:] = [waiting for waiting in idle if waiting.since > oldest]
+                if not idle:
+                    del self._idle[key]
+        for process in evicted:
+            log(2, "terminating waiting process %s", process.pid)
+            terminate(process)
+
+    def clear(self) -> None:
+        """Terminates all waiting processes"""
+        with self._lock:
+            idle = self._idle
+            self._idle = dict()
+        for processes in idle.values():
+            for waiting in processes:
+                terminate(waiting.process)
+
+
+def terminate(process: 'subprocess.Popen') -> None:
+    try:
+        process.terminate()
+    except Exception:
+        pass
+
+
 def attach_logger(process: 'subprocess.Popen', stream) -> None:
     threading.Thread(target=log_stream, args=(process, stream)).start()
 
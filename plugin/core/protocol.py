@@ -1,3 +1,5 @@
+import sys
+
 try:
     from typing import Any, List, Dict, Tuple, Callable, Optional
     assert Any and List and Dict and Tuple and Callable and Optional
@@ -17,6 +19,17 @@ class DiagnosticSeverity(object):
     Hint = 4
 
 
+class ErrorCode(object):
+    ParseError = -32700
+    InvalidRequest = -32600
+    MethodNotFound = -32601
+    InvalidParams = -32602
+    InternalError = -32603
+    ServerNotInitialized = -32002
+    UnknownErrorCode = -32001
+    RequestCancelled = -32800
+
+
 class SymbolKind(object):
     File = 1
     Module = 2
@@ -74,10 +87,12 @@ class DocumentHighlightKind(object):
 
 
 class Request:
+    __slots__ = ("method", "params")
+    jsonrpc = "2.0"
+
     def __init__(self, method: str, params: 'Optional[dict]') -> None:
         self.method = method
         self.params = params
-        self.jsonrpc = "2.0"
 
     @classmethod
     def initialize(cls, params: dict) -> 'Request':
@@ -154,10 +169,12 @@ class Request:
 
 
 class Response:
+    __slots__ = ("request_id", "result")
+    jsonrpc = "2.0"
+
     def __init__(self, request_id: int, result: 'Optional[Dict[str, Any]]') -> None:
         self.request_id = request_id
         self.result = result
-        self.jsonrpc = "2.0"
 
     def to_payload(self) -> 'Dict[str, Any]':
         r = {
@@ -169,10 +186,12 @@ class Response:
 
 
 class Notification:
+    __slots__ = ("method", "params")
+    jsonrpc = "2.0"
+
     def __init__(self, method: str, params: dict = {}) -> None:
         self.method = method
         self.params = params
-        self.jsonrpc = "2.0"
 
     @classmethod
     def initialized(cls) -> 'Notification':
@@ -202,6 +221,10 @@ class Notification:
     def exit(cls) -> 'Notification':
         return Notification("exit")
 
+    @classmethod
+    def cancelRequest(cls, params: dict) -> 'Notification':
+        return Notification("$/cancelRequest", params)
+
     def __repr__(self) -> str:
         return self.method + " " + str(self.params)
 
@@ -218,6 +241,8 @@ class Notification:
 
 
 class Point(object):
+    __slots__ = ("row", "col")
+
     def __init__(self, row: int, col: int) -> None:
         self.row = int(row)
         self.col = int(col)
@@ -237,6 +262,8 @@ class Point(object):
 
 
 class Range(object):
+    __slots__ = ("start", "end")
+
     def __init__(self, start: Point, end: Point) -> None:
         self.start = start
         self.end = end
@@ -255,14 +282,27 @@ class Range(object):
         }
 
 
+# the keys of an LSP diagnostic kept as attributes, all others are kept as they are
+DIAGNOSTIC_FIELDS = frozenset(("message", "range", "severity", "source"))
+
+
 class Diagnostic(object):
+    """
+    A diagnostic keeps its fields without the LSP dict it was decoded from, many of them are held at once.
+    The dict is built again when the diagnostic has to be sent back to the server.
+    """
+    __slots__ = ("message", "range", "severity", "source", "_has_severity", "_extra")
+
     def __init__(self, message: str, range: Range, severity: int,
                  source: 'Optional[str]', lsp_diagnostic: dict) -> None:
         self.message = message
         self.range = range
         self.severity = severity
-        self.source = source
-        self._lsp_diagnostic = lsp_diagnostic
+        # the same few sources are repeated by every diagnostic
+        self.source = sys.intern(source) if isinstance(source, str) else source
+        self._has_severity = "severity" in lsp_diagnostic
+        extra = tuple((key, value) for key, value in lsp_diagnostic.items() if key not in DIAGNOSTIC_FIELDS)
+        self._extra = extra or None  # type: Optional[Tuple[Tuple[str, Any], ...]]
 
     @classmethod
     def from_lsp(cls, lsp_diagnostic: dict) -> 'Diagnostic':
@@ -277,4 +317,14 @@ class Diagnostic(object):
         )
 
     def to_lsp(self) -> 'Dict[str, Any]':
-        return self._lsp_diagnostic
+        lsp_diagnostic = {
+            "message": self.message,
+            "range": self.range.to_lsp()
+        }  # type: Dict[str, Any]
+        if self._has_severity:
+            lsp_diagnostic["severity"] = self.severity
+        if self.source is not None:
+            lsp_diagnostic["source"] = self.source
+        if self._extra:
+            lsp_diagnostic.update(self._extra)
+        return lsp_diagnostic
@@ -1,12 +1,14 @@
 import sublime
 import sublime_plugin
+from concurrent.futures import ThreadPoolExecutor
 from .diagnostics import GlobalDiagnostics
-from .windows import WindowRegistry, DocumentHandlerFactory
+from .windows import WindowRegistry, DocumentHandlerFactory, ViewCapabilities, SharedSessions
+from .helpers import Scheduler
 from .configurations import (
     ConfigManager
 )
 from .clients import (
-    start_window_config
+    start_window_config, process_pool
 )
 from .types import ClientStates, ClientConfig
 from .handlers import LanguageHandler
@@ -20,10 +22,14 @@ log = getLogger(1, __name__)
 try:
     from typing import Optional, List, Callable, Dict, Any
     assert Optional and List and Callable and Dict and Any and ClientConfig and Client and Session
+    assert ViewCapabilities
 except ImportError:
     pass
 
 
+# servers started at the same time, each of them may take seconds until it can be connected to
+SESSION_START_WORKERS = 4
+
 client_start_listeners = {}  # type: Dict[str, Callable]
 client_initialization_listeners = {}  # type: Dict[str, Callable]
 
@@ -101,13 +107,18 @@ def unload_sessions():
     for window in sublime.windows():
         wm = windows.lookup(window)
         wm.end_sessions()
+    process_pool.clear()
 
 
 configs = ConfigManager()
 diagnostics = GlobalDiagnostics()
-documents = DocumentHandlerFactory(sublime, settings)
+# debounces and throttles calls for all views
+scheduler = Scheduler(sublime.set_timeout_async)
+documents = DocumentHandlerFactory(sublime, settings, scheduler)
 handlers_dispatcher = LanguageHandlerDispatcher()
-windows = WindowRegistry(configs, documents, diagnostics, start_window_config, sublime, handlers_dispatcher)
+start_pool = ThreadPoolExecutor(max_workers=SESSION_START_WORKERS)
+windows = WindowRegistry(configs, documents, diagnostics, start_window_config, sublime, handlers_dispatcher,
+                         start_pool, SharedSessions(settings))
 
 
 def config_for_scope(view: 'Any', point=None) -> 'Optional[ClientConfig]':
@@ -118,12 +129,30 @@ def config_for_scope(view: 'Any', point=None) -> 'Optional[ClientConfig]':
     return None
 
 
+def when_session_ready(view: 'Any', callback: 'Callable[[Session], None]', key: 'Optional[Any]' = None) -> bool:
+    """
+    Calls back once the session for the view is ready, without blocking. Returns whether it waits for it,
+    False if the session is already ready or the view has no config. A callback waiting under the same key
+    is replaced.
+    """
+    window = view.window()
+    config = config_for_scope(view)
+    if window and config:
+        return windows.lookup(window).when_ready(config.name, callback, key)
+    return False
+
+
+def view_capabilities(view: 'Any') -> 'Optional[ViewCapabilities]':
+    window = view.window()
+    if window:
+        return windows.lookup(window).view_capabilities(view)
+    return None
+
+
 def is_supported_view(view: sublime.View) -> bool:
     # TODO: perhaps make this check for a client instead of a config
-    if config_for_scope(view):
-        return True
-    else:
-        return False
+    snapshot = view_capabilities(view)
+    return bool(snapshot and snapshot.config)
 
 
 class LspTextCommand(sublime_plugin.TextCommand):
@@ -134,10 +163,8 @@ class LspTextCommand(sublime_plugin.TextCommand):
         return is_supported_view(self.view)
 
     def has_client_with_capability(self, capability):
-        session = session_for_view(self.view)
-        if session and session.has_capability(capability):
-            return True
-        return False
+        snapshot = view_capabilities(self.view)
+        return bool(snapshot and snapshot.has_capability(capability))
 
 
 class LspRestartClientCommand(sublime_plugin.TextCommand):
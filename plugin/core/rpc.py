@@ -1,36 +1,39 @@
 import json
-import socket
+import math
+import threading
 import time
-from .transports import TCPTransport, StdioTransport, Transport
+from collections import deque
+from queue import Queue
+from .transports import TCPTransport, StdioTransport, Transport, connect_tcp
 from .process import attach_logger
 try:
     import subprocess
-    from typing import Any, List, Dict, Tuple, Callable, Optional, Union
+    from typing import Any, List, Dict, Tuple, Callable, Optional, Union, Set
     # from mypy_extensions import TypedDict
-    assert Any and List and Dict and Tuple and Callable and Optional and Union and subprocess
+    assert Any and List and Dict and Tuple and Callable and Optional and Union and Set and subprocess
 except ImportError:
     pass
 
 from debug_tools import getLogger
 
 from .settings import PLUGIN_NAME
-from .protocol import Request, Notification, Response
+from .protocol import Request, Notification, Response, ErrorCode
 from .types import Settings
 
 
 log = getLogger(1, __name__)
 
-TCP_CONNECT_TIMEOUT = 5
+REQUEST_TIMEOUT_RESOLUTION = 0.5  # seconds covered by one slot of the timeout wheel
+CANCELLED_REQUEST_TTL = 60  # seconds to wait for a late response to a cancelled request
+LATENCY_SAMPLES = 1000  # most recent round-trip times kept per method
 
 # RequestDict = TypedDict('RequestDict', {'id': 'Union[str,int]', 'method': str, 'params': 'Optional[Any]'})
 
 
-def format_request(payload: 'Dict[str, Any]') -> str:
-    """Converts the request into json and adds the Content-Length header"""
-    content = json.dumps(payload, sort_keys=False)
-    content_length = len(content)
-    result = "Content-Length: {}\r\n\r\n{}".format(content_length, content)
-    return result
+def format_request(payload: 'Dict[str, Any]') -> bytes:
+    """Converts the request into json and adds the Content-Length header, encoded once, ready to be written"""
+    content = json.dumps(payload, sort_keys=False).encode("UTF-8")
+    return b"Content-Length: " + str(len(content)).encode("ascii") + b"\r\n\r\n" + content
 
 
 def attach_tcp_client(tcp_port: int, process: 'subprocess.Popen', settings: Settings) -> 'Optional[Client]':
@@ -38,31 +41,26 @@ def attach_tcp_client(tcp_port: int, process: 'subprocess.Popen', settings: Sett
         attach_logger(process, process.stdout)
 
     host = "localhost"
-    start_time = time.time()
     log(2, 'connecting to %s:%s', host, tcp_port)
+    try:
+        sock = connect_tcp(host, tcp_port)
+    except Exception:
+        process.kill()
+        raise
 
-    while time.time() - start_time < TCP_CONNECT_TIMEOUT:
-        try:
-            sock = socket.create_connection((host, tcp_port))
-            transport = TCPTransport(sock)
-
-            client = Client(transport, settings)
-            client.set_transport_failure_handler(lambda: try_terminate_process(process))
-            return client
-        except ConnectionRefusedError as e:
-            pass
-
-    process.kill()
-    raise Exception("Timeout connecting to socket")
+    client = Client(TCPTransport(sock), settings)
+    client.set_transport_failure_handler(lambda: try_terminate_process(process))
+    return client
 
 
-def attach_stdio_client(process: 'subprocess.Popen', settings: Settings) -> 'Client':
+def attach_stdio_client(process: 'subprocess.Popen', settings: Settings,
+                        dispatcher: 'Optional[MessageDispatcher]' = None) -> 'Client':
     transport = StdioTransport(process)
 
     # TODO: process owner can take care of this outside client?
     if settings.log_stderr:
         attach_logger(process, process.stderr)
-    client = Client(transport, settings)
+    client = Client(transport, settings, dispatcher)
     client.set_transport_failure_handler(lambda: try_terminate_process(process))
     return client
 
@@ -74,12 +72,294 @@ def try_terminate_process(process: 'subprocess.Popen') -> None:
         pass  # process can be terminated already
 
 
+class DispatchQueue(object):
+    """Runs callables in order on a dedicated thread and keeps track of the queue depth"""
+
+    def __init__(self, name: str) -> None:
+        self._queue = Queue()  # type: Queue[Optional[Callable[[], None]]]
+        self.max_pending = 0
+        self.dispatched = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def dispatch(self, task: 'Callable[[], None]') -> None:
+        self._queue.put(task)
+        self.max_pending = max(self.max_pending, self._queue.qsize())
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            try:
+                task()
+            except Exception as err:
+                log.exception("Error running dispatched task")
+            self.dispatched += 1
+
+
+class AsyncExecutor(object):
+    """Marshals callables to Sublime's async thread and keeps track of how many are waiting to run"""
+
+    def __init__(self, set_timeout_async: 'Callable') -> None:
+        self._set_timeout_async = set_timeout_async
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.max_pending = 0
+        self.dispatched = 0
+
+    def dispatch(self, task: 'Callable[[], None]') -> None:
+        with self._lock:
+            self._pending += 1
+            self.max_pending = max(self.max_pending, self._pending)
+        self._set_timeout_async(lambda: self._run(task), 0)
+
+    def pending(self) -> int:
+        return self._pending
+
+    def stop(self) -> None:
+        pass
+
+    def _run(self, task: 'Callable[[], None]') -> None:
+        with self._lock:
+            self._pending -= 1
+            self.dispatched += 1
+        task()
+
+
+class MessageDispatcher(object):
+    """
+    Decodes received messages on a dedicated thread, so the transport's reader thread only frames bytes,
+    and runs the handlers on the decoding thread or with the given executor.
+    """
+
+    def __init__(self, name: str, executor: 'Optional[Any]' = None) -> None:
+        self.decoder = DispatchQueue(name)
+        self.executor = executor
+
+    def decode(self, task: 'Callable[[], None]') -> None:
+        self.decoder.dispatch(task)
+
+    def handle(self, task: 'Callable[[], None]') -> None:
+        if self.executor:
+            self.executor.dispatch(task)
+        else:
+            task()
+
+    def stop(self) -> None:
+        self.decoder.stop()
+        if self.executor:
+            self.executor.stop()
+
+    def stats(self) -> 'Dict[str, int]':
+        stats = {
+            "decoder_pending": self.decoder.pending(),
+            "decoder_max_pending": self.decoder.max_pending,
+            "decoded": self.decoder.dispatched
+        }
+        if self.executor:
+            stats["handlers_pending"] = self.executor.pending()
+            stats["handlers_max_pending"] = self.executor.max_pending
+            stats["handled"] = self.executor.dispatched
+        return stats
+
+
+def create_dispatcher(settings: Settings, set_timeout_async: 'Callable') -> MessageDispatcher:
+    """Creates the dispatcher for a client, running handlers on the thread chosen by the handler_dispatch setting"""
+    executor = AsyncExecutor(set_timeout_async) if settings.handler_dispatch == "async" else None
+    return MessageDispatcher("LSP message dispatcher", executor)
+
+
+class TimerWheel(object):
+    """
+    Buckets deadlines into slots of `resolution` seconds, so scheduling and cancelling are O(1)
+    and expiring only looks at the slots that came due since the last call.
+    """
+
+    def __init__(self, resolution: float = REQUEST_TIMEOUT_RESOLUTION, slots: int = 128,
+                 clock: 'Callable[[], float]' = time.monotonic) -> None:
+        self.resolution = resolution
+        self._slots = [dict() for _ in range(slots)]  # type: List[Dict[Any, float]]
+        self._slot_of = {}  # type: Dict[Any, int]
+        # the tick of the slot checked last, the current one until the first expiry
+        self._tick = self._tick_at(clock())
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def _tick_at(self, when: float) -> int:
+        return int(when / self.resolution)
+
+    def schedule(self, key: 'Any', deadline: float) -> None:
+        self.cancel(key)
+        tick = self._tick_at(deadline)
+        # deadlines that already passed go to the slot that is checked next
+        index = (tick if tick > self._tick else self._tick) % len(self._slots)
+        self._slots[index][key] = deadline
+        self._slot_of[key] = index
+
+    def cancel(self, key: 'Any') -> bool:
+        index = self._slot_of.pop(key, None)
+        if index is None:
+            return False
+        del self._slots[index][key]
+        return True
+
+    def clear(self) -> None:
+        for slot in self._slots:
+            slot.clear()
+        self._slot_of.clear()
+
+    def expire(self, now: float) -> 'List[Any]':
+        """Removes and returns the keys whose deadline is not after `now`"""
+        current = self._tick_at(now)
+        # the last visited slot is checked again, it may have received deadlines that fell in its tick
+        start = min(self._tick, current)
+        if current - start >= len(self._slots):
+            ticks = range(0, len(self._slots))
+        else:
+            ticks = range(start, current + 1)
+        self._tick = current
+        expired = []  # type: List[Any]
+        for tick in ticks:
+            slot = self._slots[tick % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self._slot_of[key]
+            expired.extend(due)
+        return expired
+
+
+def percentile(samples: 'List[float]', fraction: float) -> float:
+    """Nearest-rank percentile of the sorted samples"""
+    if not samples:
+        return 0.0
+    return samples[max(0, int(math.ceil(fraction * len(samples))) - 1)]
+
+
+class MethodStats(object):
+    def __init__(self) -> None:
+        self.sent = 0
+        self.sent_bytes = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # type: deque
+
+    def snapshot(self) -> 'Dict[str, Any]':
+        latencies = sorted(self.latencies)
+        return {
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "received": self.received,
+            "received_bytes": self.received_bytes,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0
+        }
+
+
+class ClientStats(object):
+    """Counts messages and their sizes per method, and measures the round-trip time of requests"""
+
+    def __init__(self) -> None:
+        self._methods = {}  # type: Dict[str, MethodStats]
+        self._pending = {}  # type: Dict[int, Tuple[str, float]]
+        self._lock = threading.Lock()
+
+    def _method(self, method: str) -> MethodStats:
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = MethodStats()
+        return stats
+
+    def on_sent(self, method: str, size: int, request_id: 'Optional[int]' = None) -> None:
+        with self._lock:
+            stats = self._method(method)
+            stats.sent += 1
+            stats.sent_bytes += size
+            if request_id is not None:
+                self._pending[request_id] = (method, time.monotonic())
+
+    def on_received(self, method: str, size: int) -> None:
+        with self._lock:
+            stats = self._method(method)
+            stats.received += 1
+            stats.received_bytes += size
+
+    def on_response(self, request_id: int, size: int, received_at: float, is_error: bool) -> None:
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                return  # cancelled or timed out, already accounted for
+            method, sent_at = pending
+            stats = self._method(method)
+            stats.received += 1
+            stats.received_bytes += size
+            stats.latencies.append(received_at - sent_at)
+            if is_error:
+                stats.errors += 1
+
+    def on_dropped(self, request_id: int, timed_out: bool) -> None:
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                return
+            stats = self._method(pending[0])
+            if timed_out:
+                stats.timed_out += 1
+            else:
+                stats.cancelled += 1
+
+    def clear_pending(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+    def snapshot(self) -> 'Dict[str, Dict[str, Any]]':
+        """Totals per method, with latency percentiles in seconds"""
+        with self._lock:
+            return dict((method, stats.snapshot()) for method, stats in self._methods.items())
+
+
+class RequestHandle(object):
+    """Returned by Client.send_request, cancels the request when its response is no longer needed"""
+
+    def __init__(self, client: 'Client', request_id: int, method: str) -> None:
+        self.client = client
+        self.request_id = request_id
+        self.method = method
+
+    def cancel(self) -> bool:
+        """Whether the response handlers were dropped, False once the response is being handled"""
+        return self.client.cancel_request(self.request_id)
+
+
 class Client(object):
-    def __init__(self, transport: Transport, settings) -> None:
+    def __init__(self, transport: Transport, settings,
+                 dispatcher: 'Optional[MessageDispatcher]' = None) -> None:
         self.transport = transport
-        self.transport.start(self.receive_payload, self.on_transport_closed)
+        self._dispatcher = dispatcher
         self.request_id = 0
         self._response_handlers = {}  # type: Dict[int, Tuple[Optional[Callable], Optional[Callable]]]
+        self._cancelled_requests = set()  # type: Set[int]
+        self._request_methods = {}  # type: Dict[int, str]
+        self._timeouts = TimerWheel()
+        self._timeouts_lock = threading.Lock()
+        self._timeouts_thread = None  # type: Optional[threading.Thread]
+        self.stats = ClientStats()
         self._request_handlers = {}  # type: Dict[str, Callable]
         self._notification_handlers = {}  # type: Dict[str, Callable]
         self.exiting = False
@@ -87,17 +367,111 @@ class Client(object):
         self._transport_fail_handler = None  # type: Optional[Callable]
         self._error_display_handler = lambda msg: log(1, msg)
         self.settings = settings
+        # started last, messages and the transport closing can arrive right away
+        self.transport.start(self.receive_payload, self.on_transport_closed)
 
     def send_request(self, request: Request, handler: 'Callable[[Optional[Any]], None]',
-                     error_handler: 'Optional[Callable]' = None) -> None:
+                     error_handler: 'Optional[Callable]' = None) -> RequestHandle:
         self.request_id += 1
+        request_id = self.request_id
         log(2, ' --> %s', request.method)
-        self._response_handlers[self.request_id] = (handler, error_handler)
-        self.send_payload(request.to_payload(self.request_id))
+        timeout = self.request_timeout(request.method)
+        with self._timeouts_lock:
+            self._response_handlers[request_id] = (handler, error_handler)
+            self._request_methods[request_id] = request.method
+            if timeout > 0:
+                self._schedule_timeout(request_id, timeout)
+        message = format_request(request.to_payload(request_id))
+        # account for the request before a response can arrive
+        self.stats.on_sent(request.method, len(message), request_id)
+        self.transport.send(message)
+        return RequestHandle(self, request_id, request.method)
+
+    def request_timeout(self, method: str) -> float:
+        """Seconds to wait for the response to a request, 0 waits forever"""
+        return self.settings.request_timeouts.get(method, self.settings.request_timeout)
+
+    def outstanding_requests(self) -> int:
+        return len(self._response_handlers)
+
+    def cancel_request(self, request_id: int) -> bool:
+        """
+        Drops the handlers of a pending request and asks the server to stop working on it. Returns whether
+        the handlers were dropped, False if the request was already answered or cancelled.
+        """
+        return self._cancel(request_id) is not None
+
+    def _cancel(self, request_id: int,
+                timed_out: bool = False) -> 'Optional[Tuple[Optional[Callable], Optional[Callable]]]':
+        with self._timeouts_lock:
+            handlers = self._response_handlers.pop(request_id, None)
+            if handlers is None:
+                return None  # already answered or cancelled
+            self.stats.on_dropped(request_id, timed_out)
+            self._request_methods.pop(request_id, None)
+            # forget about the request if the server never answers it
+            self._cancelled_requests.add(request_id)
+            self._schedule_timeout(request_id, CANCELLED_REQUEST_TTL)
+        log(2, ' --> $/cancelRequest %s', request_id)
+        self.send_notification(Notification.cancelRequest({"id": request_id}))
+        return handlers
+
+    def _schedule_timeout(self, request_id: int, timeout: float) -> None:
+        self._timeouts.schedule(request_id, time.monotonic() + timeout)
+        if self._timeouts_thread is None:
+            self._timeouts_thread = threading.Thread(target=self._watch_timeouts, name="LSP request timeouts",
+                                                     daemon=True)
+            self._timeouts_thread.start()
+
+    def _watch_timeouts(self) -> None:
+        while True:
+            time.sleep(self._timeouts.resolution)
+            with self._timeouts_lock:
+                if not self._timeouts:
+                    self._timeouts_thread = None
+                    return
+            self.expire_requests(time.monotonic())
+
+    def expire_requests(self, now: float) -> None:
+        """Fails the requests whose timeout passed and forgets cancelled requests the server never answered"""
+        with self._timeouts_lock:
+            expired = self._timeouts.expire(now)
+        for request_id in expired:
+            if request_id in self._cancelled_requests:
+                self._cancelled_requests.discard(request_id)
+                continue
+            method = self._request_methods.get(request_id, "")
+            handlers = self._cancel(request_id, timed_out=True)
+            if handlers is None:
+                continue
+            timeout = self.request_timeout(method)
+            log(2, '%s (%s) timed out after %s seconds, %s requests outstanding',
+                method, request_id, timeout, self.outstanding_requests())
+            error = {
+                "code": ErrorCode.RequestCancelled,
+                "message": "{} timed out after {} seconds".format(method, timeout)
+            }
+            self._handle_timeout(handlers[1], error)
+
+    def _handle_timeout(self, error_handler: 'Optional[Callable]', error: 'Dict[str, Any]') -> None:
+        def report() -> None:
+            if error_handler:
+                error_handler(error)
+            else:
+                self._error_display_handler(error.get("message"))
+
+        if self._dispatcher:
+            # run it in order with the handlers of the responses that are already decoded
+            dispatcher = self._dispatcher
+            dispatcher.decode(lambda: dispatcher.handle(report))
+        else:
+            report()
 
     def send_notification(self, notification: Notification) -> None:
         log(2, ' --> %s', notification.method)
-        self.send_payload(notification.to_payload())
+        message = format_request(notification.to_payload())
+        self.stats.on_sent(notification.method, len(message))
+        self.transport.send(message)
 
     def send_response(self, response: Response) -> None:
         self.send_payload(response.to_payload())
@@ -125,16 +499,40 @@ class Client(object):
         message = format_request(payload)
         self.transport.send(message)
 
-    def receive_payload(self, message: str) -> None:
+    def dispatch_stats(self) -> 'Dict[str, int]':
+        return self._dispatcher.stats() if self._dispatcher else {}
+
+    def receive_payload(self, message: 'Union[bytes, str]') -> None:
+        received_at = time.monotonic()
+        if self._dispatcher:
+            self._dispatcher.decode(lambda: self.handle_payload(message, received_at))
+        else:
+            self.handle_payload(message, received_at)
+
+    def handle_payload(self, message: 'Union[bytes, str]', received_at: 'Optional[float]' = None) -> None:
         payload = None
+        size = len(message)
         try:
+            if isinstance(message, bytes):
+                message = message.decode("UTF-8")
             payload = json.loads(message)
             # limit = min(len(message), 200)
             # log(2, "got json: %s ...", message[0:limit])
-        except IOError as err:
+        except (IOError, ValueError) as err:
             log.exception("got a non-JSON payload: %s", message)
             return
 
+        if "method" in payload:
+            self.stats.on_received(payload["method"], size)
+        elif "id" in payload:
+            self.stats.on_response(payload["id"], size, received_at or time.monotonic(), "error" in payload)
+
+        if self._dispatcher:
+            self._dispatcher.handle(lambda: self.dispatch_payload(payload))
+        else:
+            self.dispatch_payload(payload)
+
+    def dispatch_payload(self, payload: 'Dict[str, Any]') -> None:
         try:
             if "method" in payload:
                 if "id" in payload:
@@ -149,6 +547,23 @@ class Client(object):
             log.exception("Error handling server payload")
 
     def on_transport_closed(self) -> None:
+        if self._dispatcher:
+            # let the messages received before closing be handled first
+            dispatcher = self._dispatcher
+            dispatcher.decode(lambda: dispatcher.handle(self.handle_transport_closed))
+            dispatcher.stop()
+        else:
+            self.handle_transport_closed()
+
+    def handle_transport_closed(self) -> None:
+        with self._timeouts_lock:
+            if self._response_handlers:
+                log(2, 'dropping %s outstanding requests', len(self._response_handlers))
+            self._response_handlers.clear()
+            self._request_methods.clear()
+            self._cancelled_requests.clear()
+            self._timeouts.clear()
+        self.stats.clear_pending()
         self._error_display_handler("Communication to server closed, exiting")
         # Differentiate between normal exit and server crash?
         if not self.exiting:
@@ -158,7 +573,16 @@ class Client(object):
         request_id = int(response["id"])
         if self.settings.log_payloads:
             log(2, '     %s', response.get("result", None))
-        handler, error_handler = self._response_handlers.pop(request_id, (None, None))
+        with self._timeouts_lock:
+            self._timeouts.cancel(request_id)
+            self._request_methods.pop(request_id, None)
+            cancelled = request_id in self._cancelled_requests
+            self._cancelled_requests.discard(request_id)
+            handler, error_handler = self._response_handlers.pop(request_id, (None, None))
+        if cancelled:
+            # the server may still answer (or report RequestCancelled), nobody is waiting for it anymore.
+            log(2, 'dropping response for cancelled request %s', request_id)
+            return
         if "result" in response and "error" not in response:
             if handler:
                 handler(response["result"])
@@ -1,30 +1,42 @@
 from .types import ClientConfig, ClientStates, Settings
 from .protocol import Request
 from .transports import start_tcp_transport
-from .rpc import Client, attach_stdio_client
-from .process import start_server
+from .rpc import Client, MessageDispatcher, attach_stdio_client
+from .process import start_server, ProcessPool
 from .url import filename_to_uri
 import os
 from .protocol import CompletionItemKind, SymbolKind
+from .protocol import TextDocumentSyncKindNone, TextDocumentSyncKindFull
 try:
-    from typing import Callable, Dict, Any, Optional
-    assert Callable and Dict and Any and Optional
+    from typing import Callable, Dict, Any, Optional, List, Set
+    assert Callable and Dict and Any and Optional and List and Set and MessageDispatcher and ProcessPool
 except ImportError:
     pass
 
 
 def create_session(config: ClientConfig, project_path: str, env: dict, settings: Settings,
                    on_created=None, on_ended: 'Optional[Callable[[str], None]]'=None,
-                   bootstrap_client=None) -> 'Optional[Session]':
+                   bootstrap_client=None,
+                   dispatcher_factory: 'Optional[Callable[[], MessageDispatcher]]'=None,
+                   process_pool: 'Optional[ProcessPool]'=None) -> 'Optional[Session]':
     session = None
+
+    def create_dispatcher() -> 'Optional[MessageDispatcher]':
+        return dispatcher_factory() if dispatcher_factory else None
+
     if config.binary_args:
 
-        process = start_server(config.binary_args, project_path, env, settings.log_stderr)
+        # a server listening on a port can't have another process started ahead
+        if process_pool and not config.tcp_port:
+            process = process_pool.take(config.binary_args, project_path, env, settings.log_stderr)
+        else:
+            process = start_server(config.binary_args, project_path, env, settings.log_stderr)
         if process:
             if config.tcp_port:
                 transport = start_tcp_transport(config.tcp_port, config.tcp_host)
                 if transport:
-                    session = Session(config, project_path, Client(transport, settings), on_created, on_ended)
+                    session = Session(config, project_path, Client(transport, settings, create_dispatcher()),
+                                      on_created, on_ended)
                 else:
                     # try to terminate the process
                     try:
@@ -32,13 +44,13 @@ def create_session(config: ClientConfig, project_path: str, env: dict, settings:
                     except Exception as e:
                         pass
             else:
-                client = attach_stdio_client(process, settings)
+                client = attach_stdio_client(process, settings, create_dispatcher())
                 session = Session(config, project_path, client, on_created, on_ended)
     else:
         if config.tcp_port:
             transport = start_tcp_transport(config.tcp_port)
 
-            session = Session(config, project_path, Client(transport, settings),
+            session = Session(config, project_path, Client(transport, settings, create_dispatcher()),
                               on_created, on_ended)
         elif bootstrap_client:
             session = Session(config, project_path, bootstrap_client,
@@ -148,6 +160,9 @@ class Session(object):
         self._on_ended = on_ended
         self.capabilities = dict()  # type: Dict[str, Any]
         self.client = client
+        # the windows having each document open and the last version sent, when windows share the session
+        self._document_windows = dict()  # type: Dict[str, Set[int]]
+        self._document_versions = dict()  # type: Dict[str, int]
         self.initialize()
 
     def has_capability(self, capability):
@@ -156,6 +171,54 @@ class Session(object):
     def get_capability(self, capability):
         return self.capabilities.get(capability)
 
+    def text_sync_kind(self) -> int:
+        # textDocumentSync is either a TextDocumentSyncKind or a TextDocumentSyncOptions object
+        sync = self.capabilities.get("textDocumentSync")
+        if isinstance(sync, dict):
+            return sync.get("change", TextDocumentSyncKindNone)
+        elif isinstance(sync, int):
+            return sync
+        return TextDocumentSyncKindFull if sync else TextDocumentSyncKindNone
+
+    def open_document(self, path: str, window_id: int, version: int) -> bool:
+        """Whether the window is the first to open the document, which is then opened in the server"""
+        windows = self._document_windows.setdefault(path, set())
+        is_first = not windows
+        windows.add(window_id)
+        if is_first:
+            self._document_versions[path] = version
+        return is_first
+
+    def close_document(self, path: str, window_id: int) -> bool:
+        """Whether the window was the last to have the document open, which is then closed in the server"""
+        windows = self._document_windows.get(path)
+        if not windows or window_id not in windows:
+            return False
+        windows.discard(window_id)
+        if windows:
+            return False
+        del self._document_windows[path]
+        self._document_versions.pop(path, None)
+        return True
+
+    def close_documents(self, window_id: int) -> 'List[str]':
+        """Closes the documents of the window, the paths of those no other window has open"""
+        return [path for path in list(self._document_windows) if self.close_document(path, window_id)]
+
+    def is_document_shared(self, path: str) -> bool:
+        return len(self._document_windows.get(path, ())) > 1
+
+    def next_document_version(self, path: str, version: int) -> int:
+        """The version to send for a change, after the last one sent from any window"""
+        last = self._document_versions.get(path)
+        if last is not None and version <= last:
+            version = last + 1
+        self._document_versions[path] = version
+        return version
+
+    def outstanding_requests(self) -> int:
+        return self.client.outstanding_requests() if self.client else 0
+
     def initialize(self):
         params = get_initialize_params(self.project_path, self.config)
         self.client.send_request(
@@ -172,7 +235,8 @@ class Session(object):
         self.state = ClientStates.STOPPING
         self.client.send_request(
             Request.shutdown(),
-            lambda result: self._handle_shutdown_result(result))
+            lambda result: self._handle_shutdown_result(result),
+            lambda error: self._handle_shutdown_result(None))
 
     def _handle_shutdown_result(self, result):
         self.client.exit()
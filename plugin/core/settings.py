@@ -1,5 +1,5 @@
 import sublime
-from .types import Settings, ClientConfig, LanguageConfig
+from .types import Settings, ClientConfig, LanguageConfig, syntax_matcher
 
 from debug_tools import getLogger
 log = getLogger(1, __name__)
@@ -51,6 +51,8 @@ def update_settings(settings: Settings, settings_obj: sublime.Settings):
     settings.auto_show_diagnostics_panel = read_bool_setting(settings_obj, "auto_show_diagnostics_panel", True)
     settings.auto_show_diagnostics_panel_level = read_int_setting(settings_obj, "auto_show_diagnostics_panel_level", 3)
     settings.show_diagnostics_phantoms = read_bool_setting(settings_obj, "show_diagnostics_phantoms", False)
+    settings.diagnostics_phantoms_in_viewport = read_bool_setting(settings_obj, "diagnostics_phantoms_in_viewport",
+                                                                  True)
     settings.show_diagnostics_count_in_view_status = read_bool_setting(settings_obj,
                                                                        "show_diagnostics_count_in_view_status", False)
     settings.show_diagnostics_in_view_status = read_bool_setting(settings_obj, "show_diagnostics_in_view_status", True)
@@ -66,12 +68,19 @@ def update_settings(settings: Settings, settings_obj: sublime.Settings):
     settings.only_show_lsp_completions = read_bool_setting(settings_obj, "only_show_lsp_completions", False)
     settings.complete_all_chars = read_bool_setting(settings_obj, "complete_all_chars", True)
     settings.completion_hint_type = read_str_setting(settings_obj, "completion_hint_type", "auto")
+    settings.completion_max_items = read_int_setting(settings_obj, "completion_max_items", 0)
     settings.complete_using_text_edit = read_bool_setting(settings_obj, "complete_using_text_edit", False)
     settings.resolve_completion_for_snippets = read_bool_setting(settings_obj, "resolve_completion_for_snippets", False)
     settings.log_debug = read_bool_setting(settings_obj, "log_debug", False)
     settings.log_server = read_bool_setting(settings_obj, "log_server", True)
     settings.log_stderr = read_bool_setting(settings_obj, "log_stderr", False)
     settings.log_payloads = read_bool_setting(settings_obj, "log_payloads", False)
+    settings.handler_dispatch = read_str_setting(settings_obj, "handler_dispatch", "worker")
+    settings.request_timeout = read_int_setting(settings_obj, "request_timeout", 60)
+    settings.request_timeouts = read_dict_setting(settings_obj, "request_timeouts", settings.request_timeouts)
+    settings.server_pool_size = read_int_setting(settings_obj, "server_pool_size", 0)
+    settings.server_pool_idle_timeout = read_int_setting(settings_obj, "server_pool_idle_timeout", 600)
+    settings.share_sessions_across_windows = read_bool_setting(settings_obj, "share_sessions_across_windows", False)
 
     settings.setLevel(settings.log_debug, 2)
     settings.setLevel(settings.log_server, 4)
@@ -85,6 +94,8 @@ class ClientConfigs(object):
         self._global_settings = dict()  # type: Dict[str, dict]
         self._external_configs = dict()  # type: Dict[str, ClientConfig]
         self.all = []  # type: List[ClientConfig]
+        # incremented whenever the configs are read again, for what is worked out from them to be worked out again
+        self.generation = 0
 
     def update(self, settings_obj: sublime.Settings):
         self._default_settings = read_dict_setting(settings_obj, "default_clients", {})
@@ -109,6 +120,11 @@ class ClientConfigs(object):
             merged_settings.update(user_settings)
             self.all.append(read_client_config(config_name, merged_settings))
 
+        for client_config in self.all:
+            for language in client_config.languages:
+                syntax_matcher(language.syntaxes)
+        self.generation += 1
+
         if settings.log_debug:
             client_enableds = list('{}={}'.format(c.name, c.enabled) for c in self.all)
         else:
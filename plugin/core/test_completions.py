@@ -0,0 +1,88 @@
+from .completions import (CompletionCache, CompletionFormatter, FormattedCompletions, filter_completions,
+                          fuzzy_score)
+from .protocol import CompletionItemKind
+import unittest
+
+ITEMS = [("getValue", "getValue"), ("setValue", "setValue"), ("get_value_or", "get_value_or"), ("other", "other")]
+
+
+class FuzzyScoreTests(unittest.TestCase):
+
+    def test_matches_characters_in_order(self):
+        self.assertIsNotNone(fuzzy_score("gv", "getValue"))
+        self.assertIsNotNone(fuzzy_score("GETV", "getValue"))
+        self.assertIsNone(fuzzy_score("vg", "getValue"))
+        self.assertIsNone(fuzzy_score("x", "getValue"))
+
+    def test_prefers_word_starts_and_consecutive_characters(self):
+        self.assertGreater(fuzzy_score("gv", "getValue"), fuzzy_score("gv", "giveaway"))
+        self.assertGreater(fuzzy_score("get", "getValue"), fuzzy_score("get", "gadget"))
+
+    def test_filters_and_ranks(self):
+        self.assertEqual(filter_completions(ITEMS, "gV"), ["getValue", "get_value_or"])
+        self.assertEqual(filter_completions(ITEMS, "gv"), ["get_value_or", "getValue"])
+        self.assertEqual(filter_completions(ITEMS, "val")[-1], "setValue")
+        self.assertEqual(filter_completions(ITEMS, ""), [completion for _, completion in ITEMS])
+
+
+class CompletionCacheTests(unittest.TestCase):
+
+    def test_filters_while_the_prefix_grows(self):
+        cache = CompletionCache()
+        cache.store(10, 4, "g", ITEMS, False)
+        self.assertEqual(cache.lookup(11, 4, "ge"), ["getValue", "get_value_or"])
+        self.assertEqual(cache.lookup(12, 4, "get_"), ["get_value_or"])
+
+    def test_misses_after_other_changes(self):
+        cache = CompletionCache()
+        cache.store(10, 4, "g", ITEMS, False)
+        self.assertIsNone(cache.lookup(11, 5, "ge"))
+        self.assertIsNone(cache.lookup(11, 4, "x"))
+        self.assertIsNone(cache.lookup(13, 4, "ge"))
+
+    def test_does_not_keep_incomplete_lists(self):
+        cache = CompletionCache()
+        cache.store(10, 4, "g", ITEMS, True)
+        self.assertIsNone(cache.lookup(10, 4, "g"))
+
+
+def make_item(label, **fields):
+    item = {"label": label}
+    item.update(fields)
+    return item
+
+
+class CompletionFormatterTests(unittest.TestCase):
+
+    def test_formats_hints(self):
+        item = make_item("value", detail="int", kind=CompletionItemKind.Variable)
+        self.assertEqual(CompletionFormatter("auto", False, 0, "").format(item), ("value\t  int", "value"))
+        self.assertEqual(CompletionFormatter("kind", False, 0, "").format(item), ("value\t  Variable", "value"))
+        self.assertEqual(CompletionFormatter("none", False, 0, "").format(item), ("value", "value"))
+        self.assertEqual(CompletionFormatter("auto", False, 0, "").format(make_item("$x", insertText="$y")),
+                         ("$y", "\\$y"))
+
+    def test_trims_text_edits_to_the_word_start(self):
+        # "$|", completing after the "$" of a line starting with an emoji taking two UTF-16 code units
+        formatter = CompletionFormatter("none", True, 3, "\U0001F600 $")
+        text_edit = {"newText": "$what", "range": {"start": {"line": 3, "character": 3},
+                                                   "end": {"line": 3, "character": 4}}}
+        self.assertEqual(formatter.format(make_item("$what", textEdit=text_edit)), ("what", "what"))
+        text_edit["range"]["start"]["line"] = 2
+        self.assertEqual(formatter.format(make_item("$what", textEdit=text_edit)), ("$what", "\\$what"))
+
+    def test_sorts_and_indexes_labels(self):
+        items = [make_item("b", sortText="2"), make_item("a", sortText="1", filterText="x"),
+                 make_item("b", sortText="3", detail="second")]
+        formatted = FormattedCompletions(items, CompletionFormatter("none", False, 0, ""), True)
+        self.assertEqual(formatted.completions, [("a", "a"), ("b", "b"), ("b", "b")])
+        self.assertEqual(formatted.filter_items[0], ("x", ("a", "a")))
+        self.assertIs(formatted.items_by_label["b"], items[0])
+
+    def test_keeps_the_first_items(self):
+        items = [make_item(str(i), sortText="{:03d}".format(i)) for i in reversed(range(100))]
+        formatter = CompletionFormatter("none", False, 0, "")
+        formatted = FormattedCompletions(items, formatter, False, 10)
+        self.assertTrue(formatted.truncated)
+        self.assertEqual([trigger for trigger, _ in formatted.completions], [str(i) for i in range(10)])
+        self.assertFalse(FormattedCompletions(items, formatter, False, 100).truncated)
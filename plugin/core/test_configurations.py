@@ -0,0 +1,151 @@
+from .configurations import WindowConfigManager, is_supported_syntax
+from .settings import client_configs
+from .types import ClientConfig, LanguageConfig, config_supports_syntax, syntax_matcher
+from .test_windows import MockView, MockSublimeSettings
+import unittest
+
+try:
+    from typing import List
+    assert List
+except ImportError:
+    pass
+
+python_language = LanguageConfig("python", ["source.python"], ["Packages/Python/Python.sublime-syntax"])
+python_config = ClientConfig("pyls", [], None, languages=[python_language])
+json_language = LanguageConfig("json", ["source.json"], ["JSON"])
+json_config = ClientConfig("json", [], None, languages=[json_language])
+
+
+class ScopedView(object):
+    """A view with a single scope, counting the selectors scored"""
+
+    def __init__(self, scope: str) -> None:
+        self.scope = scope
+        self.scored = []  # type: List[str]
+        self._settings = MockSublimeSettings({"syntax": "Packages/JavaScript/JSON.sublime-syntax"})
+
+    def id(self):
+        return 1
+
+    def settings(self):
+        return self._settings
+
+    def sel(self):
+        return [Region(0)]
+
+    def scope_name(self, point):
+        return self.scope
+
+    def score_selector(self, point, selector):
+        self.scored.append(selector)
+        return len(selector) if self.scope.startswith(selector) else 0
+
+
+class Region(object):
+    def __init__(self, point: int) -> None:
+        self.point = point
+
+    def begin(self):
+        return self.point
+
+
+def syntax_view(syntax: str) -> MockView:
+    view = MockView(__file__)
+    view.settings().set("syntax", syntax)
+    return view
+
+
+class SyntaxMatcherTests(unittest.TestCase):
+
+    def test_compiles_same_syntaxes_once(self):
+        self.assertIs(syntax_matcher(["JSON", "JavaScript"]), syntax_matcher(["JSON", "JavaScript"]))
+
+    def test_matches_syntax_names(self):
+        self.assertTrue(config_supports_syntax(json_config, "Packages/JavaScript/json.sublime-syntax"))
+        self.assertFalse(config_supports_syntax(json_config, "Packages/JSONX/JSONX.sublime-syntax"))
+
+
+class SupportedSyntaxTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configs = client_configs.all
+
+    def tearDown(self):
+        client_configs.all = self.configs
+        client_configs.generation += 1
+
+    def test_is_worked_out_again_for_new_configs(self):
+        client_configs.all = [json_config]
+        client_configs.generation += 1
+        self.assertTrue(is_supported_syntax("Packages/JavaScript/JSON.sublime-syntax"))
+        self.assertFalse(is_supported_syntax("Packages/Python/Python.sublime-syntax"))
+
+        client_configs.all = [python_config]
+        client_configs.generation += 1
+        self.assertFalse(is_supported_syntax("Packages/JavaScript/JSON.sublime-syntax"))
+        self.assertTrue(is_supported_syntax("Packages/Python/Python.sublime-syntax"))
+
+
+class WindowConfigManagerTests(unittest.TestCase):
+
+    def test_finds_configs_of_syntax(self):
+        manager = WindowConfigManager([python_config, json_config])
+        view = syntax_view("Packages/JavaScript/JSON.sublime-syntax")
+        self.assertEqual(manager.syntax_configs(view), [json_config])
+        self.assertTrue(manager.syntax_supported(view))
+        self.assertEqual(manager.syntax_config_languages(view), {"json": json_language})
+        self.assertFalse(manager.syntax_supported(syntax_view("Packages/Text/Plain text.tmLanguage")))
+
+    def test_leaves_out_disabled_configs(self):
+        config = ClientConfig("json", [], None, languages=[json_language])
+        manager = WindowConfigManager([config])
+        view = syntax_view("Packages/JavaScript/JSON.sublime-syntax")
+        self.assertTrue(manager.syntax_supported(view))
+        manager.disable("json")
+        self.assertFalse(manager.syntax_supported(view))
+        self.assertEqual(manager.syntax_configs(view), [])
+
+    def test_updates_configs_of_syntax(self):
+        manager = WindowConfigManager([json_config])
+        view = syntax_view("Packages/Python/Python.sublime-syntax")
+        self.assertFalse(manager.syntax_supported(view))
+        manager.update([python_config])
+        self.assertEqual(manager.syntax_configs(view), [python_config])
+
+
+class ScopeConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.settings_language = LanguageConfig("settings", ["source.json.sublime"], ["JSON"])
+        self.json_config = ClientConfig("json", [], None, languages=[json_language])
+        self.settings_config = ClientConfig("settings", [], None, languages=[self.settings_language])
+        self.manager = WindowConfigManager([self.json_config, self.settings_config])
+
+    def test_prefers_most_specific_scope(self):
+        view = ScopedView("source.json.sublime.settings")
+        self.assertIs(self.manager.scope_config(view), self.settings_config)
+        view.scope = "source.json"
+        self.assertIs(self.manager.scope_config(view), self.json_config)
+
+    def test_scores_scope_name_once(self):
+        view = ScopedView("source.json.sublime.settings")
+        self.assertIs(self.manager.scope_config(view), self.settings_config)
+        self.assertIs(self.manager.scope_config(view, 0), self.settings_config)
+        self.assertEqual(len(view.scored), 2)
+
+    def test_scores_again_for_new_syntax_or_configs(self):
+        view = ScopedView("source.json.sublime.settings")
+        self.manager.scope_config(view)
+        view.settings().set("syntax", "Packages/JavaScript/JSON (Sublime).sublime-syntax")
+        self.manager.scope_config(view)
+        self.assertEqual(len(view.scored), 4)
+        self.manager.update([self.json_config])
+        self.assertIs(self.manager.scope_config(view), self.json_config)
+
+    def test_falls_back_to_enabled_config(self):
+        view = ScopedView("source.json.sublime.settings")
+        self.assertIs(self.manager.scope_config(view), self.settings_config)
+        self.manager.disable("settings")
+        self.assertIs(self.manager.scope_config(view), self.json_config)
+        self.manager.disable("json")
+        self.assertIsNone(self.manager.scope_config(view))
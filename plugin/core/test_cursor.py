@@ -0,0 +1,74 @@
+from .cursor import CursorIdleListener, cursor_idle_handlers, cursor_moved_handlers
+from . import test_sublime as test_sublime
+import unittest
+
+try:
+    from typing import List, Tuple
+    assert List and Tuple
+except ImportError:
+    pass
+
+
+class CursorView(object):
+    def __init__(self) -> None:
+        self.selection = [test_sublime.Region(1, 1)]
+        self.changes = 0
+
+    def id(self):
+        return 1
+
+    def sel(self):
+        return self.selection
+
+    def change_count(self):
+        return self.changes
+
+    def is_valid(self):
+        return True
+
+    def window(self):
+        return None
+
+    def file_name(self):
+        return None
+
+    def move(self, point: int) -> None:
+        self.selection = [test_sublime.Region(point, point)]
+
+
+class CursorIdleListenerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []  # type: List[Tuple[str, int]]
+        self.idle_handlers = cursor_idle_handlers[:]
+        self.moved_handlers = cursor_moved_handlers[:]
+        cursor_idle_handlers[:] = [lambda view, point: self.calls.append(("idle", point))]
+        cursor_moved_handlers[:] = [lambda view, point: self.calls.append(("moved", point))]
+        self.view = CursorView()
+        self.listener = CursorIdleListener(self.view)
+
+    def tearDown(self):
+        cursor_idle_handlers[:] = self.idle_handlers
+        cursor_moved_handlers[:] = self.moved_handlers
+
+    def test_skips_position_it_rested_at(self):
+        self.listener.on_idle()
+        # clicking on the caret
+        self.listener.on_selection_modified_async()
+        self.listener.on_idle()
+        self.assertEqual(self.calls, [("idle", 1)])
+
+    def test_runs_again_after_moving_away_and_back(self):
+        self.listener.on_idle()
+        self.view.move(5)
+        self.listener.on_selection_modified_async()
+        self.view.move(1)
+        self.listener.on_selection_modified_async()
+        self.listener.on_idle()
+        self.assertEqual(self.calls, [("idle", 1), ("moved", 5), ("moved", 1), ("idle", 1)])
+
+    def test_runs_again_once_content_changed(self):
+        self.listener.on_idle()
+        self.view.changes += 1
+        self.listener.on_idle()
+        self.assertEqual(self.calls, [("idle", 1), ("idle", 1)])
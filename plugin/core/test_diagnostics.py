@@ -0,0 +1,137 @@
+from .diagnostics import (FileDiagnostics, update_file_diagnostics, global_diagnostics, get_window_severity_count,
+                          WIDE_DIAGNOSTIC_ROWS)
+from .protocol import Diagnostic, DiagnosticSeverity, Point, Range
+import random
+import sys
+import threading
+import unittest
+try:
+    from typing import Any, List, Dict, Tuple, Callable, Optional
+    assert Any and List and Dict and Tuple and Callable and Optional
+except ImportError:
+    pass
+
+
+def make_diagnostic(start_row: int, start_col: int, end_row: int, end_col: int,
+                    severity: int = DiagnosticSeverity.Error) -> Diagnostic:
+    return Diagnostic("message", Range(Point(start_row, start_col), Point(end_row, end_col)), severity, None, {})
+
+
+class MockWindow(object):
+    def __init__(self, window_id: int) -> None:
+        self._id = window_id
+
+    def id(self) -> int:
+        return self._id
+
+
+class FileDiagnosticsTests(unittest.TestCase):
+
+    def test_finds_diagnostics_on_line(self):
+        first = make_diagnostic(1, 0, 1, 5)
+        multiline = make_diagnostic(2, 4, 5, 0)
+        wide = make_diagnostic(0, 0, WIDE_DIAGNOSTIC_ROWS + 10, 0)
+        file_diagnostics = FileDiagnostics()
+        file_diagnostics.update("a", [multiline, wide])
+        file_diagnostics.update("b", [first])
+        self.assertEqual(file_diagnostics.on_line(1), [first, wide])
+        self.assertEqual(file_diagnostics.on_line(4), [multiline, wide])
+        self.assertEqual(file_diagnostics.on_line(WIDE_DIAGNOSTIC_ROWS + 11), [])
+
+    def test_finds_diagnostics_at_point(self):
+        diagnostic = make_diagnostic(2, 4, 3, 2)
+        file_diagnostics = FileDiagnostics()
+        file_diagnostics.update("a", [diagnostic])
+        self.assertEqual(file_diagnostics.at_point(2, 3), [])
+        self.assertEqual(file_diagnostics.at_point(2, 4), [diagnostic])
+        self.assertEqual(file_diagnostics.at_point(3, 2), [diagnostic])
+        self.assertEqual(file_diagnostics.at_point(3, 3), [])
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(42)
+        diagnostics = []
+        for i in range(500):
+            start = rng.randrange(0, 1000)
+            diagnostics.append(make_diagnostic(start, 0, start + rng.choice([0, 0, 1, 3, 40]), 1))
+        file_diagnostics = FileDiagnostics()
+        file_diagnostics.update("a", diagnostics)
+        for row in range(0, 1100, 7):
+            expected = [d for d in diagnostics if d.range.start.row <= row <= d.range.end.row]
+            self.assertEqual(sorted(map(id, file_diagnostics.on_line(row))), sorted(map(id, expected)))
+
+    def test_finds_diagnostics_in_rows(self):
+        before = make_diagnostic(1, 0, 2, 0)
+        overlapping = make_diagnostic(9, 0, 11, 0)
+        inside = make_diagnostic(12, 0, 12, 5)
+        wide = make_diagnostic(0, 0, WIDE_DIAGNOSTIC_ROWS + 20, 0)
+        after = make_diagnostic(30, 0, 30, 1)
+        file_diagnostics = FileDiagnostics()
+        file_diagnostics.update("a", [before, overlapping, inside, wide, after])
+        self.assertEqual(file_diagnostics.in_rows(10, 20), [overlapping, inside, wide])
+        self.assertEqual(file_diagnostics.in_rows(40, 50), [])
+
+    def test_counts_severities_after_updates(self):
+        file_diagnostics = FileDiagnostics()
+        file_diagnostics.update("a", [make_diagnostic(0, 0, 0, 1), make_diagnostic(1, 0, 1, 1)])
+        file_diagnostics.update("b", [make_diagnostic(0, 0, 0, 1, DiagnosticSeverity.Warning)])
+        self.assertEqual(file_diagnostics.count(DiagnosticSeverity.Error), 2)
+        self.assertEqual(file_diagnostics.count(DiagnosticSeverity.Warning), 1)
+        file_diagnostics.update("a", [])
+        self.assertEqual(file_diagnostics.count(DiagnosticSeverity.Error), 0)
+        self.assertEqual(len(file_diagnostics.all()), 1)
+
+
+class UpdateFileDiagnosticsTests(unittest.TestCase):
+
+    def test_adds_and_removes_files(self):
+        window = MockWindow(12345)
+        self.assertTrue(update_file_diagnostics(window, "/a.py", "pyls", [make_diagnostic(0, 0, 0, 1)]))
+        self.assertIn("/a.py", global_diagnostics[window.id()])
+        self.assertFalse(update_file_diagnostics(window, "/a.py", "other", []))
+        self.assertTrue(update_file_diagnostics(window, "/a.py", "pyls", []))
+        self.assertNotIn("/a.py", global_diagnostics[window.id()])
+        self.assertFalse(update_file_diagnostics(window, "/b.py", "pyls", []))
+        del global_diagnostics[window.id()]
+
+    def test_keeps_window_counts(self):
+        window = MockWindow(12346)
+        warning = make_diagnostic(0, 0, 0, 1, DiagnosticSeverity.Warning)
+        update_file_diagnostics(window, "/a.py", "pyls", [make_diagnostic(0, 0, 0, 1), warning])
+        update_file_diagnostics(window, "/a.py", "flake8", [make_diagnostic(1, 0, 1, 1)])
+        update_file_diagnostics(window, "/b.py", "pyls", [make_diagnostic(0, 0, 0, 1)])
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Error), 3)
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Warning), 1)
+
+        update_file_diagnostics(window, "/a.py", "pyls", [warning])
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Error), 2)
+        self.assertEqual(global_diagnostics[window.id()]["/a.py"].counts_by_source["pyls"],
+                         {DiagnosticSeverity.Warning: 1})
+
+        update_file_diagnostics(window, "/a.py", "pyls", [])
+        update_file_diagnostics(window, "/a.py", "flake8", [])
+        update_file_diagnostics(window, "/b.py", "pyls", [])
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Error), 0)
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Warning), 0)
+        del global_diagnostics[window.id()]
+
+    def test_keeps_window_counts_with_sources_publishing_at_once(self):
+        window = MockWindow(12347)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        def publish(source: str) -> None:
+            for i in range(2000):
+                update_file_diagnostics(window, "/a.py", source, [make_diagnostic(0, 0, 0, 1)] * (1 + i % 3))
+
+        try:
+            threads = [threading.Thread(target=publish, args=(source,)) for source in ("pyls", "flake8")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        # the last update of each source has 1 + 1999 % 3 diagnostics
+        self.assertEqual(get_window_severity_count(window, DiagnosticSeverity.Error), 4)
+        self.assertEqual(global_diagnostics[window.id()]["/a.py"].count(DiagnosticSeverity.Error), 4)
+        del global_diagnostics[window.id()]
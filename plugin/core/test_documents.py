@@ -1,6 +1,6 @@
 import unittest
 from .events import Events
-from .windows import WindowDocumentHandler
+from .windows import WindowDocumentHandler, get_content_change
 from .sessions import create_session, Session
 from .test_windows import MockWindow, MockView, MockConfigs
 from .test_session import test_config, MockClient, test_language
@@ -99,6 +99,37 @@ class WindowDocumentHandlerTests(unittest.TestCase):
         self.assertFalse(handler.has_document_state(__file__))
         self.assertEqual(len(client._notifications), 0)
 
+    def test_closes_shared_document_with_last_window(self):
+        events = Events()
+        client = MockClient()
+        session = self.assert_if_none(
+            create_session(test_config, "", dict(), MockSettings(),
+                           bootstrap_client=client))
+        views = []
+        handlers = []
+        for window_id in range(2):
+            view = MockView(__file__)
+            view._id = window_id + 1
+            window = MockWindow([[view]])
+            window._id = window_id
+            view.set_window(window)
+            handler = WindowDocumentHandler(test_sublime, MockSettings(), window, events, MockConfigs())
+            handler.add_session(session)
+            events.publish("view.on_activated_async", view)
+            views.append(view)
+            handlers.append(handler)
+        self.assertEqual([n.method for n in client._notifications], ["textDocument/didOpen"])
+
+        events.publish('view.on_close', views[1])
+        self.assertTrue(handlers[0].has_document_state(__file__))
+        self.assertFalse(handlers[1].has_document_state(__file__))
+        self.assertEqual(len(client._notifications), 1)
+
+        events.publish('view.on_close', views[0])
+        self.assertFalse(handlers[0].has_document_state(__file__))
+        self.assertEqual([n.method for n in client._notifications],
+                         ["textDocument/didOpen", "textDocument/didClose"])
+
     def test_sends_did_open_to_multiple_sessions(self):
         events = Events()
         view = MockView(__file__)
@@ -138,3 +169,68 @@ class WindowDocumentHandlerTests(unittest.TestCase):
             status_configs = status_string.split(", ")
             self.assertIn("test", status_configs)
             self.assertIn("test2", status_configs)
+
+    def test_sends_incremental_did_change(self):
+        events = Events()
+        view = MockView(__file__)
+        window = MockWindow([[view]])
+        view.set_window(window)
+        handler = WindowDocumentHandler(test_sublime, MockSettings(), window, events, MockConfigs())
+        client = MockClient()
+        client.responses['initialize'] = {"capabilities": {"textDocumentSync": {"openClose": True, "change": 2}}}
+        session = self.assert_if_none(
+            create_session(test_config, "", dict(), MockSettings(),
+                           bootstrap_client=client))
+        handler.add_session(session)
+        events.publish("view.on_activated_async", view)
+        self.assertEqual(len(client._notifications), 1)
+
+        view._text = "asdf\njklm"
+        events.publish("view.on_modified", view)
+        test_sublime._run_timeout()
+        self.assertEqual(len(client._notifications), 2)
+        did_change = client._notifications[1]
+        self.assertEqual(did_change.params["textDocument"].get("version"), 1)
+        self.assertEqual(did_change.params["contentChanges"], [{
+            "range": {"start": {"line": 0, "character": 4}, "end": {"line": 0, "character": 4}},
+            "text": "\njklm"
+        }])
+
+
+class ContentChangeTests(unittest.TestCase):
+
+    def assert_applies(self, old, new):
+        change = get_content_change(old, new)
+        lines = old.split("\n")
+        start, end = change["range"]["start"], change["range"]["end"]
+        before = "\n".join(lines[:start["line"]] + [lines[start["line"]][:start["character"]]])
+        after = "\n".join([lines[end["line"]][end["character"]:]] + lines[end["line"] + 1:])
+        self.assertEqual(before + change["text"] + after, new)
+
+    def test_insertion(self):
+        change = get_content_change("hello world", "hello big world")
+        self.assertEqual(change["range"], {"start": {"line": 0, "character": 6}, "end": {"line": 0, "character": 6}})
+        self.assertEqual(change["text"], "big ")
+
+    def test_deletion_across_lines(self):
+        change = get_content_change("one\ntwo\nthree", "one\nthree")
+        self.assertEqual(change["range"], {"start": {"line": 1, "character": 1}, "end": {"line": 2, "character": 1}})
+        self.assertEqual(change["text"], "")
+
+    def test_identical_content(self):
+        change = get_content_change("same\ntext", "same\ntext")
+        self.assertEqual(change["range"], {"start": {"line": 1, "character": 4}, "end": {"line": 1, "character": 4}})
+        self.assertEqual(change["text"], "")
+
+    def test_counts_utf16_code_units(self):
+        change = get_content_change("a\U0001F600b\nc", "a\U0001F600xb\nc")
+        self.assertEqual(change["range"], {"start": {"line": 0, "character": 3}, "end": {"line": 0, "character": 3}})
+        self.assertEqual(change["text"], "x")
+
+    def test_changes_in_large_content(self):
+        old = "\n".join("line {}".format(i) for i in range(5000))
+        self.assert_applies(old, old.replace("line 10\n", "line ten\n").replace("line 4990", "end"))
+        self.assert_applies(old, "prefix " + old + " suffix")
+        self.assert_applies(old, "")
+        self.assert_applies("", old)
+        self.assert_applies("aaaa", "aa")
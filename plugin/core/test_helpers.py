@@ -0,0 +1,65 @@
+from .helpers import Scheduler
+import unittest
+try:
+    from typing import List, Tuple, Callable
+    assert List and Tuple and Callable
+except ImportError:
+    pass
+
+
+class FakeTimeouts(object):
+    """A timeout queue with a clock that only moves when timeouts are run"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.timeouts = []  # type: List[Tuple[float, Callable[[], None]]]
+
+    def set_timeout_async(self, callback: 'Callable[[], None]', delay_ms: int) -> None:
+        self.timeouts.append((self.now + delay_ms / 1000, callback))
+
+    def advance(self, seconds: float) -> None:
+        end = self.now + seconds
+        while True:
+            due = [timeout for timeout in self.timeouts if timeout[0] <= end]
+            if not due:
+                break
+            timeout = min(due, key=lambda timeout: timeout[0])
+            self.timeouts.remove(timeout)
+            self.now = timeout[0]
+            timeout[1]()
+        self.now = end
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.timeouts = FakeTimeouts()
+        self.scheduler = Scheduler(self.timeouts.set_timeout_async, lambda: self.timeouts.now)
+        self.calls = []  # type: List[str]
+
+    def test_debounces_per_key(self):
+        for i in range(10):
+            self.scheduler.debounce("a", 500, lambda i=i: self.calls.append("a{}".format(i)))
+            self.scheduler.debounce("b", 500, lambda: self.calls.append("b"))
+            self.timeouts.advance(0.1)
+        # one timeout pending per key, however many calls were made
+        self.assertEqual(len(self.timeouts.timeouts), 2)
+        self.timeouts.advance(0.3)
+        self.assertEqual(self.calls, [])
+        self.timeouts.advance(0.2)
+        self.assertEqual(self.calls, ["a9", "b"])
+        self.assertEqual(self.timeouts.timeouts, [])
+
+    def test_throttles(self):
+        for i in range(10):
+            self.scheduler.throttle("a", 300, lambda i=i: self.calls.append(str(i)))
+            self.timeouts.advance(0.125)
+        self.timeouts.advance(1)
+        # right away, then the last call made at most every 300 ms
+        self.assertEqual(self.calls, ["0", "2", "4", "7", "9"])
+
+    def test_cancels(self):
+        self.scheduler.debounce("a", 500, lambda: self.calls.append("a"))
+        self.scheduler.cancel("a")
+        self.timeouts.advance(1)
+        self.assertEqual(self.calls, [])
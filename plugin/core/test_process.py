@@ -0,0 +1,109 @@
+from . import process as process_module
+from .process import ProcessPool, start_server
+from .types import Settings
+import os
+import sys
+import unittest
+import unittest.mock
+
+try:
+    from typing import Any, List, Callable
+    assert Any and List and Callable
+except ImportError:
+    pass
+
+SERVER = [sys.executable, "-c", "import sys; sys.stdin.read()"]
+
+
+class FakeClock(object):
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.timeouts = []  # type: List[Callable[[], None]]
+
+    def __call__(self) -> float:
+        return self.now
+
+    def set_timeout_async(self, callback: 'Callable[[], None]', delay_ms: int) -> None:
+        self.timeouts.append(callback)
+
+
+class ProcessPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = Settings()
+        self.settings.server_pool_size = 1
+        self.settings.server_pool_idle_timeout = 10
+        self.clock = FakeClock()
+        self.pool = ProcessPool(self.settings, self.clock.set_timeout_async, self.clock)
+        self.processes = []  # type: List[Any]
+
+    def tearDown(self):
+        self.idle_processes()
+        self.pool.clear()
+        for process in self.processes:
+            process.kill()
+            process.wait()
+            process.stdin.close()
+            process.stdout.close()
+
+    def take(self, working_dir: str = os.path.dirname(__file__)) -> 'Any':
+        process = self.pool.take(SERVER, working_dir, {}, False)
+        self.processes.append(process)
+        return process
+
+    def idle_processes(self) -> 'List[Any]':
+        processes = [waiting.process for idle in self.pool._idle.values() for waiting in idle]
+        self.processes.extend(process for process in processes if process not in self.processes)
+        return processes
+
+    def test_takes_process_started_ahead(self):
+        first = self.take()
+        waiting = self.idle_processes()
+        self.assertEqual(len(waiting), 1)
+        self.assertIsNot(waiting[0], first)
+        self.assertIs(self.take(), waiting[0])
+        self.assertEqual(len(self.idle_processes()), 1)
+
+    def test_starts_process_for_other_project(self):
+        self.take()
+        waiting = self.idle_processes()
+        self.assertEqual(len(waiting), 1)
+        self.assertNotIn(self.take(os.path.dirname(os.path.dirname(__file__))), waiting)
+        self.assertEqual(len(self.idle_processes()), 2)
+
+    def test_skips_exited_processes(self):
+        self.take()
+        waiting = self.idle_processes()[0]
+        waiting.kill()
+        waiting.wait()
+        self.assertIsNot(self.take(), waiting)
+
+    def test_returns_process_when_starting_ahead_fails(self):
+        started = []  # type: List[Any]
+
+        def start_once(*args: 'Any') -> 'Any':
+            if started:
+                raise OSError("too many open files")
+            started.append(start_server(*args))
+            return started[0]
+
+        with unittest.mock.patch.object(process_module, "start_server", start_once):
+            self.assertIs(self.take(), started[0])
+        self.assertEqual(self.idle_processes(), [])
+
+    def test_terminates_processes_left_waiting(self):
+        self.take()
+        waiting = self.idle_processes()[0]
+        self.clock.now = 5
+        self.clock.timeouts.pop()()
+        self.assertEqual(self.idle_processes(), [waiting])
+        self.clock.now = 10
+        self.pool.evict_idle()
+        self.assertEqual(self.idle_processes(), [])
+        self.assertIsNotNone(waiting.wait(5))
+
+    def test_starts_nothing_ahead_by_default(self):
+        self.settings.server_pool_size = 0
+        self.take()
+        self.assertEqual(self.idle_processes(), [])
+        self.assertEqual(self.clock.timeouts, [])
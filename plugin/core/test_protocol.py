@@ -61,6 +61,17 @@ class DiagnosticTests(unittest.TestCase):
         self.assertEqual(diag.source, 'pyls')
         self.assertEqual(diag.to_lsp(), LSP_FULL_DIAGNOSTIC)
 
+    def test_keeps_other_keys(self):
+        lsp_diagnostic = dict(LSP_FULL_DIAGNOSTIC, code="E501", relatedInformation=[])
+        diag = Diagnostic.from_lsp(lsp_diagnostic)
+        self.assertFalse(hasattr(diag, "__dict__"))
+        self.assertEqual(diag.to_lsp(), lsp_diagnostic)
+
+    def test_interns_source(self):
+        first = Diagnostic.from_lsp(dict(LSP_FULL_DIAGNOSTIC, source="".join(["py", "ls"])))
+        second = Diagnostic.from_lsp(dict(LSP_FULL_DIAGNOSTIC, source="".join(["py", "ls"])))
+        self.assertIs(first.source, second.source)
+
 
 class RequestTests(unittest.TestCase):
 
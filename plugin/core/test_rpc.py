@@ -1,9 +1,12 @@
-from .rpc import (format_request, Client)
+from .rpc import (format_request, Client, MessageDispatcher, AsyncExecutor, TimerWheel, CANCELLED_REQUEST_TTL,
+                  percentile)
 from .transports import Transport
 from .protocol import (Request, Notification)
 from .types import Settings
 import unittest
 import json
+import threading
+import time
 try:
     from typing import Any, List, Dict, Tuple, Callable, Optional
     assert Any and List and Dict and Tuple and Callable and Optional
@@ -44,7 +47,7 @@ def notify_pong(message):
 
 class MockTransport(Transport):
     def __init__(self, responder=None):
-        self.messages = []  # type: List[str]
+        self.messages = []  # type: List[bytes]
         self.responder = responder
 
     def start(self, on_receive, on_closed):
@@ -67,7 +70,13 @@ class MockTransport(Transport):
 class FormatTests(unittest.TestCase):
 
     def test_converts_payload_to_string(self):
-        self.assertEqual("Content-Length: 2\r\n\r\n{}", format_request(dict()))
+        self.assertEqual(b"Content-Length: 2\r\n\r\n{}", format_request(dict()))
+
+    def test_counts_content_length_in_bytes(self):
+        message = format_request({"text": "äöü"})
+        header, content = message.split(b"\r\n\r\n")
+        self.assertEqual(header, "Content-Length: {}".format(len(content)).encode("ascii"))
+        self.assertEqual(json.loads(content.decode("UTF-8")), {"text": "äöü"})
 
 
 class ClientTest(unittest.TestCase):
@@ -206,3 +215,171 @@ class ClientTest(unittest.TestCase):
         client.send_request(req, lambda resp: raise_error('handler failed'))
         # exception would fail test if not handled in client
         self.assertEqual(len(client._response_handlers), 0)
+
+    def test_cancels_request(self):
+        transport = MockTransport()
+        client = Client(transport, MockSettings())
+        responses = []  # type: List[Any]
+        errors = []  # type: List[Any]
+        client.set_error_display_handler(lambda err: errors.append(err))
+        handle = client.send_request(Request.complete(dict()), lambda resp: responses.append(resp))
+        self.assertTrue(handle.cancel())
+        self.assertEqual(len(client._response_handlers), 0)
+        self.assertIn(b'"method": "$/cancelRequest"', transport.messages[-1])
+        self.assertIn('"id": {}'.format(handle.request_id).encode("ascii"), transport.messages[-1])
+
+        # cancelling twice does not notify the server again
+        self.assertFalse(handle.cancel())
+        self.assertEqual(len(transport.messages), 2)
+
+        # a late response is dropped silently
+        transport.receive('{"id": 1, "error": {"code": -32800, "message": "cancelled"}}')
+        self.assertEqual(len(responses), 0)
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(len(client._cancelled_requests), 0)
+
+    def test_cannot_cancel_answered_request(self):
+        transport = MockTransport()
+        client = Client(transport, MockSettings())
+        handle = client.send_request(Request.complete(dict()), lambda resp: None)
+        transport.receive('{{"id": {}, "result": null}}'.format(handle.request_id))
+        self.assertFalse(handle.cancel())
+        self.assertEqual(len(transport.messages), 1)
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_decodes_and_handles_off_reader_thread(self):
+        transport = MockTransport()
+        dispatcher = MessageDispatcher("test dispatcher")
+        client = Client(transport, MockSettings(), dispatcher)
+        handled = threading.Event()
+        threads = []  # type: List[threading.Thread]
+
+        def on_pong(params):
+            threads.append(threading.current_thread())
+            handled.set()
+
+        client.on_notification("pong", on_pong)
+        transport.receive(b'{"method": "pong"}')
+        self.assertTrue(handled.wait(5))
+        self.assertNotEqual(threads[0], threading.current_thread())
+        self.assertEqual(client.dispatch_stats()["decoded"], 1)
+        dispatcher.stop()
+
+    def test_marshals_handlers_to_executor(self):
+        scheduled = []  # type: List[Callable]
+        transport = MockTransport(return_empty_dict_result)
+        executor = AsyncExecutor(lambda callback, delay: scheduled.append(callback))
+        dispatcher = MessageDispatcher("test dispatcher", executor)
+        client = Client(transport, MockSettings(), dispatcher)
+        responses = []  # type: List[Any]
+        client.on_notification("pong", lambda params: responses.append("pong"))
+        client.send_request(Request.initialize(dict()), lambda resp: responses.append(resp))
+        transport.receive('{"method": "pong"}')
+        dispatcher.stop()
+        dispatcher.decoder._thread.join(5)
+
+        stats = client.dispatch_stats()
+        self.assertEqual(stats["handlers_pending"], 2)
+        self.assertEqual(stats["handlers_max_pending"], 2)
+        self.assertEqual(len(responses), 0)
+        for callback in scheduled:
+            callback()
+        self.assertEqual(responses, [{}, "pong"])
+        self.assertEqual(client.dispatch_stats()["handlers_pending"], 0)
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def test_timer_wheel_expires_due_keys(self):
+        wheel = TimerWheel(resolution=1.0, slots=4, clock=lambda: 0.0)
+        wheel.schedule("a", 1.5)
+        wheel.schedule("b", 3.0)
+        wheel.schedule("c", 9.0)  # wraps around the wheel
+        wheel.schedule("d", 2.0)
+        self.assertTrue(wheel.cancel("d"))
+        self.assertEqual(wheel.expire(1.0), [])
+        self.assertEqual(wheel.expire(2.0), ["a"])
+        self.assertEqual(wheel.expire(5.0), ["b"])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.expire(20.0), ["c"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_timer_wheel_expires_short_deadline_scheduled_after_long_one(self):
+        now = 100.0
+        wheel = TimerWheel(resolution=1.0, slots=128, clock=lambda: now)
+        wheel.schedule("a", now + 60)
+        wheel.schedule("b", now + 5)
+        self.assertEqual(wheel.expire(now + 1), [])
+        self.assertEqual(wheel.expire(now + 5), ["b"])
+        self.assertEqual(wheel.expire(now + 60), ["a"])
+
+    def test_timer_wheel_expires_passed_deadline_next(self):
+        wheel = TimerWheel(resolution=1.0, slots=4, clock=lambda: 10.0)
+        wheel.schedule("a", 2.0)
+        self.assertEqual(wheel.expire(10.0), ["a"])
+
+    def test_times_out_request(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        settings.request_timeouts = {"initialize": 0, "textDocument/hover": 5}
+        client = Client(transport, settings)
+        errors = []  # type: List[Dict[str, Any]]
+        client.send_request(Request.hover(dict()), lambda resp: None, lambda err: errors.append(err))
+        client.send_request(Request.initialize(dict()), lambda resp: None)
+        self.assertEqual(client.outstanding_requests(), 2)
+
+        now = time.monotonic()
+        client.expire_requests(now + 1)
+        self.assertEqual(errors, [])
+        client.expire_requests(now + 6)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("timed out", errors[0]["message"])
+        self.assertEqual(client.outstanding_requests(), 1)
+        self.assertIn(b'"$/cancelRequest"', transport.messages[-1])
+
+        # a response that never comes is forgotten as well
+        self.assertEqual(len(client._cancelled_requests), 1)
+        client.expire_requests(now + 6 + CANCELLED_REQUEST_TTL)
+        self.assertEqual(len(client._cancelled_requests), 0)
+        self.assertEqual(len(client._timeouts), 0)
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_records_sizes_and_latencies_per_method(self):
+        transport = MockTransport()
+        client = Client(transport, MockSettings())
+        client.send_request(Request.initialize(dict()), lambda resp: None)
+        transport.receive(return_empty_dict_result(None))
+        client.send_notification(Notification.initialized())
+        transport.receive('{"method": "window/logMessage", "params": {"message": "hi"}}')
+
+        stats = client.stats.snapshot()
+        self.assertEqual(stats["initialize"]["sent"], 1)
+        self.assertEqual(stats["initialize"]["sent_bytes"], len(transport.messages[0]))
+        self.assertEqual(stats["initialize"]["received"], 1)
+        self.assertEqual(stats["initialize"]["received_bytes"], len(return_empty_dict_result(None)))
+        self.assertGreaterEqual(stats["initialize"]["p99"], stats["initialize"]["p50"])
+        self.assertEqual(stats["initialized"]["sent"], 1)
+        self.assertEqual(stats["window/logMessage"]["received"], 1)
+
+    def test_records_synchronous_responses(self):
+        client = Client(MockTransport(return_empty_dict_result), MockSettings())
+        client.send_request(Request.initialize(dict()), lambda resp: None)
+        self.assertEqual(client.stats.snapshot()["initialize"]["received"], 1)
+
+    def test_counts_cancelled_requests(self):
+        client = Client(MockTransport(), MockSettings())
+        client.send_request(Request.hover(dict()), lambda resp: None).cancel()
+        client.receive_payload('{"id": 1, "result": null}')
+        stats = client.stats.snapshot()["textDocument/hover"]
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertEqual(stats["received"], 0)
+
+    def test_percentile(self):
+        samples = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 0.5), 50.0)
+        self.assertEqual(percentile(samples, 0.99), 99.0)
+        self.assertEqual(percentile([], 0.5), 0.0)
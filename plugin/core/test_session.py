@@ -102,3 +102,19 @@ class SessionTest(unittest.TestCase):
         self.assertFalse(session.has_capability("testing"))
         self.assertIsNone(session.get_capability("testing"))
         ended_callback.assert_called_once()
+
+    def test_opens_document_once_for_all_windows(self):
+        session = self.assert_if_none(
+            create_session(test_config, "/", dict(), Settings(), bootstrap_client=MockClient()))
+
+        self.assertTrue(session.open_document("/a.py", 1, 0))
+        self.assertFalse(session.open_document("/a.py", 2, 0))
+        self.assertTrue(session.is_document_shared("/a.py"))
+        self.assertEqual(session.next_document_version("/a.py", 1), 1)
+        # the other window's document is behind the version last sent
+        self.assertEqual(session.next_document_version("/a.py", 1), 2)
+
+        self.assertFalse(session.close_document("/a.py", 1))
+        self.assertFalse(session.is_document_shared("/a.py"))
+        self.assertEqual(session.close_documents(2), ["/a.py"])
+        self.assertTrue(session.open_document("/a.py", 1, 0))
@@ -0,0 +1,134 @@
+from .transports import ContentLengthFramer, MIN_READ_SIZE, StdioTransport, take_messages, connect_tcp
+from queue import Queue
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+try:
+    from typing import Any, List, Dict, Tuple, Callable, Optional
+    assert Any and List and Dict and Tuple and Callable and Optional
+except ImportError:
+    pass
+
+
+def frame(content: bytes) -> bytes:
+    return b"Content-Length: " + str(len(content)).encode("ascii") + b"\r\n\r\n" + content
+
+
+class ChunkedReader(object):
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._position = 0
+        self.reads = 0
+
+    def readinto(self, view) -> int:
+        self.reads += 1
+        chunk = self._data[self._position:self._position + len(view)]
+        view[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+
+class ContentLengthFramerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = []  # type: List[bytes]
+        self.framer = ContentLengthFramer(self.messages.append)
+
+    def test_parses_single_message(self):
+        self.framer.feed(frame(b'{"id": 1}'))
+        self.assertEqual(self.messages, [b'{"id": 1}'])
+
+    def test_parses_multiple_messages_in_one_chunk(self):
+        self.framer.feed(frame(b'{"id": 1}') + frame(b'{"id": 2}') + b"Content-Le")
+        self.assertEqual(self.messages, [b'{"id": 1}', b'{"id": 2}'])
+        self.framer.feed(b"ngth: 2\r\n\r\n{}")
+        self.assertEqual(self.messages, [b'{"id": 1}', b'{"id": 2}', b'{}'])
+
+    def test_parses_byte_by_byte(self):
+        data = frame(b'{"id": 1}') + frame('{"text": "äöü"}'.encode("UTF-8"))
+        for i in range(0, len(data)):
+            self.framer.feed(data[i:i + 1])
+        self.assertEqual(self.messages, [b'{"id": 1}', '{"text": "äöü"}'.encode("UTF-8")])
+
+    def test_ignores_additional_headers(self):
+        self.framer.feed(b"Content-Length: 2\r\nContent-Type: application/vscode-jsonrpc; charset=utf-8\r\n\r\n{}")
+        self.assertEqual(self.messages, [b'{}'])
+
+    def test_reads_large_messages(self):
+        large = json.dumps({"result": ["symbol{}".format(i) for i in range(100000)]}).encode("UTF-8")
+        reader = ChunkedReader(frame(b'{}') + frame(large) + frame(b'{"id": 3}'))
+        while self.framer.read_from(reader.readinto):
+            pass
+        self.assertEqual(self.messages, [b'{}', large, b'{"id": 3}'])
+        # read size grows while the large message is received
+        self.assertGreater(self.framer.read_size, MIN_READ_SIZE)
+        self.assertLess(reader.reads, len(large) // MIN_READ_SIZE)
+
+
+class TakeMessagesTests(unittest.TestCase):
+
+    def test_takes_all_queued_messages(self):
+        queue = Queue()  # type: Queue
+        for message in (b"a", b"b", b"c"):
+            queue.put(message)
+        self.assertEqual(take_messages(queue), ([b"a", b"b", b"c"], False))
+        self.assertTrue(queue.empty())
+
+    def test_stops_after_queued_messages(self):
+        queue = Queue()  # type: Queue
+        queue.put(b"a")
+        queue.put(None)
+        queue.put(b"b")
+        self.assertEqual(take_messages(queue), ([b"a"], True))
+
+
+class StdioTransportTests(unittest.TestCase):
+
+    def test_closes_when_process_exits(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        transport = StdioTransport(process)
+        closed = threading.Event()
+        transport.start(lambda message: None, closed.set)
+        self.assertTrue(closed.wait(5))
+        transport.write_thread.join(5)
+        self.assertFalse(transport.write_thread.is_alive())
+        transport.close()  # closing again does nothing
+        process.wait()
+
+
+def free_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("localhost", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class ConnectTcpTests(unittest.TestCase):
+
+    def test_connects_once_server_listens(self):
+        port = free_port()
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        def listen_later():
+            time.sleep(0.2)
+            server.bind(("localhost", port))
+            server.listen(1)
+
+        listener = threading.Thread(target=listen_later)
+        listener.start()
+        sock = connect_tcp("localhost", port)
+        self.assertIsNone(sock.gettimeout())
+        sock.close()
+        listener.join()
+        server.close()
+
+    def test_gives_up_after_timeout(self):
+        started = time.monotonic()
+        with self.assertRaises(Exception):
+            connect_tcp("localhost", free_port(), 0.3)
+        self.assertLess(time.monotonic() - started, 2)
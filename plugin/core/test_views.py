@@ -0,0 +1,97 @@
+from .views import LineIndex, utf16_length, offset_to_point, point_to_offset
+from .protocol import Point
+from . import test_sublime as test_sublime
+import unittest
+
+# "😀" and "𝄞" are outside the Basic Multilingual Plane, two UTF-16 code units each
+TEXT = "ab\n😀x𝄞y\n\nlast"
+
+
+class TextView(object):
+    """A view of a text, reading nothing but the lines asked for"""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.read = 0
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        self.read += region.b - region.a
+        return self.text[region.a:region.b]
+
+    def line(self, point):
+        start = self.text.rfind("\n", 0, point) + 1
+        end = self.text.find("\n", point)
+        return test_sublime.Region(start, len(self.text) if end < 0 else end)
+
+    def rowcol(self, point):
+        start = self.text.rfind("\n", 0, point) + 1
+        return self.text.count("\n", 0, point), point - start
+
+    def text_point(self, row, col):
+        start = 0
+        for _ in range(row):
+            start = self.text.index("\n", start) + 1
+        return start + col
+
+
+class LineIndexTests(unittest.TestCase):
+
+    def test_converts_ascii_positions(self):
+        index = LineIndex("one\ntwo\n")
+        self.assertEqual(index.offset(1, 1), 5)
+        self.assertEqual(index.offset(2, 0), 8)
+        self.assertEqual(index.point(5).to_lsp(), {"line": 1, "character": 1})
+        self.assertEqual(index.point(8).to_lsp(), {"line": 2, "character": 0})
+
+    def test_counts_utf16_code_units(self):
+        index = LineIndex(TEXT)
+        # the second line starts at offset 3: 😀 is offset 3, x 4, 𝄞 5, y 6
+        self.assertEqual(index.offset(1, 0), 3)
+        self.assertEqual(index.offset(1, 2), 4)
+        self.assertEqual(index.offset(1, 3), 5)
+        self.assertEqual(index.offset(1, 5), 6)
+        self.assertEqual(index.point(4).to_lsp(), {"line": 1, "character": 2})
+        self.assertEqual(index.point(6).to_lsp(), {"line": 1, "character": 5})
+        self.assertEqual(index.point(7).to_lsp(), {"line": 1, "character": 6})
+
+    def test_round_trips_every_offset(self):
+        index = LineIndex(TEXT)
+        for offset in range(len(TEXT) + 1):
+            point = index.point(offset)
+            self.assertEqual(index.offset(point.row, point.col), offset)
+
+    def test_clamps_positions(self):
+        index = LineIndex(TEXT)
+        # between the two code units of 😀
+        self.assertEqual(index.offset(1, 1), 3)
+        self.assertEqual(index.offset(0, 100), 2)
+        self.assertEqual(index.offset(1, 100), 7)
+        self.assertEqual(index.offset(10, 0), len(TEXT))
+        self.assertEqual(index.point(1000).to_lsp(), {"line": 3, "character": 4})
+
+    def test_utf16_length(self):
+        self.assertEqual(utf16_length(TEXT, 3, 7), 6)
+        self.assertEqual(utf16_length(TEXT, 0, 2), 2)
+
+
+class SinglePositionTests(unittest.TestCase):
+
+    def test_converts_from_the_line_only(self):
+        view = TextView("first line\n" * 1000 + TEXT)
+        start = len("first line\n") * 1000
+        self.assertEqual(offset_to_point(view, start + 7).to_lsp(), {"line": 1001, "character": 6})
+        self.assertEqual(point_to_offset(Point(1001, 5), view), start + 6)
+        self.assertLess(view.read, 20)
+
+    def test_matches_line_index(self):
+        view = TextView(TEXT)
+        index = LineIndex(TEXT)
+        for offset in range(len(TEXT) + 1):
+            self.assertEqual(offset_to_point(view, offset).to_lsp(), index.point(offset).to_lsp())
+            point = index.point(offset)
+            self.assertEqual(point_to_offset(point, view), offset)
+        self.assertEqual(point_to_offset(Point(10, 0), view), len(TEXT))
+        self.assertEqual(point_to_offset(Point(1, 1), view), 3)
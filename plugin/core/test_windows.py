@@ -1,11 +1,13 @@
-from .windows import WindowManager, WindowRegistry, WindowLike, ViewLike
+from .windows import WindowManager, WindowRegistry, WindowLike, ViewLike, SharedSessions
 from .sessions import create_session, Session
 from .test_session import MockClient, test_config, test_language
 from .test_rpc import MockSettings
 from .events import global_events
-from .types import ClientConfig, LanguageConfig
+from .configurations import WindowConfigManager
+from .types import ClientConfig, ClientStates, LanguageConfig, Settings
 from . import test_sublime as test_sublime
 # from .logging import set_debug_logging, debug
+from concurrent.futures import ThreadPoolExecutor
 import os
 import tempfile
 import unittest
@@ -36,6 +38,7 @@ class MockView(object):
         self._settings = MockSublimeSettings({"syntax": "Plain Text"})
         self._status = dict()  # type: Dict[str, str]
         self._text = "asdf"
+        self._id = 1
 
     def file_name(self):
         return self._file_name
@@ -64,8 +67,14 @@ class MockView(object):
     def score_selector(self, region, scope: str) -> int:
         return 1
 
+    def scope_name(self, point) -> str:
+        return "source.test"
+
+    def id(self):
+        return self._id
+
     def buffer_id(self):
-        return 1
+        return self._id
 
 
 class MockHandlerDispatcher(object):
@@ -87,9 +96,10 @@ class MockWindow(object):
         self._folders = [os.path.dirname(__file__)]
         self._default_view = MockView(None)
         self.commands = []  # type: List[Tuple[str, Dict[str, Any]]]
+        self._id = 0
 
     def id(self):
-        return 0
+        return self._id
 
     def folders(self):
         return self._folders
@@ -392,3 +402,122 @@ class WindowManagerTests(unittest.TestCase):
 
         # client_start_listeners, client_initialization_listeners,
         self.assertTrue(test_config.name in dispatcher._initialized)
+
+    def test_snapshots_view_capabilities(self):
+        view = MockView(__file__)
+        wm = WindowManager(MockWindow([[view]]), MockConfigs(), MockDocuments(),
+                           MockDiagnostics(), mock_start_session, test_sublime, MockHandlerDispatcher())
+        snapshot = wm.view_capabilities(view)
+        self.assertIs(snapshot.config, test_config)
+        self.assertFalse(snapshot.has_capability("hoverProvider"))
+
+        wm.start_active_views()
+        snapshot = wm.view_capabilities(view)
+        self.assertTrue(snapshot.has_capability("hoverProvider"))
+        self.assertFalse(snapshot.has_capability("renameProvider"))
+        self.assertIs(wm.view_capabilities(view), snapshot)
+
+        wm.end_sessions()
+        self.assertIsNone(wm.get_session(test_config.name))
+        self.assertFalse(wm.view_capabilities(view).has_capability("hoverProvider"))
+
+    def test_snapshot_drops_config_failing_to_start(self):
+        def start_session(window, project_path, config, on_created, on_ended):
+            # the sessions end while the server starts, the window no longer waits for it
+            wm.end_sessions()
+            raise Exception("no such server")
+
+        config = ClientConfig("failing", [], None, languages=[test_language])
+        view = MockView(__file__)
+        wm = WindowManager(MockWindow([[view]]), WindowConfigManager([config]), MockDocuments(),
+                           MockDiagnostics(), start_session, test_sublime, MockHandlerDispatcher())
+        self.assertIs(wm.view_capabilities(view).config, config)
+        wm.start_active_views()
+        self.assertIsNone(wm.view_capabilities(view).config)
+
+    def test_starts_sessions_on_pool(self):
+        pool = ThreadPoolExecutor(max_workers=2)
+        docs = MockDocuments()
+        wm = WindowManager(MockWindow([[MockView(__file__)]]), MockConfigs(), docs, MockDiagnostics(),
+                           mock_start_session, test_sublime, MockHandlerDispatcher(), start_pool=pool)
+        ready = []  # type: List[Session]
+        self.assertTrue(wm.when_ready(None, ready.append))
+        wm.start_active_views()
+        pool.shutdown(wait=True)
+
+        session = wm.get_session(test_config.name)
+        self.assertIsNotNone(session)
+        self.assertEqual(ready, [session])
+        self.assertEqual(len(docs._sessions), 1)
+        self.assertFalse(wm.when_ready(test_config.name, ready.append))
+        self.assertEqual(ready, [session, session])
+
+    def test_notifies_ready_once_session_is_added(self):
+        # the mock client answers initialize before the session is added, like a fast server on a start pool
+        wm = WindowManager(MockWindow([[MockView(__file__)]]), MockConfigs(), MockDocuments(), MockDiagnostics(),
+                           mock_start_session, test_sublime, MockHandlerDispatcher())
+        found = []  # type: List[Optional[Session]]
+        self.assertTrue(wm.when_ready(test_config.name, lambda session: found.append(wm.get_session("test"))))
+        wm.start_active_views()
+        self.assertEqual(len(found), 1)
+        self.assertIsNotNone(found[0])
+
+    def test_drops_waiting_callbacks_with_sessions(self):
+        wm = WindowManager(MockWindow([[MockView(__file__)]]), MockConfigs(), MockDocuments(), MockDiagnostics(),
+                           mock_start_session, test_sublime, MockHandlerDispatcher())
+        ready = []  # type: List[str]
+        self.assertTrue(wm.when_ready("other", lambda session: ready.append("first"), "key"))
+        self.assertTrue(wm.when_ready("other", lambda session: ready.append("second"), "key"))
+        self.assertEqual(len(wm._ready_callbacks), 1)
+        wm.end_sessions()
+        self.assertEqual(wm._ready_callbacks, {})
+        self.assertEqual(ready, [])
+
+    def test_windows_on_same_folder_share_session(self):
+        settings = Settings()
+        settings.share_sessions_across_windows = True
+        shared = SharedSessions(settings)
+        started = []  # type: List[Session]
+
+        def start_session(window, project_path, config, on_created, on_ended):
+            session = mock_start_session(window, project_path, config, on_created, on_ended)
+            started.append(session)
+            return session
+
+        managers = []  # type: List[WindowManager]
+        documents = []  # type: List[MockDocuments]
+        for window_id in range(2):
+            window = MockWindow([[MockView(__file__)]])
+            window._id = window_id
+            documents.append(MockDocuments())
+            managers.append(WindowManager(window, MockConfigs(), documents[-1], MockDiagnostics(),
+                                          start_session, test_sublime, MockHandlerDispatcher(),
+                                          shared_sessions=shared))
+            managers[-1].start_active_views()
+
+        self.assertEqual(len(started), 1)
+        session = started[0]
+        self.assertIs(managers[1].get_session(test_config.name), session)
+        # both windows sync their documents with the shared session
+        self.assertEqual([docs._sessions for docs in documents], [{"test": session}] * 2)
+
+        managers[0].end_sessions()
+        self.assertIsNone(managers[0].get_session(test_config.name))
+        self.assertEqual(session.state, ClientStates.READY)
+        self.assertIs(managers[1].get_session(test_config.name), session)
+
+        managers[1].end_sessions()
+        self.assertIsNone(managers[1].get_session(test_config.name))
+        self.assertEqual(session.state, ClientStates.STOPPING)
+
+    def test_windows_start_own_sessions_by_default(self):
+        shared = SharedSessions(Settings())
+        sessions = []  # type: List[Optional[Session]]
+        for window_id in range(2):
+            window = MockWindow([[MockView(__file__)]])
+            window._id = window_id
+            wm = WindowManager(window, MockConfigs(), MockDocuments(), MockDiagnostics(), mock_start_session,
+                               test_sublime, MockHandlerDispatcher(), shared_sessions=shared)
+            wm.start_active_views()
+            sessions.append(wm.get_session(test_config.name))
+        self.assertIsNot(sessions[0], sessions[1])
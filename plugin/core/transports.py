@@ -2,12 +2,12 @@ from abc import ABCMeta, abstractmethod
 import threading
 import time
 import socket
-from queue import Queue
+from queue import Queue, Empty
 import subprocess
 
 try:
-    from typing import Callable, Dict, Any, Optional
-    assert Callable and Dict and Any and Optional and subprocess
+    from typing import Callable, Dict, Any, Optional, List, Tuple
+    assert Callable and Dict and Any and Optional and List and Tuple and subprocess
 except ImportError:
     pass
 
@@ -16,6 +16,9 @@ log = getLogger(1, __name__)
 
 ContentLengthHeader = b"Content-Length: "
 TCP_CONNECT_TIMEOUT = 5
+# the first and the longest wait before trying again to connect to a server that isn't listening yet
+TCP_CONNECT_INITIAL_DELAY = 0.01
+TCP_CONNECT_MAX_DELAY = 0.5
 
 try:
     from typing import Any, Dict, Callable
@@ -30,39 +33,166 @@ class Transport(object, metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
+    def start(self, on_receive: 'Callable[[bytes], None]', on_closed: 'Callable[[], None]') -> None:
         pass
 
     @abstractmethod
-    def send(self, message: str) -> None:
+    def send(self, message: bytes) -> None:
         pass
 
 
-STATE_HEADERS = 0
-STATE_CONTENT = 1
+# the framer starts with small reads and grows them while large messages are being received
+MIN_READ_SIZE = 4096
+MAX_READ_SIZE = 1024 * 1024
+# an idle buffer larger than this is released instead of being kept around
+MAX_IDLE_BUFFER_SIZE = 4 * 1024 * 1024
+# the writers stop adding queued messages to a single write beyond this size
+MAX_WRITE_SIZE = 1024 * 1024
+
+
+def take_messages(send_queue: 'Queue[Optional[bytes]]') -> 'Tuple[List[bytes], bool]':
+    """
+    Waits for the next message and takes the ones already queued behind it, so a burst of messages
+    is written at once. Also returns whether the writer was asked to stop.
+    """
+    messages = []  # type: List[bytes]
+    size = 0
+    message = send_queue.get()
+    while message is not None:
+        messages.append(message)
+        size += len(message)
+        if size >= MAX_WRITE_SIZE:
+            return messages, False
+        try:
+            message = send_queue.get_nowait()
+        except Empty:
+            return messages, False
+    return messages, True
 
 
-def start_tcp_transport(port: int, host: 'Optional[str]'=None) -> 'Transport':
-    start_time = time.time()
-    log(2, 'connecting to %s:%s', host or "localhost", port)
+class ContentLengthFramer(object):
+    """
+    Splits a stream of bytes into messages framed by a Content-Length header.
+
+    Incoming data is read straight into a single bytearray that is only compacted when it runs out of space,
+    so a large message is accumulated in linear time and copied out once, when it is complete.
+    """
+
+    def __init__(self, on_message: 'Callable[[bytes], None]') -> None:
+        self._on_message = on_message
+        self._buffer = bytearray(MIN_READ_SIZE)
+        self._start = 0  # first byte that has not been parsed yet
+        self._end = 0  # end of the received data
+        self._content_length = -1  # length of the message being received, -1 while reading headers
+        self.read_size = MIN_READ_SIZE
 
-    while time.time() - start_time < TCP_CONNECT_TIMEOUT:
+    def read_from(self, readinto: 'Callable[[memoryview], int]') -> int:
+        """Reads once using readinto (e.g. socket.recv_into) and dispatches all completed messages.
+
+        Returns the number of bytes read, 0 meaning the end of the stream.
+        """
+        size = self._next_read_size()
+        self._reserve(size)
+        with memoryview(self._buffer) as view:
+            received = readinto(view[self._end:self._end + size])
+        if received:
+            self._end += received
+            if received == size:
+                self.read_size = min(self.read_size * 2, MAX_READ_SIZE)
+            self._parse()
+        return received
+
+    def feed(self, data: bytes) -> None:
+        """Appends data and dispatches all completed messages."""
+        self._reserve(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+        self._parse()
+
+    def _next_read_size(self) -> int:
+        if self._content_length > 0:
+            missing = self._start + self._content_length - self._end
+            return max(self.read_size, min(missing, MAX_READ_SIZE))
+        return self.read_size
+
+    def _reserve(self, size: int) -> None:
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > MAX_IDLE_BUFFER_SIZE:
+                self._buffer = bytearray(MIN_READ_SIZE)
+        if self._end + size <= len(self._buffer):
+            return
+        if self._start > 0:
+            pending = self._end - self._start
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, pending
+        if self._end + size > len(self._buffer):
+            # also make room for the rest of the current message, so it doesn't need to move again.
+            required = max(self._end + size, self._content_length)
+            self._buffer.extend(bytes(max(required, 2 * len(self._buffer)) - len(self._buffer)))
+
+    def _parse(self) -> None:
+        while True:
+            if self._content_length < 0:
+                headers_end = self._buffer.find(b"\r\n\r\n", self._start, self._end)
+                if headers_end < 0:
+                    return
+                self._content_length = self._parse_content_length(self._buffer[self._start:headers_end])
+                self._start = headers_end + 4
+
+            message_end = self._start + self._content_length
+            if message_end > self._end:
+                return
+
+            content = None  # type: Optional[bytes]
+            if self._content_length > 0:
+                with memoryview(self._buffer) as view:
+                    content = view[self._start:message_end].tobytes()
+            self._start = message_end
+            self._content_length = -1
+            if content:
+                self._on_message(content)
+
+    def _parse_content_length(self, headers: bytearray) -> int:
+        for header in headers.split(b"\r\n"):
+            if header.startswith(ContentLengthHeader):
+                return int(header[len(ContentLengthHeader):])
+        log(2, "missing Content-Length header in %s", headers)
+        return 0
+
+
+def connect_tcp(host: str, port: int, timeout: float = TCP_CONNECT_TIMEOUT) -> 'socket.socket':
+    """
+    Connects to a server that may not be listening yet, waiting twice as long after each refused attempt.
+    Each attempt is bounded by the time left instead of spinning on connect.
+    """
+    deadline = time.monotonic() + timeout
+    delay = TCP_CONNECT_INITIAL_DELAY
+    while True:
         try:
-            sock = socket.create_connection((host or "localhost", port))
-            return TCPTransport(sock)
-        except ConnectionRefusedError as e:
-            pass
+            sock = socket.create_connection((host, port), max(deadline - time.monotonic(), TCP_CONNECT_INITIAL_DELAY))
+        except (ConnectionRefusedError, socket.timeout):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception("Timeout connecting to socket")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, TCP_CONNECT_MAX_DELAY)
+        else:
+            sock.settimeout(None)
+            return sock
 
-    # process.kill()
-    raise Exception("Timeout connecting to socket")
+
+def start_tcp_transport(port: int, host: 'Optional[str]'=None) -> 'Transport':
+    log(2, 'connecting to %s:%s', host or "localhost", port)
+    return TCPTransport(connect_tcp(host or "localhost", port))
 
 
 class TCPTransport(Transport):
     def __init__(self, socket: 'Any') -> None:
         self.socket = socket  # type: 'Optional[Any]'
-        self.send_queue = Queue()  # type: Queue[Optional[str]]
+        self.send_queue = Queue()  # type: Queue[Optional[bytes]]
 
-    def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
+    def start(self, on_receive: 'Callable[[bytes], None]', on_closed: 'Callable[[], None]') -> None:
         self.on_receive = on_receive
         self.on_closed = on_closed
         self.read_thread = threading.Thread(target=self.read_socket)
@@ -76,74 +206,44 @@ class TCPTransport(Transport):
         self.on_closed()
 
     def read_socket(self) -> None:
-        remaining_data = b""
-        is_incomplete = False
-        read_state = STATE_HEADERS
-        content_length = 0
+        framer = ContentLengthFramer(self.on_receive)
         while self.socket:
-            is_incomplete = False
             try:
-                received_data = self.socket.recv(4096)
+                received = framer.read_from(self.socket.recv_into)
             except Exception as err:
                 log.exception("Failure reading from socket")
                 self.close()
                 break
 
-            if not received_data:
+            if not received:
                 log(2, "no data received, closing")
                 self.close()
                 break
 
-            data = remaining_data + received_data
-            remaining_data = b""
-
-            while len(data) > 0 and not is_incomplete:
-                if read_state == STATE_HEADERS:
-                    headers, _sep, rest = data.partition(b"\r\n\r\n")
-                    if len(_sep) < 1:
-                        is_incomplete = True
-                        remaining_data = data
-                    else:
-                        for header in headers.split(b"\r\n"):
-                            if header.startswith(ContentLengthHeader):
-                                header_value = header[len(ContentLengthHeader):]
-                                content_length = int(header_value)
-                                read_state = STATE_CONTENT
-                        data = rest
-
-                if read_state == STATE_CONTENT:
-                    # read content bytes
-                    if len(data) >= content_length:
-                        content = data[:content_length]
-                        self.on_receive(content.decode("UTF-8"))
-                        data = data[content_length:]
-                        read_state = STATE_HEADERS
-                    else:
-                        is_incomplete = True
-                        remaining_data = data
-
-    def send(self, message: str) -> None:
+    def send(self, message: bytes) -> None:
         self.send_queue.put(message)
 
     def write_socket(self) -> None:
         while self.socket:
-            message = self.send_queue.get()
-            if message is None:
-                break
-            else:
+            messages, stopped = take_messages(self.send_queue)
+            if messages:
                 try:
-                    self.socket.sendall(bytes(message, 'UTF-8'))
+                    self.socket.sendall(b"".join(messages))
                 except Exception as err:
                     log.exception("Failure writing to socket")
                     self.close()
+                    break
+            if stopped:
+                break
 
 
 class StdioTransport(Transport):
     def __init__(self, process: 'subprocess.Popen') -> None:
         self.process = process  # type: Optional[subprocess.Popen]
-        self.send_queue = Queue()  # type: Queue[Optional[str]]
+        self.send_queue = Queue()  # type: Queue[Optional[bytes]]
+        self._close_lock = threading.Lock()
 
-    def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
+    def start(self, on_receive: 'Callable[[bytes], None]', on_closed: 'Callable[[], None]') -> None:
         self.on_receive = on_receive
         self.on_closed = on_closed
         self.write_thread = threading.Thread(target=self.write_stdin)
@@ -152,7 +252,11 @@ class StdioTransport(Transport):
         self.read_thread.start()
 
     def close(self) -> None:
-        self.process = None
+        # both the reader and the writer close the transport when the process goes away
+        with self._close_lock:
+            if self.process is None:
+                return
+            self.process = None
         self.send_queue.put(None)  # kill the write thread as it's blocked on send_queue
         self.on_closed()
 
@@ -160,46 +264,38 @@ class StdioTransport(Transport):
         """
         Reads JSON responses from process and dispatch them to response_handler
         """
-        ContentLengthHeader = b"Content-Length: "
-
-        running = True
-        while running and self.process:
-            running = self.process.poll() is None
+        framer = ContentLengthFramer(self.on_receive)
+        # read from the unbuffered stream, a buffered readinto would block until the whole view is filled.
+        stdout = self.process.stdout if self.process else None
+        readinto = getattr(stdout, "raw", stdout).readinto
 
+        while self.process:
             try:
-                content_length = 0
-                while self.process:
-                    header = self.process.stdout.readline()
-                    if header:
-                        header = header.strip()
-                    if not header:
-                        break
-                    if header.startswith(ContentLengthHeader):
-                        content_length = int(header[len(ContentLengthHeader):])
-
-                if (content_length > 0):
-                    content = self.process.stdout.read(content_length)
-                    self.on_receive(content.decode("UTF-8"))
-
-            except IOError as err:
+                if not framer.read_from(readinto):
+                    log(2, "no data received, closing")
+                    self.close()
+                    break
+            except (IOError, ValueError) as err:
                 self.close()
                 log.exception("Failure reading stdout")
                 break
 
         log(2, "LSP stdout process ended.")
 
-    def send(self, message: str) -> None:
+    def send(self, message: bytes) -> None:
         self.send_queue.put(message)
 
     def write_stdin(self) -> None:
         while self.process:
-            message = self.send_queue.get()
-            if message is None:
-                break
-            else:
+            messages, stopped = take_messages(self.send_queue)
+            process = self.process  # the reader can close the transport meanwhile
+            if messages and process:
                 try:
-                    self.process.stdin.write(bytes(message, 'UTF-8'))
-                    self.process.stdin.flush()
+                    process.stdin.write(b"".join(messages))
+                    process.stdin.flush()
                 except (BrokenPipeError, OSError) as err:
                     log.exception("Failure writing to stdout")
                     self.close()
+                    break
+            if stopped:
+                break
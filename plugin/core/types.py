@@ -3,8 +3,8 @@ import os
 import sublime
 try:
     from typing_extensions import Protocol
-    from typing import Optional, List, Callable, Dict, Any
-    assert Optional and List and Callable and Dict and Any
+    from typing import Optional, List, Callable, Dict, Tuple, Any
+    assert Optional and List and Callable and Dict and Tuple and Any
 except ImportError:
     pass
     Protocol = object  # type: ignore
@@ -30,6 +30,7 @@ class Settings(SmartObject):
         self.auto_show_diagnostics_panel = True
         self.auto_show_diagnostics_panel_level = 3
         self.show_diagnostics_phantoms = False
+        self.diagnostics_phantoms_in_viewport = True
         self.show_diagnostics_count_in_view_status = False
         self.show_diagnostics_in_view_status = True
         self.show_diagnostics_severity_level = 3
@@ -47,12 +48,21 @@ class Settings(SmartObject):
         self.show_code_actions_bulb = False
         self.complete_all_chars = False
         self.completion_hint_type = "auto"
+        self.completion_max_items = 0
         self.complete_using_text_edit = False
         self.resolve_completion_for_snippets = False
         self.log_debug = True
         self.log_server = True
         self.log_stderr = False
         self.log_payloads = False
+        self.handler_dispatch = "worker"
+        self.request_timeout = 60
+        self.request_timeouts = {
+            "initialize": 0
+        }  # type: Dict[str, int]
+        self.server_pool_size = 0
+        self.server_pool_idle_timeout = 600
+        self.share_sessions_across_windows = False
 
     @staticmethod
     def setLevel(enabled, level):
@@ -77,14 +87,31 @@ class ClientStates(SmartObject):
     STOPPING = 2
 
 
+# the compiled matchers of the syntaxes of languages, by syntaxes
+_syntax_matchers = dict()  # type: Dict[Tuple[str, ...], Any]
+
+
+def syntax_matcher(syntaxes: 'List[str]') -> 'Any':
+    """The regex finding any of the syntaxes in a syntax path, compiled once for the same syntaxes"""
+    key = tuple(syntaxes)
+    matcher = _syntax_matchers.get(key)
+    if matcher is None:
+        matcher = re.compile(r'|'.join(r'\b%s\b' % re.escape(s) for s in syntaxes), re.IGNORECASE)
+        _syntax_matchers[key] = matcher
+    return matcher
+
+
+def language_supports_syntax(language: 'LanguageConfig', syntax: str) -> bool:
+    return syntax_matcher(language.syntaxes).search(syntax) is not None
+
+
 def config_supports_syntax(config: 'ClientConfig', syntax: str) -> bool:
     for language in config.languages:
         try:
-            regex = r'|'.join(r'\b%s\b' % re.escape(s) for s in language.syntaxes)
-            if re.search(regex, syntax, re.IGNORECASE):
+            if language_supports_syntax(language, syntax):
                 return True
         except:
-            log.exception('regex', regex, 'syntax', syntax)
+            log.exception('syntaxes', language.syntaxes, 'syntax', syntax)
     return False
 
 
@@ -123,6 +150,9 @@ class ViewLike(Protocol):
     def window(self) -> 'Optional[Any]':  # WindowLike
         ...
 
+    def id(self) -> int:
+        ...
+
     def buffer_id(self) -> int:
         ...
 
@@ -144,6 +174,9 @@ class ViewLike(Protocol):
     def score_selector(self, region, scope: str) -> int:
         ...
 
+    def scope_name(self, point: int) -> str:
+        ...
+
 
 class WindowLike(Protocol):
     def id(self) -> int:
@@ -1,19 +1,125 @@
+import re
 import sublime
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from .protocol import Point, Range
 
+try:
+    from typing import Iterable, List, Dict
+    assert Iterable and List and Dict
+except ImportError:
+    pass
+
+# characters outside the Basic Multilingual Plane, LSP columns count them as two UTF-16 code units
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+# line indexes are kept for this many buffers, the most recently used ones
+LINE_INDEX_CACHE_SIZE = 8
+
+
+class LineIndex(object):
+    """
+    The start offsets of the lines of a text, and the offsets of its characters taking two UTF-16 code units,
+    to convert between offsets (in code points, like Sublime) and LSP positions (in UTF-16 code units).
+    """
+
+    def __init__(self, text: str, change_count: int = 0) -> None:
+        self.change_count = change_count
+        self.size = len(text)
+        self._starts = [0]
+        self._starts.extend(match.end() for match in re.finditer('\n', text))
+        self._astral = [match.start() for match in _ASTRAL.finditer(text)]
+
+    def offset(self, row: int, col: int) -> int:
+        """The offset of a position, a column past the end of the line is the end of the line"""
+        if row < 0:
+            return 0
+        if row >= len(self._starts):
+            return self.size
+        offset = self._starts[row]
+        end = self._starts[row + 1] - 1 if row + 1 < len(self._starts) else self.size
+        remaining = col
+        index = bisect_left(self._astral, offset)
+        while index < len(self._astral) and self._astral[index] < end:
+            astral = self._astral[index]
+            if remaining <= astral - offset:
+                break
+            remaining -= astral - offset + 2
+            if remaining < 0:
+                # the column is between the two code units of a character
+                return astral
+            offset = astral + 1
+            index += 1
+        return min(offset + remaining, end)
+
+    def point(self, offset: int) -> Point:
+        offset = max(0, min(offset, self.size))
+        row = bisect_right(self._starts, offset) - 1
+        start = self._starts[row]
+        astral = bisect_left(self._astral, offset) - bisect_left(self._astral, start)
+        return Point(row, offset - start + astral)
+
+
+def utf16_length(text: str, begin: int, end: int) -> int:
+    """The number of UTF-16 code units of text[begin:end]"""
+    return end - begin + len(_ASTRAL.findall(text, begin, end))
+
+
+_line_indexes = OrderedDict()  # type: OrderedDict[int, LineIndex]
+_line_indexes_lock = threading.Lock()
+
+
+def line_index(view: sublime.View) -> LineIndex:
+    """
+    The line index of the view's buffer, built again once the buffer changed. Building it reads the whole
+    buffer, it is for converting many positions at once.
+    """
+    buffer_id = view.buffer_id()
+    change_count = view.change_count()
+    with _line_indexes_lock:
+        index = _line_indexes.get(buffer_id)
+        if index and index.change_count == change_count:
+            _line_indexes.move_to_end(buffer_id)
+            return index
+    index = LineIndex(view.substr(sublime.Region(0, view.size())), change_count)
+    with _line_indexes_lock:
+        _line_indexes[buffer_id] = index
+        _line_indexes.move_to_end(buffer_id)
+        while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
 
 def point_to_offset(point: Point, view: sublime.View) -> int:
-    return view.text_point(point.row, point.col)
+    """The offset of a single position, worked out from its line only"""
+    if point.row < 0:
+        return 0
+    if point.row > view.rowcol(view.size())[0]:
+        return view.size()
+    line = view.line(view.text_point(point.row, 0))
+    return line.begin() + LineIndex(view.substr(line)).offset(0, point.col)
 
 
 def offset_to_point(view: sublime.View, offset: int) -> 'Point':
-    return Point(*view.rowcol(offset))
+    """The position of a single offset, worked out from its line only"""
+    offset = max(0, min(offset, view.size()))
+    row, _ = view.rowcol(offset)
+    start = view.line(offset).begin()
+    return Point(row, utf16_length(view.substr(sublime.Region(start, offset)), 0, offset - start))
 
 
 def range_to_region(range: Range, view: sublime.View) -> 'sublime.Region':
     return sublime.Region(point_to_offset(range.start, view), point_to_offset(range.end, view))
 
 
+def ranges_to_regions(ranges: 'Iterable[Range]', view: sublime.View) -> 'List[sublime.Region]':
+    """Converts many ranges at once, with a single lookup of the line index"""
+    index = line_index(view)
+    return [sublime.Region(index.offset(range.start.row, range.start.col), index.offset(range.end.row, range.end.col))
+            for range in ranges]
+
+
 def region_to_range(view: sublime.View, region: sublime.Region) -> 'Range':
     return Range(
         offset_to_point(view, region.begin()),
@@ -1,15 +1,19 @@
 from .events import global_events
 from .types import ClientStates, ClientConfig, WindowLike, ViewLike, LanguageConfig, config_supports_syntax
-from .protocol import Notification, Response
+from .protocol import Notification, Response, Point, Range
+from .protocol import TextDocumentSyncKindNone, TextDocumentSyncKindIncremental
 from .sessions import Session
 from .url import filename_to_uri
+from .views import utf16_length
 from .workspace import get_project_path
 from .rpc import Client
+from .helpers import Scheduler
+import threading
 try:
     from typing_extensions import Protocol
-    from typing import Optional, List, Callable, Dict, Any
+    from typing import Optional, List, Callable, Dict, Any, Set, Tuple, Hashable
     from types import ModuleType
-    assert Optional and List and Callable and Dict and Session and Any and ModuleType
+    assert Optional and List and Callable and Dict and Session and Any and ModuleType and Set and Tuple and Hashable
     assert LanguageConfig
 except ImportError:
     pass
@@ -86,32 +90,87 @@ def get_active_views(window: WindowLike):
 
 
 class DocumentState:
-    """Stores version count for documents open in a language service"""
+    """Stores version count and last synced content for documents open in a language service"""
     def __init__(self, path: str) -> 'None':
         self.path = path
         self.version = 0
+        self.text = None  # type: Optional[str]
 
     def inc_version(self):
         self.version += 1
         return self.version
 
 
+# delay before the changes of a buffer are sent, restarted by each change
+DID_CHANGE_DELAY_MS = 500
+
+# strings are compared in slices of this size before falling back to single characters
+_COMPARE_CHUNK_SIZE = 4096
+
+
+def _common_prefix_length(old: str, new: str, limit: int) -> int:
+    length = 0
+    while length + _COMPARE_CHUNK_SIZE <= limit and \
+            old[length:length + _COMPARE_CHUNK_SIZE] == new[length:length + _COMPARE_CHUNK_SIZE]:
+        length += _COMPARE_CHUNK_SIZE
+    while length < limit and old[length] == new[length]:
+        length += 1
+    return length
+
+
+def _common_suffix_length(old: str, new: str, limit: int) -> int:
+    old_end, new_end = len(old), len(new)
+    length = 0
+    while length + _COMPARE_CHUNK_SIZE <= limit and \
+            old[old_end - length - _COMPARE_CHUNK_SIZE:old_end - length] == \
+            new[new_end - length - _COMPARE_CHUNK_SIZE:new_end - length]:
+        length += _COMPARE_CHUNK_SIZE
+    while length < limit and old[old_end - length - 1] == new[new_end - length - 1]:
+        length += 1
+    return length
+
+
+def _offset_to_point(text: str, offset: int) -> Point:
+    row = text.count('\n', 0, offset)
+    line_start = text.rfind('\n', 0, offset) + 1
+    return Point(row, utf16_length(text, line_start, offset))
+
+
+def get_content_change(old: str, new: str) -> 'Dict[str, Any]':
+    """Returns an incremental TextDocumentContentChangeEvent turning old into new.
+
+    The change covers the span between the first and the last differing character,
+    so all edits made between two purges are sent as a single range.
+    """
+    start = _common_prefix_length(old, new, min(len(old), len(new)))
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - start)
+    old_end = len(old) - suffix
+    return {
+        "range": Range(_offset_to_point(old, start), _offset_to_point(old, old_end)).to_lsp(),
+        "text": new[start:len(new) - suffix]
+    }
+
+
 class DocumentHandlerFactory(object):
-    def __init__(self, sublime, settings):
+    def __init__(self, sublime, settings, scheduler: 'Optional[Scheduler]' = None):
         self._sublime = sublime
         self._settings = settings
+        self._scheduler = scheduler
 
     def for_window(self, window: 'WindowLike', configs: 'ConfigRegistry'):
-        return WindowDocumentHandler(self._sublime, self._settings, window, global_events, configs)
+        return WindowDocumentHandler(self._sublime, self._settings, window, global_events, configs, self._scheduler)
 
 
 class WindowDocumentHandler(object):
-    def __init__(self, sublime, settings, window, events, configs):
+    def __init__(self, sublime, settings, window, events, configs, scheduler: 'Optional[Scheduler]' = None):
         self._sublime = sublime
         self._settings = settings
+        self._scheduler = scheduler or Scheduler(sublime.set_timeout_async)
         self._configs = configs
         self._window = window
         self._document_states = dict()  # type: Dict[str, DocumentState]
+        # the views of this window showing each document, the other windows' views close without closing it
+        self._document_views = dict()  # type: Dict[str, Set[int]]
         self._pending_buffer_changes = dict()  # type: Dict[int, Dict]
         self._sessions = dict()  # type: Dict[str, Session]
         events.subscribe('view.on_load_async', self.handle_view_opened)
@@ -122,17 +181,26 @@ class WindowDocumentHandler(object):
         events.subscribe('view.on_close', self.handle_view_closed)
 
     def add_session(self, session: Session):
+        # sync pending changes first, so the new session opens documents at the last synced content.
+        for buffer_id in list(self._pending_buffer_changes):
+            self.purge_did_change(buffer_id)
         self._sessions[session.config.name] = session
         self._notify_open_documents(session)
 
     def remove_session(self, config_name: str):
         if config_name in self._sessions:
-            del self._sessions[config_name]
+            session = self._sessions.pop(config_name)
+            # documents still open in the server, the session being shared with other windows
+            for file_name in session.close_documents(self._window.id()):
+                if session.client and session.state != ClientStates.STOPPING:
+                    params = {"textDocument": {"uri": filename_to_uri(file_name)}}
+                    session.client.send_notification(Notification.didClose(params))
 
     def reset(self) -> None:
         for view in self._window.views():
             self.detach_view(view)
         self._document_states.clear()
+        self._document_views.clear()
 
     def get_document_state(self, path: str) -> DocumentState:
         if path not in self._document_states:
@@ -201,16 +269,23 @@ class WindowDocumentHandler(object):
                     self._attach_view(view, sessions)
                     for session in sessions:
                         self._notify_did_open(view, session)
+            if self.has_document_state(file_name):
+                self._document_views.setdefault(file_name, set()).add(view.id())
 
     def _notify_did_open(self, view: ViewLike, session: Session) -> None:
         file_name = view.file_name()
         if file_name:
             ds = self.get_document_state(file_name)
+            if not session.open_document(file_name, self._window.id(), ds.version):
+                return  # already open in the server from another window
+            text = view.substr(self._sublime.Region(0, view.size()))
+            if session.text_sync_kind() == TextDocumentSyncKindIncremental:
+                ds.text = text
             params = {
                 "textDocument": {
                     "uri": filename_to_uri(file_name),
                     "languageId": self._view_language(view, session.config.name),
-                    "text": view.substr(self._sublime.Region(0, view.size())),
+                    "text": text,
                     "version": ds.version
                 }
             }
@@ -218,9 +293,20 @@ class WindowDocumentHandler(object):
 
     def handle_view_closed(self, view: ViewLike):
         file_name = view.file_name()
+        if not file_name:
+            return
+        views = self._document_views.get(file_name)
+        if not views or view.id() not in views:
+            return  # a view of another window
+        views.discard(view.id())
+        if views:
+            return  # still shown in another view of this window
+        del self._document_views[file_name]
         if file_name in self._document_states:
             del self._document_states[file_name]
             for session in self._get_applicable_sessions(view):
+                if not session.close_document(file_name, self._window.id()):
+                    continue  # still open in another window
                 log(2, 'closing', file_name, session.config.name)
                 if session.client:
                     params = {"textDocument": {"uri": filename_to_uri(file_name)}}
@@ -252,10 +338,11 @@ class WindowDocumentHandler(object):
                     "version": buffer_version
                 }
 
-            self._sublime.set_timeout_async(
-                lambda: self.purge_did_change(buffer_id, buffer_version), 500)
+            self._scheduler.debounce(("did_change", buffer_id), DID_CHANGE_DELAY_MS,
+                                     lambda: self.purge_did_change(buffer_id, buffer_version))
 
     def purge_changes(self, view: ViewLike):
+        self._scheduler.cancel(("did_change", view.buffer_id()))
         self.purge_did_change(view.buffer_id())
 
     def purge_did_change(self, buffer_id: int, buffer_version=None):
@@ -274,26 +361,125 @@ class WindowDocumentHandler(object):
             if view.buffer_id() in self._pending_buffer_changes:
                 del self._pending_buffer_changes[view.buffer_id()]
 
-                for session in self._get_applicable_sessions(view):
-                    if session.client:
-                        document_state = self.get_document_state(file_name)
-                        uri = filename_to_uri(file_name)
-                        params = {
-                            "textDocument": {
-                                "uri": uri,
-                                "version": document_state.inc_version(),
-                            },
-                            "contentChanges": [{
-                                "text": view.substr(self._sublime.Region(0, view.size()))
-                            }]
-                        }
-                        session.client.send_notification(Notification.didChange(params))
+                sessions = list(session for session in self._get_applicable_sessions(view)
+                                if session.client and session.text_sync_kind() != TextDocumentSyncKindNone)
+                if not sessions:
+                    return
+
+                document_state = self.get_document_state(file_name)
+                uri = filename_to_uri(file_name)
+                version = document_state.inc_version()
+                text = view.substr(self._sublime.Region(0, view.size()))
+                full_changes = [{"text": text}]
+                incremental_changes = None  # type: Optional[List[Dict[str, Any]]]
+                is_incremental_synced = False
+
+                for session in sessions:
+                    content_changes = full_changes
+                    if session.text_sync_kind() == TextDocumentSyncKindIncremental:
+                        is_incremental_synced = True
+                        # the server's content may be another window's when the document is open in several
+                        if document_state.text is not None and not session.is_document_shared(file_name):
+                            if incremental_changes is None:
+                                incremental_changes = [get_content_change(document_state.text, text)]
+                            content_changes = incremental_changes
+                    params = {
+                        "textDocument": {
+                            "uri": uri,
+                            "version": session.next_document_version(file_name, version),
+                        },
+                        "contentChanges": content_changes
+                    }
+                    session.client.send_notification(Notification.didChange(params))
+
+                # only keep a copy of the content when a session needs it to compute the next change.
+                document_state.text = text if is_incremental_synced else None
+
+
+# capability snapshots are kept for this many views per window before starting over
+VIEW_CAPABILITIES_CACHE_SIZE = 100
+
+
+class ViewCapabilities(object):
+    """
+    The config and ready session of a view for the scope at a point, as of a generation of the window's sessions.
+    Commands check it to be enabled or visible, which Sublime asks for every time a menu opens.
+    """
+    __slots__ = ("generation", "scope", "syntax", "config", "session")
+
+    def __init__(self, generation: int, scope: 'Optional[str]', syntax: 'Optional[str]',
+                 config: 'Optional[ClientConfig]', session: 'Optional[Session]') -> None:
+        self.generation = generation
+        self.scope = scope
+        self.syntax = syntax
+        self.config = config
+        self.session = session
+
+    def has_capability(self, capability: str) -> bool:
+        return self.session is not None and self.session.has_capability(capability)
+
+
+class SessionWindows(object):
+    """
+    The windows using the session of a config, in the order they joined it.
+    Only the window starting it, unless windows on the same folder share sessions.
+    """
+    __slots__ = ("key", "owner", "managers", "session")
+
+    def __init__(self, key: 'Tuple[str, str]', owner: 'WindowManager') -> None:
+        self.key = key
+        self.owner = owner
+        self.managers = [owner]  # type: List[WindowManager]
+        self.session = None  # type: Optional[Session]
+
+    def primary(self) -> 'WindowManager':
+        """The window to show what the server asks for in, the first one still using the session"""
+        return self.managers[0] if self.managers else self.owner
+
+
+class SharedSessions(object):
+    """
+    The sessions shared by the windows on the same folder, by config name and project path, with the
+    windows using them. A session ends once the last window using it lets go of it.
+    """
+
+    def __init__(self, settings: 'Any') -> None:
+        self._settings = settings
+        self._shared = dict()  # type: Dict[Tuple[str, str], SessionWindows]
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return bool(self._settings.share_sessions_across_windows)
+
+    def join(self, key: 'Tuple[str, str]', manager: 'WindowManager') -> 'Tuple[SessionWindows, bool]':
+        """The windows of the session for the key with the manager added, and whether the manager starts it"""
+        with self._lock:
+            windows = self._shared.get(key)
+            if windows and not (windows.session and windows.session.state == ClientStates.STOPPING):
+                windows.managers.append(manager)
+                return windows, False
+            windows = self._shared[key] = SessionWindows(key, manager)
+            return windows, True
+
+    def leave(self, windows: SessionWindows, manager: 'WindowManager') -> None:
+        with self._lock:
+            if manager in windows.managers:
+                windows.managers.remove(manager)
+            if not windows.managers and self._shared.get(windows.key) is windows:
+                del self._shared[windows.key]
+
+    def remove(self, windows: SessionWindows) -> None:
+        """Windows starting the config afterwards start another session instead of joining this one"""
+        with self._lock:
+            if self._shared.get(windows.key) is windows:
+                del self._shared[windows.key]
 
 
 class WindowManager(object):
     def __init__(self, window: WindowLike, configs: ConfigRegistry, documents: DocumentHandler,
                  diagnostics: DiagnosticsHandler, session_starter: 'Callable', sublime: 'Any',
-                 handler_dispatcher, on_closed: 'Optional[Callable]'=None) -> None:
+                 handler_dispatcher, on_closed: 'Optional[Callable]'=None, start_pool: 'Optional[Any]'=None,
+                 shared_sessions: 'Optional[SharedSessions]'=None) -> None:
 
         # to move here:
         # configurations.py: window_client_configs and all references
@@ -309,10 +495,80 @@ class WindowManager(object):
         self._project_path = get_project_path(self._window)
         self._on_closed = on_closed
         self._is_closing = False
+        # starts sessions on its threads when given, one of the configs in _starting each
+        self._start_pool = start_pool
+        self._starting = set()  # type: Set[str]
+        # shares the sessions of windows on the same folder when enabled
+        self._shared_sessions = shared_sessions
+        self._session_windows = dict()  # type: Dict[str, SessionWindows]
+        # called with the session of a config, or of any config for None, once it is ready
+        # the callbacks waiting for a session by key, with the config they wait for
+        self._ready_callbacks = dict()  # type: Dict[Hashable, Tuple[Optional[str], Callable[[Session], None]]]
+        self._ready_lock = threading.Lock()
+        # incremented whenever sessions start, get ready or end, or the configs change
+        self._generation = 0
+        self._view_capabilities = dict()  # type: Dict[int, ViewCapabilities]
 
     def get_session(self, config_name: str) -> 'Optional[Session]':
         return self._sessions.get(config_name)
 
+    def get_sessions(self) -> 'List[Session]':
+        return list(self._sessions.values())
+
+    def view_capabilities(self, view: ViewLike, point: 'Optional[int]'=None) -> ViewCapabilities:
+        """The snapshot of the view at the point, the start of the selection by default, taken again if outdated"""
+        if point is None:
+            sel = view.sel()
+            if len(sel) > 0:
+                point = sel[0].begin()
+        scope = view.scope_name(point) if point is not None else None
+        syntax = view.settings().get("syntax")
+        snapshot = self._view_capabilities.get(view.id())
+        if snapshot and snapshot.generation == self._generation and snapshot.scope == scope \
+                and snapshot.syntax == syntax:
+            return snapshot
+        # read before the sessions, for a snapshot taken while they change to be taken again
+        generation = self._generation
+        config = self._configs.scope_config(view, point) if point is not None else None
+        session = self._sessions.get(config.name) if config else None
+        if session and session.state != ClientStates.READY:
+            session = None
+        snapshot = ViewCapabilities(generation, scope, syntax, config, session)
+        if len(self._view_capabilities) >= VIEW_CAPABILITIES_CACHE_SIZE:
+            self._view_capabilities = dict()
+        self._view_capabilities[view.id()] = snapshot
+        return snapshot
+
+    def when_ready(self, config_name: 'Optional[str]', callback: 'Callable[[Session], None]',
+                   key: 'Optional[Hashable]' = None) -> bool:
+        """
+        Calls back with the session of the config, or with the first session of any config if None, once it is
+        ready. Right away when it already is, returning whether it waits for the session instead. A callback
+        waiting under the same key is replaced. Callbacks still waiting when the sessions end are dropped.
+        """
+        with self._ready_lock:
+            ready = None  # type: Optional[Session]
+            for session in list(self._sessions.values()):
+                if session.state == ClientStates.READY and config_name in (None, session.config.name):
+                    ready = session
+                    break
+            if not ready:
+                self._ready_callbacks[callback if key is None else key] = (config_name, callback)
+                return True
+        callback(ready)
+        return False
+
+    def _notify_ready(self, session: Session) -> None:
+        with self._ready_lock:
+            keys = [key for key, (config_name, _) in self._ready_callbacks.items()
+                    if config_name in (None, session.config.name)]
+            callbacks = [self._ready_callbacks.pop(key)[1] for key in keys]
+        for callback in callbacks:
+            callback(session)
+
+    def _sessions_changed(self) -> None:
+        self._generation += 1
+
     def _is_session_ready(self, config_name: str):
         if config_name not in self._sessions:
             return False
@@ -323,10 +579,11 @@ class WindowManager(object):
         return False
 
     def _can_start_config(self, config_name: str):
-        return config_name not in self._sessions
+        return config_name not in self._sessions and config_name not in self._starting
 
     def update_configs(self, configs: 'List[ClientConfig]') -> None:
         self._configs.update(configs)
+        self._sessions_changed()
 
     def start_active_views(self):
         active_views = get_active_views(self._window)
@@ -337,6 +594,7 @@ class WindowManager(object):
                 self._documents.handle_view_opened(view)
 
     def activate_view(self, view: ViewLike):
+        self._view_capabilities.pop(view.id(), None)
         # TODO: we can shortcut here by checking documentstate.
         if self._sessions:
             self._end_old_sessions()
@@ -364,15 +622,68 @@ class WindowManager(object):
         if not self._handlers.on_start(config.name, self._window):
             return
 
+        key = (config.name, project_path)
+        if self._shared_sessions and self._shared_sessions.is_enabled():
+            windows, is_new = self._shared_sessions.join(key, self)
+        else:
+            windows, is_new = SessionWindows(key, self), True
+        self._session_windows[config.name] = windows
+        self._starting.add(config.name)
+        if not is_new:
+            log(2, "window %s shares session %s", self._window.id(), config.name)
+            session = windows.session
+            if session:
+                self._join_session(config, session)
+            # otherwise added once the window starting it created it
+            return
+
         self._window.status_message("Starting " + config.name + "...")
         log(2, "starting in", project_path)
+        if self._start_pool:
+            # starting a server can take seconds, other servers start meanwhile
+            self._start_pool.submit(self._start_new_session, project_path, config, windows)
+        else:
+            self._start_new_session(project_path, config, windows)
+
+    def _start_new_session(self, project_path: str, config: ClientConfig, windows: SessionWindows) -> None:
+        session = self._create_session(project_path, config, windows)
+        windows.session = session
+        managers = [manager for manager in list(windows.managers) if config.name in manager._starting]
+        if not managers:
+            # the sessions were ended while this one started
+            if session:
+                session.end()
+            return
+        for manager in managers:
+            manager._add_session(config, session)
+            manager._starting.discard(config.name)
+            if not session:
+                manager._leave_session(config.name)
+
+    def _join_session(self, config: ClientConfig, session: Session) -> None:
+        self._add_session(config, session)
+        self._starting.discard(config.name)
+        if session.state == ClientStates.READY:
+            self._handle_session_ready(session, config)
+
+    def _leave_session(self, config_name: str) -> None:
+        windows = self._session_windows.pop(config_name, None)
+        if windows:
+            if self._shared_sessions:
+                self._shared_sessions.leave(windows, self)
+            elif self in windows.managers:
+                windows.managers.remove(self)
+
+    def _create_session(self, project_path: str, config: ClientConfig,
+                        windows: SessionWindows) -> 'Optional[Session]':
         session = None  # type: Optional[Session]
         try:
             log(2, "project_path: %s", project_path)
             log(2, "config: %s", config)
-            session = self._start_session(self._window, project_path, config,
-                                          lambda session: self._handle_session_started(session, project_path, config),
-                                          lambda config_name: self._handle_session_ended(config_name))
+            session = self._start_session(
+                self._window, project_path, config,
+                lambda session: self._handle_session_started(session, project_path, config, windows),
+                lambda config_name: self._handle_shared_session_ended(config_name, windows))
         except Exception as e:
             message = "\n\n".join([
                 "Could not start {}",
@@ -381,12 +692,21 @@ class WindowManager(object):
             ]).format(config.name, str(e))
 
             self._configs.disable(config.name)
+            # the snapshots of the views still have the config
+            self._sessions_changed()
             log(1, message)
             log.exception("Server will be disabled for this window")
+        return session
 
+    def _add_session(self, config: ClientConfig, session: 'Optional[Session]') -> None:
         if session:
             log(2, "window %s added session %s", self._window.id(), config.name)
-            self._sessions[config.name] = session
+            with self._ready_lock:
+                self._sessions[config.name] = session
+        self._sessions_changed()
+        if session and session.state == ClientStates.READY:
+            # initialized before it was added, on the dispatcher thread while the pool thread started it
+            self._notify_ready(session)
 
     def _handle_message_request(self, params: dict, client: Client, request_id: int) -> None:
         actions = params.get("actions", [])
@@ -405,9 +725,18 @@ class WindowManager(object):
 
     def restart_sessions(self):
         self._restarting = True
+        if self._shared_sessions:
+            for windows in list(self._session_windows.values()):
+                # this window starts new sessions, the other windows keep using these until they let go of them
+                self._shared_sessions.remove(windows)
         self.end_sessions()
 
     def end_sessions(self) -> None:
+        for config_name in list(self._starting):
+            self._leave_session(config_name)
+        self._starting.clear()
+        with self._ready_lock:
+            self._ready_callbacks.clear()
         self._documents.reset()
         for config_name in list(self._sessions):
             self.end_session(config_name)
@@ -415,7 +744,16 @@ class WindowManager(object):
     def end_session(self, config_name: str) -> None:
         if config_name in self._sessions:
             log(2, "unloading session", config_name)
-            self._sessions[config_name].end()
+            windows = self._session_windows.get(config_name)
+            if windows and len(windows.managers) > 1:
+                # other windows keep using it
+                self._leave_session(config_name)
+                self._handle_session_ended(config_name)
+            else:
+                if windows and self._shared_sessions:
+                    self._shared_sessions.remove(windows)
+                self._sessions[config_name].end()
+            self._sessions_changed()
 
     def _end_old_sessions(self):
         current_project_path = get_project_path(self._window)
@@ -435,15 +773,19 @@ class WindowManager(object):
         # reconstruct/get the actual Client object back. Maybe we can (ab)use our homebrew event system for this?
         client.send_response(Response(request_id, {"applied": True}))
 
-    def _handle_session_started(self, session, project_path, config):
+    def _handle_session_started(self, session, project_path, config, windows: SessionWindows):
+        if not windows.managers:
+            return  # ended while it started
+        # windows joining from now on set up the session themselves
+        windows.session = session
         client = session.client
-        client.set_crash_handler(lambda: self._handle_server_crash(config))
-        client.set_error_display_handler(lambda msg: self._window.status_message(msg))
+        client.set_crash_handler(lambda: self._handle_server_crash(config, windows))
+        client.set_error_display_handler(lambda msg: windows.primary()._window.status_message(msg))
 
         # handle server requests and notifications
         client.on_request(
             "workspace/applyEdit",
-            lambda params, request_id: self._apply_workspace_edit(params, client, request_id))
+            lambda params, request_id: windows.primary()._apply_workspace_edit(params, client, request_id))
 
         client.on_request(
             "window/showMessageRequest",
@@ -451,7 +793,7 @@ class WindowManager(object):
 
         client.on_notification(
             "textDocument/publishDiagnostics",
-            lambda params: self._diagnostics.update(self._window, config.name, params))
+            lambda params: self._handle_diagnostics(windows, config.name, params))
 
         client.on_notification(
             "window/showMessage",
@@ -461,21 +803,35 @@ class WindowManager(object):
 
         client.send_notification(Notification.initialized())
 
-        document_sync = session.capabilities.get("textDocumentSync")
-        if document_sync:
-            self._documents.add_session(session)
-
-        global_events.subscribe('view.on_close', lambda view: self._handle_view_closed(view, session))
-
         if config.settings:
             configParams = {
                 'settings': config.settings
             }
             client.send_notification(Notification.didChangeConfiguration(configParams))
 
+        for manager in list(windows.managers):
+            manager._handle_session_ready(session, config)
+
+    def _handle_session_ready(self, session: Session, config: ClientConfig) -> None:
+        if self._sessions.get(config.name) is not session and config.name not in self._starting:
+            return  # ended while it started
+        document_sync = session.capabilities.get("textDocumentSync")
+        if document_sync:
+            self._documents.add_session(session)
+
+        global_events.subscribe('view.on_close', lambda view: self._handle_view_closed(view, session))
+
         self._window.status_message("{} initialized".format(config.name))
+        self._sessions_changed()
+        if self._sessions.get(config.name) is session:
+            self._notify_ready(session)
+
+    def _handle_diagnostics(self, windows: SessionWindows, config_name: str, params: dict) -> None:
+        for manager in list(windows.managers):
+            manager._diagnostics.update(manager._window, config_name, params)
 
     def _handle_view_closed(self, view, session):
+        self._view_capabilities.pop(view.id(), None)
         self._diagnostics.remove(view, session.config.name)
         if not self._is_closing:
             if not self._window.is_valid():
@@ -507,9 +863,19 @@ class WindowManager(object):
             if self._on_closed:
                 self._on_closed()
 
+    def _handle_shared_session_ended(self, config_name: str, windows: SessionWindows) -> None:
+        if self._shared_sessions:
+            self._shared_sessions.remove(windows)
+        for manager in list(windows.managers):
+            manager._handle_session_ended(config_name)
+
     def _handle_session_ended(self, config_name):
+        if config_name not in self._sessions:
+            return  # ended before it was added
+        self._leave_session(config_name)
         self._documents.remove_session(config_name)
         del self._sessions[config_name]
+        self._sessions_changed()
         for view in self._window.views():
             if view.file_name():
                 self._diagnostics.remove(view, config_name)
@@ -518,17 +884,22 @@ class WindowManager(object):
         if not self._sessions:
             self._handle_all_sessions_ended()
 
-    def _handle_server_crash(self, config: ClientConfig):
+    def _handle_server_crash(self, config: ClientConfig, windows: 'Optional[SessionWindows]'=None):
         msg = "Language server {} has crashed, do you want to restart it?".format(config.name)
         result = self._sublime.ok_cancel_dialog(msg, ok_title="Restart")
         if result == self._sublime.DIALOG_YES:
-            self.restart_sessions()
+            # the first window starts a new session, the others join it
+            for manager in list(windows.managers) if windows else [self]:
+                manager.restart_sessions()
 
 
 class WindowRegistry(object):
     def __init__(self, configs: GlobalConfigs, documents: 'Any', diagnostics: DiagnosticsHandler,
-                 session_starter: 'Callable', sublime: 'Any', handler_dispatcher) -> None:
+                 session_starter: 'Callable', sublime: 'Any', handler_dispatcher,
+                 start_pool: 'Optional[Any]'=None, shared_sessions: 'Optional[SharedSessions]'=None) -> None:
         self._windows = {}  # type: Dict[int, WindowManager]
+        self._start_pool = start_pool
+        self._shared_sessions = shared_sessions
         self._configs = configs
         self._diagnostics = diagnostics
         self._documents = documents
@@ -542,7 +913,8 @@ class WindowRegistry(object):
             window_configs = self._configs.for_window(window)
             window_documents = self._documents.for_window(window, window_configs)
             state = WindowManager(window, window_configs, window_documents, self._diagnostics, self._session_starter,
-                                  self._sublime, self._handler_dispatcher, lambda: self._on_closed(window))
+                                  self._sublime, self._handler_dispatcher, lambda: self._on_closed(window),
+                                  self._start_pool, self._shared_sessions)
             self._windows[window.id()] = state
         return state
 
@@ -1,24 +1,28 @@
 import html
 import os
+import threading
+from collections import OrderedDict
 import sublime
 import sublime_plugin
 
 from debug_tools import getLogger
 
 try:
-    from typing import Any, List, Dict, Tuple, Callable, Optional
-    assert Any and List and Dict and Tuple and Callable and Optional
+    from typing import Any, List, Dict, Tuple, Callable, Optional, Set
+    assert Any and List and Dict and Tuple and Callable and Optional and Set
 except ImportError:
     pass
 
 from .core.configurations import is_supported_syntax
-from .core.diagnostics import DiagnosticsUpdate, get_window_diagnostics, get_line_diagnostics
+from .core.diagnostics import (DiagnosticsUpdate, FileDiagnostics, get_window_diagnostics, get_line_diagnostics,
+                               get_file_diagnostics, get_window_severity_count)
+from .core.cursor import on_cursor_moved
 from .core.events import global_events
 
 from .core.panels import ensure_panel
 from .core.protocol import Diagnostic, DiagnosticSeverity
 from .core.settings import settings, PLUGIN_NAME
-from .core.views import range_to_region
+from .core.views import ranges_to_regions
 from .core.workspace import get_project_path
 
 log = getLogger(1, __name__)
@@ -98,8 +102,7 @@ def on_phantom_navigate(view: sublime.View, href: str, point: int):
     view.run_command("lsp_code_actions")
 
 
-def create_phantom(view: sublime.View, diagnostic: Diagnostic) -> sublime.Phantom:
-    region = range_to_region(diagnostic.range, view)
+def create_phantom(view: sublime.View, diagnostic: Diagnostic, region: sublime.Region) -> sublime.Phantom:
     # TODO: hook up hide phantom (if keeping them)
     content = create_phantom_html(diagnostic.message)
     return sublime.Phantom(
@@ -125,18 +128,36 @@ def format_diagnostic(diagnostic: Diagnostic) -> str:
     return formatted
 
 
+# rows above and below the visible region that get phantoms, so scrolling a bit doesn't need an update
+PHANTOM_VIEWPORT_MARGIN_ROWS = 50
+# interval at which the visible region of the active view is checked, Sublime has no event for scrolling
+PHANTOM_VIEWPORT_POLL_MS = 250
+
 phantom_sets_by_buffer = {}  # type: Dict[int, sublime.PhantomSet]
+# the rows with phantoms, for views only showing phantoms around the visible region
+phantom_rows_by_buffer = {}  # type: Dict[int, Tuple[int, int]]
+
+
+def visible_rows(view: sublime.View) -> 'Tuple[int, int]':
+    visible = view.visible_region()
+    return view.rowcol(visible.begin())[0], view.rowcol(visible.end())[0]
 
 
-def update_diagnostics_phantoms(view: sublime.View, diagnostics: 'List[Diagnostic]'):
+def update_diagnostics_phantoms(view: sublime.View, file_diagnostics: 'Optional[FileDiagnostics]'):
     global phantom_sets_by_buffer
 
     buffer_id = view.buffer_id()
-    if not settings.show_diagnostics_phantoms or view.is_dirty():
+    if not settings.show_diagnostics_phantoms or view.is_dirty() or not file_diagnostics:
+        phantom_rows_by_buffer.pop(buffer_id, None)
         phantoms = None
+    elif settings.diagnostics_phantoms_in_viewport:
+        first, last = visible_rows(view)
+        rows = (max(0, first - PHANTOM_VIEWPORT_MARGIN_ROWS), last + PHANTOM_VIEWPORT_MARGIN_ROWS)
+        phantom_rows_by_buffer[buffer_id] = rows
+        phantoms = create_phantoms(view, file_diagnostics.in_rows(*rows))
     else:
-        phantoms = list(
-            create_phantom(view, diagnostic) for diagnostic in diagnostics)
+        phantom_rows_by_buffer.pop(buffer_id, None)
+        phantoms = create_phantoms(view, file_diagnostics.all())
     if phantoms:
         phantom_set = phantom_sets_by_buffer.get(buffer_id)
         if not phantom_set:
@@ -147,50 +168,54 @@ def update_diagnostics_phantoms(view: sublime.View, diagnostics: 'List[Diagnosti
         phantom_sets_by_buffer.pop(buffer_id, None)
 
 
-def update_diagnostics_regions(view: sublime.View, diagnostics: 'List[Diagnostic]', severity: int):
-    region_name = "lsp_" + format_severity(severity)
-    if settings.show_diagnostics_phantoms and not view.is_dirty():
-        regions = None
-    else:
-        regions = list(range_to_region(diagnostic.range, view) for diagnostic in diagnostics
-                       if diagnostic.severity == severity)
-    if regions:
-        scope_name = diagnostic_severity_scopes[severity]
-        view.add_regions(
-            region_name, regions, scope_name, settings.diagnostics_gutter_marker,
-            UNDERLINE_FLAGS if settings.diagnostics_highlight_style == "underline" else BOX_FLAGS)
-    else:
-        view.erase_regions(region_name)
+def create_phantoms(view: sublime.View, diagnostics: 'List[Diagnostic]') -> 'List[sublime.Phantom]':
+    regions = ranges_to_regions((diagnostic.range for diagnostic in diagnostics), view)
+    return [create_phantom(view, diagnostic, region) for diagnostic, region in zip(diagnostics, regions)]
 
 
-def update_diagnostics_in_view(view: sublime.View, diagnostics: 'List[Diagnostic]'):
+def update_phantoms_in_viewport(view: sublime.View):
+    """Updates the phantoms of a view once the visible region gets near the end of the rows with phantoms"""
+    rows = phantom_rows_by_buffer.get(view.buffer_id())
+    if rows is None:
+        return
+    first, last = visible_rows(view)
+    if first < rows[0] or last > rows[1]:
+        update_diagnostics_phantoms(view, get_file_diagnostics(view))
+
+
+def update_diagnostics_regions(view: sublime.View, diagnostics: 'List[Diagnostic]'):
+    # the regions of all shown severities, grouped in a single pass over the diagnostics
+    regions_by_severity = dict(
+        (severity, []) for severity in range(
+            DiagnosticSeverity.Error,
+            DiagnosticSeverity.Error + settings.show_diagnostics_severity_level)
+    )  # type: Dict[int, List[sublime.Region]]
+    if not settings.show_diagnostics_phantoms or view.is_dirty():
+        shown = [diagnostic for diagnostic in diagnostics if diagnostic.severity in regions_by_severity]
+        for diagnostic, region in zip(shown, ranges_to_regions((diagnostic.range for diagnostic in shown), view)):
+            regions_by_severity[diagnostic.severity].append(region)
+    flags = UNDERLINE_FLAGS if settings.diagnostics_highlight_style == "underline" else BOX_FLAGS
+    for severity, regions in regions_by_severity.items():
+        region_name = "lsp_" + format_severity(severity)
+        if regions:
+            view.add_regions(region_name, regions, diagnostic_severity_scopes[severity],
+                             settings.diagnostics_gutter_marker, flags)
+        else:
+            view.erase_regions(region_name)
+
+
+def update_diagnostics_in_view(view: sublime.View):
     if view and view.is_valid():
-        update_diagnostics_phantoms(view, diagnostics)
-        for severity in range(
-                DiagnosticSeverity.Error,
-                DiagnosticSeverity.Error + settings.show_diagnostics_severity_level):
-            update_diagnostics_regions(view, diagnostics, severity)
+        file_diagnostics = get_file_diagnostics(view)
+        update_diagnostics_phantoms(view, file_diagnostics)
+        update_diagnostics_regions(view, file_diagnostics.all() if file_diagnostics else [])
 
 
 def update_diagnostics_in_status_bar(view: sublime.View):
-    errors = 0
-    warnings = 0
-
     window = view.window()
     if window:
-        diagnostics_by_file = get_window_diagnostics(window)
-
-        if diagnostics_by_file:
-            for file_path, source_diagnostics in diagnostics_by_file.items():
-
-                if source_diagnostics:
-                    for origin, diagnostics in source_diagnostics.items():
-                        for diagnostic in diagnostics:
-
-                            if diagnostic.severity == DiagnosticSeverity.Error:
-                                errors += 1
-                            if diagnostic.severity == DiagnosticSeverity.Warning:
-                                warnings += 1
+        errors = get_window_severity_count(window, DiagnosticSeverity.Error)
+        warnings = get_window_severity_count(window, DiagnosticSeverity.Warning)
 
         if errors > 0 or warnings > 0:
             count = 'E: {} W: {}'.format(errors, warnings)
@@ -213,39 +238,54 @@ def handle_diagnostics(update: DiagnosticsUpdate):
     window = update.window
     view = window.find_open_file(update.file_path)
     if view:
-        update_diagnostics_in_view(view, update.diagnostics)
+        update_diagnostics_in_view(view)
         if settings.show_diagnostics_count_in_view_status:
             update_diagnostics_in_status_bar(view)
-    update_diagnostics_panel(window)
+    update_diagnostics_panel(window, update.file_path)
 
 
-class DiagnosticsCursorListener(sublime_plugin.ViewEventListener):
+# the views showing the message of a diagnostic in the status bar
+views_with_diagnostics_status = set()  # type: Set[int]
+
+
+@on_cursor_moved
+def show_diagnostics_status(view: sublime.View, point: int) -> None:
+    if not settings.show_diagnostics_in_view_status:
+        return
+    line_diagnostics = get_line_diagnostics(view, point)
+    if line_diagnostics:
+        views_with_diagnostics_status.add(view.id())
+        view.set_status('lsp_diagnostics', line_diagnostics[0].message)
+    elif view.id() in views_with_diagnostics_status:
+        views_with_diagnostics_status.discard(view.id())
+        view.erase_status('lsp_diagnostics')
+
+
+class DiagnosticsPhantomListener(sublime_plugin.ViewEventListener):
+    """Updates the phantoms while the view scrolls, when only those around the visible region are shown"""
+
     def __init__(self, view):
         self.view = view
-        self.has_status = False
+        self.polling = 0
 
     @classmethod
     def is_applicable(cls, view_settings):
         syntax = view_settings.get('syntax')
-        return settings.show_diagnostics_in_view_status and syntax and is_supported_syntax(syntax)
+        return (settings.show_diagnostics_phantoms and settings.diagnostics_phantoms_in_viewport and
+                syntax and is_supported_syntax(syntax))
 
-    def on_selection_modified_async(self):
-        selections = self.view.sel()
-        if len(selections) > 0:
-            pos = selections[0].begin()
-            line_diagnostics = get_line_diagnostics(self.view, pos)
-            if len(line_diagnostics) > 0:
-                self.show_diagnostics_status(line_diagnostics)
-            elif self.has_status:
-                self.clear_diagnostics_status()
+    def on_activated_async(self):
+        self.polling += 1
+        self.poll_viewport(self.polling)
 
-    def show_diagnostics_status(self, line_diagnostics):
-        self.has_status = True
-        self.view.set_status('lsp_diagnostics', line_diagnostics[0].message)
+    def on_deactivated_async(self):
+        self.polling += 1
 
-    def clear_diagnostics_status(self):
-        self.view.erase_status('lsp_diagnostics')
-        self.has_status = False
+    def poll_viewport(self, polling: int):
+        if polling != self.polling or not self.view.is_valid():
+            return
+        update_phantoms_in_viewport(self.view)
+        sublime.set_timeout_async(lambda: self.poll_viewport(polling), PHANTOM_VIEWPORT_POLL_MS)
 
 
 class LspShowDiagnosticsPanelCommand(sublime_plugin.WindowCommand):
@@ -265,68 +305,140 @@ def ensure_diagnostics_panel(window: sublime.Window) -> 'Optional[sublime.View]'
                         "Packages/" + PLUGIN_NAME + "/Syntaxes/Diagnostics.sublime-syntax")
 
 
-def update_diagnostics_panel(window: sublime.Window):
-    assert window, "missing window!"
+# delay before the panel is updated, to handle the diagnostics of many files published in a row at once
+PANEL_UPDATE_DELAY_MS = 100
+
+
+class DiagnosticsPanelContent(object):
+    """
+    The text of a window's diagnostics panel, as a block per file in the order the files got diagnostics,
+    so an update only formats the files that changed and replaces their part of the panel.
+    """
 
+    def __init__(self) -> None:
+        self.blocks = OrderedDict()  # type: OrderedDict[str, str]
+        self.relevant = set()  # type: Set[str]
+        self.size = 0
+        self._changed = set()  # type: Set[str]
+        self._lock = threading.Lock()
+
+    def mark_changed(self, file_path: str) -> bool:
+        """Returns True if an update has to be scheduled"""
+        with self._lock:
+            schedule = not self._changed
+            self._changed.add(file_path)
+            return schedule
+
+    def take_changed(self) -> 'Set[str]':
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+            return changed
+
+    def offset(self, file_path: str) -> int:
+        offset = 0
+        for path, block in self.blocks.items():
+            if path == file_path:
+                break
+            offset += len(block)
+        return offset
+
+    def text(self) -> str:
+        return "".join(self.blocks.values())
+
+
+panel_contents = {}  # type: Dict[int, DiagnosticsPanelContent]
+
+
+def update_diagnostics_panel(window: sublime.Window, file_path: 'Optional[str]' = None):
+    """Schedules an update of the file's part of the panel, or of all files"""
+    content = panel_contents.setdefault(window.id(), DiagnosticsPanelContent())
+    diagnostics_by_file = get_window_diagnostics(window) or dict()
+    file_paths = [file_path] if file_path else list(set(content.blocks) | set(diagnostics_by_file))
+    schedule = False
+    for path in file_paths:
+        schedule = content.mark_changed(path) or schedule
+    if schedule:
+        sublime.set_timeout_async(lambda: render_diagnostics_panel(window, content), PANEL_UPDATE_DELAY_MS)
+
+
+def format_file_block(file_path: str, base_dir: 'Optional[str]',
+                      file_diagnostics: 'Optional[FileDiagnostics]') -> 'Optional[str]':
+    if not file_diagnostics:
+        return None
+    try:
+        relative_file_path = os.path.relpath(file_path, base_dir) if base_dir else file_path
+    except ValueError:
+        relative_file_path = file_path
+    formatted = format_diagnostics(relative_file_path, file_diagnostics.by_source)
+    return formatted + "\n" if formatted else None
+
+
+def render_diagnostics_panel(window: sublime.Window, content: DiagnosticsPanelContent):
+    changed = content.take_changed()
     if not window.is_valid():
         log(2, 'ignoring update to closed window')
         return
 
     base_dir = get_project_path(window)
-
     diagnostics_by_file = get_window_diagnostics(window)
-    if diagnostics_by_file is not None:
+    if diagnostics_by_file is None:
+        return
 
-        active_panel = window.active_panel()
-        is_active_panel = (active_panel == "output.diagnostics")
+    active_panel = window.active_panel()
+    is_active_panel = (active_panel == "output.diagnostics")
+
+    panel = window.find_output_panel("diagnostics")
+    # the panel is rendered in full when it was (re)created or changed by somebody else
+    in_sync = panel is not None and panel.size() == content.size
+    updates = []  # type: List[Tuple[int, int, str]]
+    for file_path in changed:
+        file_diagnostics = diagnostics_by_file.get(file_path)
+        block = format_file_block(file_path, base_dir, file_diagnostics)
+        old_block = content.blocks.get(file_path)
+        if block == old_block:
+            continue
+        offset = content.offset(file_path)
+        old_size = len(old_block) if old_block else 0
+        if block:
+            content.blocks[file_path] = block
+        else:
+            content.blocks.pop(file_path, None)
+        content.size += len(block or "") - old_size
+        if file_diagnostics and has_relevant_diagnostics(file_diagnostics):
+            content.relevant.add(file_path)
+        else:
+            content.relevant.discard(file_path)
+        updates.append((offset, offset + old_size, block or ""))
 
-        if diagnostics_by_file:
+    if content.blocks:
+        if not panel:
             panel = ensure_diagnostics_panel(window)
             assert panel, "must have a panel now!"
-            panel.settings().set("result_base_dir", base_dir)
-
-            auto_open_panel = False
-            to_render = []
-            for file_path, source_diagnostics in diagnostics_by_file.items():
-                # print( "base_dir: " + base_dir )
-                # print( "file_path: " + file_path )
-                try:
-                    relative_file_path = os.path.relpath(file_path, base_dir) if base_dir else file_path
-                except ValueError:
-                    relative_file_path = file_path
-                if source_diagnostics:
-                    formatted = format_diagnostics(relative_file_path, source_diagnostics)
-                    if formatted:
-                        to_render.append(formatted)
-                        if not auto_open_panel:
-                            auto_open_panel = has_relevant_diagnostics(source_diagnostics)
-
-            panel.set_read_only(False)
-            panel.run_command("lsp_update_panel", {"characters": "\n".join(to_render)})
-            panel.set_read_only(True)
-
-            if settings.auto_show_diagnostics_panel and not active_panel:
-                if auto_open_panel:
-                    window.run_command("show_panel",
-                                       {"panel": "output.diagnostics"})
-
+        panel.settings().set("result_base_dir", base_dir)
+        panel.set_read_only(False)
+        if in_sync:
+            for begin, end, characters in updates:
+                panel.run_command("lsp_update_panel", {"characters": characters, "begin": begin, "end": end})
         else:
-            panel = window.find_output_panel("diagnostics")
-            if panel:
-                panel.run_command("lsp_clear_panel")
-                if is_active_panel:
-                    window.run_command("hide_panel",
-                                       {"panel": "output.diagnostics"})
+            panel.run_command("lsp_update_panel", {"characters": content.text()})
+        panel.set_read_only(True)
 
+        if settings.auto_show_diagnostics_panel and not active_panel:
+            if content.relevant:
+                window.run_command("show_panel",
+                                   {"panel": "output.diagnostics"})
+
+    elif panel:
+        panel.run_command("lsp_clear_panel")
+        if is_active_panel:
+            window.run_command("hide_panel",
+                               {"panel": "output.diagnostics"})
 
-def has_relevant_diagnostics(origin_diagnostics):
-    for origin, diagnostics in origin_diagnostics.items():
-        for diagnostic in diagnostics:
-            log(2, 'severity check', diagnostic.severity, '<=', settings.auto_show_diagnostics_panel_level)
-            if diagnostic.severity <= settings.auto_show_diagnostics_panel_level:
-                return True
 
-    return False
+def has_relevant_diagnostics(file_diagnostics: FileDiagnostics) -> bool:
+    return any(file_diagnostics.count(severity)
+               for severity in range(DiagnosticSeverity.Error, settings.auto_show_diagnostics_panel_level + 1))
 
 
 def format_diagnostics(file_path, origin_diagnostics):
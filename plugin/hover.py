@@ -13,8 +13,10 @@ from .core.configurations import is_supported_syntax
 from .core.diagnostics import get_point_diagnostics
 from .core.registry import session_for_view, LspTextCommand
 from .core.protocol import Request, DiagnosticSeverity
+from .core.rpc import RequestHandle
 from .core.documents import get_document_position
 from .core.popups import popup_css, popup_class
+assert RequestHandle
 
 SUBLIME_WORD_MASK = 515
 NO_HOVER_SCOPES = 'comment, string'
@@ -49,6 +51,7 @@ class_for_severity = {
 class LspHoverCommand(LspTextCommand):
     def __init__(self, view):
         super().__init__(view)
+        self._request = None  # type: Optional[RequestHandle]
 
     def is_likely_at_symbol(self, point):
         word_at_sel = self.view.classify(point)
@@ -70,11 +73,15 @@ class LspHoverCommand(LspTextCommand):
                 document_position = get_document_position(self.view, point)
                 if document_position:
                     if session.client:
-                        session.client.send_request(
+                        # a hover at another point supersedes the pending one.
+                        if self._request:
+                            self._request.cancel()
+                        self._request = session.client.send_request(
                             Request.hover(document_position),
                             lambda response: self.handle_response(response, point))
 
     def handle_response(self, response: 'Optional[Any]', point) -> None:
+        self._request = None
         all_content = ""
 
         point_diagnostics = get_point_diagnostics(self.view, point)
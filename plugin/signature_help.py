@@ -18,8 +18,10 @@ from .core.registry import config_for_scope, session_for_view, client_for_view
 from .core.documents import get_document_position
 from .core.events import global_events
 from .core.protocol import Request
+from .core.rpc import RequestHandle
 from .core.popups import popup_css, popup_class
 from .core.settings import settings
+assert RequestHandle
 
 log = getLogger(1, __name__)
 
@@ -34,6 +36,7 @@ class SignatureHelpListener(sublime_plugin.ViewEventListener):
         self._signatures = []  # type: List[Any]
         self._active_signature = -1
         self._active_parameter = -1
+        self._request = None  # type: Optional[RequestHandle]
 
     @classmethod
     def is_applicable(cls, settings):
@@ -81,11 +84,14 @@ class SignatureHelpListener(sublime_plugin.ViewEventListener):
             global_events.publish("view.on_purge_changes", self.view)
             document_position = get_document_position(self.view, point)
             if document_position:
-                client.send_request(
+                if self._request:
+                    self._request.cancel()
+                self._request = client.send_request(
                     Request.signatureHelp(document_position),
                     lambda response: self.handle_response(response, point))
 
     def handle_response(self, response: 'Optional[Dict]', point) -> None:
+        self._request = None
         if response is not None:
             self._signatures = response.get("signatures", [])
             self._active_signature = response.get("activeSignature", -1)
@@ -0,0 +1,63 @@
+import sublime_plugin
+
+try:
+    from typing import Any, List, Dict
+    assert Any and List and Dict
+except ImportError:
+    pass
+
+from .core.panels import create_output_panel
+from .core.registry import windows
+from .core.sessions import Session
+
+assert Session
+
+STATS_PANEL = "lsp_stats"
+
+COLUMNS = ("sent", "received", "sent_bytes", "received_bytes", "errors", "cancelled", "timed_out")
+LATENCY_COLUMNS = ("p50", "p95", "p99", "max")
+
+
+def format_session_stats(session: 'Session') -> str:
+    client = session.client
+    lines = [session.config.name]
+    if not client:
+        lines.append("  not running")
+        return "\n".join(lines)
+
+    lines.append("  outstanding requests: {}".format(session.outstanding_requests()))
+    for key, value in sorted(client.dispatch_stats().items()):
+        lines.append("  {}: {}".format(key, value))
+
+    methods = client.stats.snapshot()
+    if methods:
+        width = max(len(method) for method in methods)
+        header = "  " + "method".ljust(width)
+        header += "".join(column.rjust(15) for column in COLUMNS)
+        header += "".join((column + " ms").rjust(10) for column in LATENCY_COLUMNS)
+        lines.append("")
+        lines.append(header)
+        for method in sorted(methods):
+            stats = methods[method]
+            line = "  " + method.ljust(width)
+            line += "".join(str(stats[column]).rjust(15) for column in COLUMNS)
+            line += "".join("{:.1f}".format(stats[column] * 1000).rjust(10) for column in LATENCY_COLUMNS)
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class LspShowStatsCommand(sublime_plugin.WindowCommand):
+    """Shows message counts, sizes and request latencies of the window's language servers in an output panel"""
+
+    def run(self):
+        sessions = windows.lookup(self.window).get_sessions()
+        if sessions:
+            text = "\n\n".join(format_session_stats(session) for session in sessions)
+        else:
+            text = "No language servers running in this window"
+        panel = create_output_panel(self.window, STATS_PANEL)
+        if not panel:
+            return
+        panel.run_command("lsp_update_panel", {"characters": text + "\n"})
+        panel.set_read_only(True)
+        self.window.run_command("show_panel", {"panel": "output." + STATS_PANEL})
@@ -125,14 +125,14 @@ class CompletionFormattingTests(DeferrableTestCase):
 
     def test_only_label_item(self):
         handler = CompletionHandler(self.view)
-        result = handler.format_completion(create_completion_item("asdf"))
+        result = handler.formatter().format(create_completion_item("asdf"))
         self.assertEqual(len(result), 2)
         self.assertEqual("asdf", result[0])
         self.assertEqual("asdf", result[1])
 
     def test_prefers_insert_text(self):
         handler = CompletionHandler(self.view)
-        result = handler.format_completion(create_completion_item("asdf", "Asdf"))
+        result = handler.formatter().format(create_completion_item("asdf", "Asdf"))
         self.assertEqual(len(result), 2)
         self.assertEqual("Asdf", result[0])
         self.assertEqual("Asdf", result[1])
@@ -153,7 +153,7 @@ class CompletionFormattingTests(DeferrableTestCase):
             }
         }
 
-        result = handler.format_completion(item)
+        result = handler.formatter().format(item)
         self.assertEqual(len(result), 2)
         self.assertEqual("$true", result[0])
         self.assertEqual("\\$true", result[1])
@@ -184,7 +184,7 @@ class CompletionFormattingTests(DeferrableTestCase):
         handler = CompletionHandler(self.view)
         handler.last_location = 1
         handler.last_prefix = ""
-        result = handler.format_completion(item)
+        result = handler.formatter().format(item)
         self.assertEqual(len(result), 2)
         self.assertEqual("$what", result[0])
         self.assertEqual("\\$what", result[1])